@@ -0,0 +1,116 @@
+"""
+Catalog and favorites throughput with many concurrent clients: gunicorn
+sync workers (wsgi.py) against a single uvicorn process (asgi.py).
+
+Clients are plain asyncio sockets speaking HTTP/1.1 (keep-alive where the
+server allows it), so the load generator itself is not the bottleneck:
+
+    $ python bench/bench_asgi.py --clients 1000 --requests 10
+"""
+import argparse
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+from common import ROOT, SRC, load_app, percentile, seed_catalog
+
+
+async def client(host, port, paths, timings, errors):
+    writer = None
+    try:
+        for path in paths:
+            start = time.perf_counter()
+            if writer is None:
+                reader, writer = await asyncio.open_connection(host, port)
+            writer.write(("GET %s HTTP/1.1\r\nHost: %s\r\n\r\n" % (path, host)).encode())
+            await writer.drain()
+            status_line = await reader.readline()
+            length, close = 0, False
+            while True:
+                line = await reader.readline()
+                if line in (b"\r\n", b""):
+                    break
+                name, _, value = line.decode().partition(":")
+                if name.lower() == "content-length":
+                    length = int(value)
+                elif name.lower() == "connection" and value.strip().lower() == "close":
+                    close = True
+            await reader.readexactly(length)
+            if b" 200 " not in status_line:
+                errors.append(status_line.decode().strip() or "empty response")
+                continue
+            timings.append(time.perf_counter() - start)
+            if close:
+                # gunicorn sync workers do not keep connections alive
+                writer.close()
+                writer = None
+    except (OSError, asyncio.IncompleteReadError) as error:
+        errors.append(type(error).__name__)
+    finally:
+        if writer is not None:
+            writer.close()
+
+
+async def drive(port, clients, requests):
+    paths = ["/people?limit=20", "/planets/1", "/vehicles?limit=20"]
+    timings, errors = [], []
+    start = time.perf_counter()
+    await asyncio.gather(*[
+        client("127.0.0.1", port, [paths[(i + n) % len(paths)] for n in range(requests)], timings, errors)
+        for i in range(clients)
+    ])
+    elapsed = time.perf_counter() - start
+    timings.sort()
+    return {"requests": len(timings), "errors": len(errors), "seconds": round(elapsed, 2),
+            "req_per_sec": round(len(timings) / elapsed), "p50_ms": round(percentile(timings, 50) * 1000, 1),
+            "p99_ms": round(percentile(timings, 99) * 1000, 1)}
+
+
+def wait_for(port):
+    import socket
+    for _ in range(100):
+        try:
+            socket.create_connection(("127.0.0.1", port), timeout=1).close()
+            return
+        except OSError:
+            time.sleep(0.1)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--clients", type=int, default=1000)
+    parser.add_argument("--requests", type=int, default=10, help="requests per client")
+    parser.add_argument("--workers", type=int, default=4, help="gunicorn sync workers")
+    parser.add_argument("--port", type=int, default=3102)
+    args = parser.parse_args()
+
+    db_path = os.path.join(tempfile.mkdtemp(prefix="swapi-bench-"), "bench.db")
+    app = load_app(db_path)
+    with app.app_context():
+        seed_catalog(people=1000, planets=1000, vehicles=1000)
+
+    env = dict(os.environ, DATABASE_URL="sqlite:///" + db_path, RESPONSE_CACHE_TTL="0")
+    servers = {
+        "wsgi": [sys.executable, "-m", "gunicorn", "wsgi", "--chdir", SRC, "-w", str(args.workers),
+                 "-b", "127.0.0.1:%d" % args.port, "--backlog", "2048", "--log-level", "warning"],
+        "asgi": [sys.executable, "-m", "uvicorn", "asgi:application", "--app-dir", SRC, "--port", str(args.port),
+                 "--backlog", "2048", "--log-level", "warning"],
+    }
+    results = {}
+    for mode, command in servers.items():
+        server = subprocess.Popen(command, cwd=ROOT, env=env)
+        try:
+            wait_for(args.port)
+            results[mode] = asyncio.run(drive(args.port, args.clients, args.requests))
+        finally:
+            server.terminate()
+            server.wait()
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,40 @@
+"""
+Rows per second loading People through POST /people (one request and one
+commit per row) versus POST /people/bulk (chunked executemany):
+
+    $ python bench/bench_bulk.py --single 2000 --bulk 50000
+"""
+import argparse
+import json
+import time
+
+from common import load_app, people_row
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--single", type=int, default=2000, help="rows sent to the single-row endpoint")
+    parser.add_argument("--bulk", type=int, default=50000, help="rows sent to the bulk endpoint")
+    args = parser.parse_args()
+
+    client = load_app().test_client()
+
+    start = time.perf_counter()
+    for i in range(args.single):
+        client.post("/people", json=people_row(i))
+    single = time.perf_counter() - start
+
+    rows = [people_row(i) for i in range(args.bulk)]
+    start = time.perf_counter()
+    response = client.post("/people/bulk", json=rows)
+    bulk = time.perf_counter() - start
+    assert response.status_code == 201, response.get_data(as_text=True)
+
+    print(json.dumps({
+        "single": {"rows": args.single, "seconds": round(single, 3), "rows_per_sec": round(args.single / single)},
+        "bulk": {"rows": args.bulk, "seconds": round(bulk, 3), "rows_per_sec": round(args.bulk / bulk)},
+    }, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,69 @@
+"""
+Bytes on the wire and CPU per request for each Accept-Encoding:
+
+    $ python bench/bench_compression.py --rows 20000 --requests 50
+
+For every route the same request is sent without compression, with gzip
+and with br. Each is timed three ways: as a cache miss (a different query
+string on every request), as a cache hit (the compressed variant is built
+once and reused), and for /people?format=ndjson as a streamed export. CPU
+is process time, so it includes the encoding work done inside the app.
+"""
+import argparse
+import json
+import time
+
+from common import load_app, seed_catalog
+
+ROUTES = ["/people?limit=100", "/people?limit=1000", "/planets?limit=1000", "/vehicles?limit=1000"]
+ENCODINGS = ["identity", "gzip", "br"]
+
+
+def measure(client, urls, encoding):
+    sizes = 0
+    start = time.process_time()
+    for url in urls:
+        response = client.get(url, headers={"Accept-Encoding": encoding}, buffered=False)
+        sizes += sum(len(chunk) for chunk in response.response)
+        response.close()
+    cpu = time.process_time() - start
+    return {"bytes": sizes // len(urls), "cpu_ms": round(cpu * 1000 / len(urls), 3)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=20000, help="rows per model")
+    parser.add_argument("--requests", type=int, default=50, help="requests per measurement")
+    args = parser.parse_args()
+
+    app = load_app()
+    with app.app_context():
+        seed_catalog(people=args.rows, planets=args.rows, vehicles=args.rows)
+    client = app.test_client()
+
+    results = []
+    for route in ROUTES:
+        for encoding in ENCODINGS:
+            # unknown query arguments are ignored by the views but change the cache key
+            misses = ["%s&bench=%s-%d" % (route, encoding, i) for i in range(args.requests)]
+            client.get(route, headers={"Accept-Encoding": encoding})
+            results.append({
+                "route": route,
+                "encoding": encoding,
+                "miss": measure(client, misses, encoding),
+                "hit": measure(client, [route] * args.requests, encoding),
+            })
+
+    exports = max(1, args.requests // 10)
+    for encoding in ENCODINGS:
+        results.append({
+            "route": "/people?format=ndjson",
+            "encoding": encoding,
+            "stream": measure(client, ["/people?format=ndjson"] * exports, encoding),
+        })
+
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
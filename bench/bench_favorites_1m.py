@@ -0,0 +1,107 @@
+"""
+Favorite lookups on a large favorite_people table, with and without the
+unique (user_id, people_id) index:
+
+    $ python bench/bench_favorites_1m.py --users 10000 --per-user 100
+
+Times the two queries the favorites endpoints run against the table (a
+user's favorites, and the (user, character) existence check) first on the
+bare table and then after creating the index, and finally POST
+/favorite/people for new and duplicate pairs.
+"""
+import argparse
+import json
+import random
+import time
+
+from common import load_app, seed_catalog, percentile
+
+
+def timed(run, samples):
+    durations = []
+    for args in samples:
+        start = time.perf_counter()
+        run(*args)
+        durations.append((time.perf_counter() - start) * 1000)
+    durations.sort()
+    return {"p50_ms": round(percentile(durations, 50), 3), "p99_ms": round(percentile(durations, 99), 3)}
+
+
+def seed_favorites(users, per_user, people, chunk=50000):
+    from models import db, User, FavoritePeople
+
+    db.session.execute(User.__table__.insert(), [
+        {"name": "user %d" % i, "email": "user%d@bench" % i, "password": "x", "is_active": True}
+        for i in range(users)
+    ])
+    rows = []
+    for user_id in range(1, users + 1):
+        for people_id in random.sample(range(1, people + 1), per_user):
+            rows.append({"user_id": user_id, "people_id": people_id})
+            if len(rows) == chunk:
+                db.session.execute(FavoritePeople.__table__.insert(), rows)
+                rows = []
+    if rows:
+        db.session.execute(FavoritePeople.__table__.insert(), rows)
+    db.session.commit()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=10000)
+    parser.add_argument("--per-user", type=int, default=100, help="favorites per user")
+    parser.add_argument("--people", type=int, default=1000, help="characters in the catalog")
+    parser.add_argument("--samples", type=int, default=200)
+    args = parser.parse_args()
+
+    app = load_app()
+    from models import db, FavoritePeople
+
+    index = next(index for index in FavoritePeople.__table__.indexes if index.unique)
+    results = {"rows": args.users * args.per_user}
+    with app.app_context():
+        # load the table bare, like a database that predates the index
+        index.drop(db.engine)
+        start = time.perf_counter()
+        seed_catalog(people=args.people)
+        seed_favorites(args.users, args.per_user, args.people)
+        results["seed_seconds"] = round(time.perf_counter() - start, 1)
+
+        def by_user(user_id, people_id):
+            db.session.scalars(db.select(FavoritePeople).where(FavoritePeople.user_id == user_id)).all()
+
+        def exists(user_id, people_id):
+            db.session.scalars(db.select(FavoritePeople).filter_by(user_id=user_id, people_id=people_id)).first()
+
+        samples = [(random.randint(1, args.users), random.randint(1, args.people)) for _ in range(args.samples)]
+        for label in ("without_index", "with_index"):
+            if label == "with_index":
+                start = time.perf_counter()
+                index.create(db.engine)
+                results["index_build_seconds"] = round(time.perf_counter() - start, 1)
+            results[label] = {"favorites_by_user": timed(by_user, samples), "exists_check": timed(exists, samples)}
+            db.session.rollback()
+
+    client = app.test_client()
+    added, duplicates = [], []
+    for user_id, _ in samples:
+        for people_id in range(1, args.people + 1):
+            start = time.perf_counter()
+            response = client.post("/favorite/people", json={"user_id": user_id, "people_id": people_id})
+            elapsed = (time.perf_counter() - start) * 1000
+            if response.status_code == 201:
+                added.append(elapsed)
+                break
+            duplicates.append(elapsed)
+    added.sort()
+    duplicates.sort()
+    results["post_favorite"] = {
+        "added": {"count": len(added), "p50_ms": round(percentile(added, 50), 3), "p99_ms": round(percentile(added, 99), 3)},
+        "duplicate": {"count": len(duplicates), "p50_ms": round(percentile(duplicates, 50), 3),
+                      "p99_ms": round(percentile(duplicates, 99), 3)},
+    }
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
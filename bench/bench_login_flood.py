@@ -0,0 +1,112 @@
+"""
+Catalog latency under a login flood.
+
+Starts gunicorn with the threaded workers of gunicorn.conf.py against a
+seeded SQLite database, then runs ``--logins`` threads hammering POST /login
+while ``--readers`` threads time GET /people. Run it once with hashing
+inline and no admission limit (the old behaviour) and once through the
+password pool to compare catalog p99:
+
+    $ python bench/bench_login_flood.py --pool-size 0 --concurrency 1000 --queue-limit 0
+    $ python bench/bench_login_flood.py --pool-size 2 --concurrency 4 --queue-limit 32
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.request
+
+from common import ROOT, SRC, load_app, percentile, seed_catalog
+
+
+def request(url, body=None):
+    data = json.dumps(body).encode() if body is not None else None
+    req = urllib.request.Request(url, data=data, headers={"Content-Type": "application/json"})
+    start = time.perf_counter()
+    try:
+        with urllib.request.urlopen(req, timeout=30) as response:
+            response.read()
+            status = response.status
+    except urllib.error.HTTPError as error:
+        status = error.code
+    return status, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--pool-size", type=int, default=2)
+    parser.add_argument("--concurrency", type=int, default=None, help="PASSWORD_CONCURRENCY (default: --workers)")
+    parser.add_argument("--queue-limit", type=int, default=32)
+    parser.add_argument("--logins", type=int, default=16, help="concurrent login threads")
+    parser.add_argument("--readers", type=int, default=4, help="concurrent catalog threads")
+    parser.add_argument("--seconds", type=float, default=10)
+    parser.add_argument("--port", type=int, default=3101)
+    args = parser.parse_args()
+
+    db_path = os.path.join(tempfile.mkdtemp(prefix="swapi-bench-"), "bench.db")
+    app = load_app(db_path)
+    from models import db, User
+    from passwords import _hash
+    with app.app_context():
+        seed_catalog(people=1000)
+        db.session.add(User(name="flood", email="flood@example.com", password=_hash("secret", 10), is_active=True))
+        db.session.commit()
+
+    env = dict(os.environ, DATABASE_URL="sqlite:///" + db_path, PASSWORD_POOL_SIZE=str(args.pool_size),
+               PASSWORD_CONCURRENCY=str(args.concurrency or args.workers),
+               PASSWORD_QUEUE_LIMIT=str(args.queue_limit), PASSWORD_SLOT_DIR=tempfile.mkdtemp(prefix="swapi-slots-"),
+               RESPONSE_CACHE_TTL="0")
+    server = subprocess.Popen([sys.executable, "-m", "gunicorn", "wsgi", "--chdir", SRC, "-c", "gunicorn.conf.py",
+                               "-w", str(args.workers),
+                               "-b", "127.0.0.1:%d" % args.port, "--log-level", "warning"], cwd=ROOT, env=env)
+    base = "http://127.0.0.1:%d" % args.port
+    try:
+        for _ in range(100):
+            try:
+                request(base + "/people?limit=1")
+                break
+            except OSError:
+                time.sleep(0.1)
+
+        stop = time.time() + args.seconds
+        reads, logins = [], []
+
+        def read_loop():
+            while time.time() < stop:
+                reads.append(request(base + "/people?limit=50"))
+
+        def login_loop():
+            while time.time() < stop:
+                logins.append(request(base + "/login", {"email": "flood@example.com", "password": "secret"}))
+
+        threads = [threading.Thread(target=read_loop) for _ in range(args.readers)]
+        threads += [threading.Thread(target=login_loop) for _ in range(args.logins)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    finally:
+        server.terminate()
+        server.wait()
+
+    read_times = sorted(t for _, t in reads)
+    statuses = {}
+    for status, _ in logins:
+        statuses[str(status)] = statuses.get(str(status), 0) + 1
+    print(json.dumps({
+        "pool_size": args.pool_size,
+        "queue_limit": args.queue_limit,
+        "catalog": {"requests": len(reads), "p50_ms": percentile(read_times, 50) * 1000,
+                    "p99_ms": percentile(read_times, 99) * 1000},
+        "login": {"requests": len(logins), "statuses": statuses},
+    }, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,67 @@
+"""
+Compare the NDJSON streaming export of /people with building the whole
+catalog through jsonify, the way the list handlers used to.
+
+Each mode runs in its own process so peak RSS is measured in isolation:
+
+    $ python bench/bench_ndjson.py --rows 100000
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+
+from common import load_app, peak_rss_mb, seed_catalog
+
+
+def run_mode(mode, rows):
+    app = load_app()
+    from flask import jsonify
+    from models import People
+
+    with app.app_context():
+        seed_catalog(people=rows)
+    baseline_rss = peak_rss_mb()
+
+    client = app.test_client()
+    start = time.perf_counter()
+    if mode == "ndjson":
+        response = client.get("/people?format=ndjson", buffered=False)
+        chunks = iter(response.response)
+        first = next(chunks)
+        ttfb = time.perf_counter() - start
+        size = len(first) + sum(len(chunk) for chunk in chunks)
+        response.close()
+    else:
+        with app.test_request_context("/people"):
+            people = list(map(lambda item: item.serialize(), People.query.all()))
+            body = jsonify({"msg": "ok", "people": people}).get_data()
+        ttfb = time.perf_counter() - start
+        size = len(body)
+    total = time.perf_counter() - start
+
+    return {"mode": mode, "rows": rows, "ttfb_ms": round(ttfb * 1000, 2), "total_ms": round(total * 1000, 2),
+            "bytes": size, "peak_rss_mb": round(peak_rss_mb(), 1), "seed_rss_mb": round(baseline_rss, 1)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=100000)
+    parser.add_argument("--mode", choices=("ndjson", "jsonify"))
+    args = parser.parse_args()
+
+    if args.mode:
+        print(json.dumps(run_mode(args.mode, args.rows)))
+        return
+
+    results = []
+    for mode in ("jsonify", "ndjson"):
+        output = subprocess.check_output([sys.executable, os.path.abspath(__file__), "--mode", mode, "--rows", str(args.rows)])
+        results.append(json.loads(output.decode().strip().splitlines()[-1]))
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
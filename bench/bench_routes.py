@@ -0,0 +1,520 @@
+"""
+Every route of src/app.py under load, reported as JSON that can be diffed
+between commits:
+
+    $ python bench/bench_routes.py --output before.json
+    $ python bench/bench_routes.py --baseline before.json --threshold 0.25
+    $ python bench/bench_routes.py --server gunicorn --workers 4 --concurrency 16
+
+A fresh SQLite file (or --database-url, which must point at an empty
+database) is seeded with --people/--planets/--vehicles catalog rows,
+--users users and --favorites favorite people, planets and vehicles per
+user. Then --requests requests go to each route (--slow-requests for the
+bcrypt ones, login and register) after --warmup untimed ones, either through the Flask test client one
+at a time or through a gunicorn server from --concurrency threads. Rows a
+route deletes and tokens it revokes are created beforehand, outside the
+timing.
+
+Per route the output has throughput, p50/p95/p99 latency, SQL statements
+per request (read from the Server-Timing header, so PROFILING is turned
+on; null for streamed bodies such as ?format=ndjson, whose queries run
+after the header is sent) and a count of each status code. Cached GET
+routes ask for a different page each time so they measure the handler,
+not the response cache. The run also reports the peak RSS of the process,
+or the largest gunicorn worker, that served the requests.
+
+--baseline compares the run with an earlier output. The script exits with
+status 1 when a route's p95 or throughput gets worse by more than
+--threshold (and by at least --min-delta-ms), when a route runs more SQL
+statements or answers 5xx more often than before, or when the peak RSS
+grows by more than --threshold. --compare FILE compares an existing output
+instead of running the benchmark. Latencies only compare between runs on
+the same machine with nothing else loading it.
+"""
+import argparse
+import http.client
+import json
+import os
+import re
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import redirect_stdout
+
+from common import ROOT, SRC, load_app, peak_rss_mb, percentile, seed_catalog, people_row, planet_row, vehicle_row
+
+PASSWORD = "secret"
+BULK_SIZE = 100
+SQL_COUNT = re.compile(r'desc="(\d+) queries"')
+# long-lived responses, a latency percentile says nothing about them
+NOT_BENCHMARKED = {"stream_favorites"}
+
+
+class Context:
+    """Seeded volumes plus helpers the routes use to build their requests."""
+
+    def __init__(self, app, args):
+        self.app = app
+        self.people = args.people
+        self.planets = args.planets
+        self.vehicles = args.vehicles
+        self.users = args.users
+        self.favorites = args.favorites
+        self._tokens = {}
+
+    def pick(self, count, i):
+        return 1 + i % count
+
+    def user(self, i):
+        return self.pick(self.users, i)
+
+    def token(self, user_id):
+        if user_id not in self._tokens:
+            from flask_jwt_extended import create_access_token
+            with self.app.app_context():
+                self._tokens[user_id] = create_access_token(identity=user_id)
+        return self._tokens[user_id]
+
+    def auth(self, user_id):
+        return {"Authorization": "Bearer " + self.token(user_id)}
+
+    def insert(self, model, rows):
+        """Insert ``rows`` outside the timing and return their ids."""
+        from models import db
+        with self.app.app_context():
+            ids = []
+            for row in rows:
+                item = model(**row)
+                db.session.add(item)
+                db.session.flush()
+                ids.append(item.id)
+            db.session.commit()
+        return ids
+
+
+class Route:
+    """One scenario: ``path`` and ``body`` are called with (item, ctx).
+
+    ``item`` is the request number, or the matching element of what
+    ``prepare(ctx, n)`` returned when the route consumes rows.
+    """
+
+    def __init__(self, name, method, path, body=None, headers=None, prepare=None, slow=False):
+        self.name = name
+        self.method = method
+        self.path = path if callable(path) else (lambda item, ctx, path=path: path)
+        self.body = body
+        self.headers = headers
+        self.prepare = prepare
+        self.slow = slow
+
+    def requests(self, ctx, count):
+        items = self.prepare(ctx, count) if self.prepare else range(count)
+        for item in items:
+            yield (self.path(item, ctx), self.body(item, ctx) if self.body else None,
+                   self.headers(item, ctx) if self.headers else {})
+
+
+def catalog_routes(name, model, make_row, detail, with_post, count, filtered):
+    # rows created by the benchmark get numbers far above the seeded ones
+    def rows(n, offset):
+        return [make_row(offset + i) for i in range(n)]
+
+    def bulk_rows(ctx, n):
+        return [rows(BULK_SIZE, 2 * 10 ** 6 + i * BULK_SIZE) for i in range(n)]
+
+    def existing(ctx, n):
+        return ctx.insert(model, rows(n, 10 ** 6))
+
+    def existing_chunks(ctx, n):
+        ids = ctx.insert(model, rows(n * BULK_SIZE, 3 * 10 ** 6))
+        return [ids[i:i + BULK_SIZE] for i in range(0, len(ids), BULK_SIZE)]
+
+    def edited(item, ctx):
+        row = make_row(item)
+        row["id"] = ctx.pick(count(ctx), item)
+        row["name"] += " (edited)"
+        return row
+
+    def page(query=""):
+        # a different page every request, so the list handler runs instead of the response cache
+        def path(i, ctx):
+            span = max(count(ctx) - 100, 1)
+            return "/%s?%slimit=%d&cursor=%d" % (name, query, 100 - (i // span) % 100, i % span)
+        return path
+
+    def bulk_edited(item, ctx):
+        start = (item * BULK_SIZE) % max(count(ctx) - BULK_SIZE, 1)
+        return [dict(make_row(start + i), id=start + i + 1) for i in range(BULK_SIZE)]
+
+    return [
+        Route("GET /%s" % name, "GET", page()),
+        Route("GET /%s?%s" % (name, filtered.split("&")[0]), "GET", page(filtered + "&")),
+        Route("GET /%s?format=ndjson" % name, "GET", "/%s?format=ndjson" % name),
+        Route("GET /%s/<id>" % detail, "GET", lambda i, ctx: "/%s/%d" % (detail, ctx.pick(count(ctx), i))),
+        Route("GET /%s?ids=" % name, "GET", lambda i, ctx: "/%s?ids=%s" % (name, ",".join(
+            str(ctx.pick(count(ctx), i + k * 50)) for k in range(20)))),
+        Route("POST /%s" % with_post, "POST", "/" + with_post, body=lambda i, ctx: {"id": ctx.pick(count(ctx), i)}),
+        Route("POST /%s" % name, "POST", "/" + name, body=lambda i, ctx: make_row(10 ** 7 + i)),
+        Route("PUT /%s" % name, "PUT", "/" + name, body=edited),
+        Route("DELETE /%s" % name, "DELETE", "/" + name, body=lambda id, ctx: {"id": id}, prepare=existing),
+        Route("POST /%s/bulk" % name, "POST", "/%s/bulk" % name, body=lambda rows, ctx: rows, prepare=bulk_rows),
+        Route("PUT /%s/bulk" % name, "PUT", "/%s/bulk" % name, body=bulk_edited),
+        Route("DELETE /%s/bulk" % name, "DELETE", "/%s/bulk" % name, body=lambda ids, ctx: ids, prepare=existing_chunks),
+    ]
+
+
+def favorite_routes(kind, field, count):
+    def add(i, ctx):
+        # seeded favorites use catalog ids 1..favorites for every user, new ones come after
+        return {"user_id": ctx.user(i), field: ctx.favorites + 1 + (i // ctx.users) % (count(ctx) - ctx.favorites)}
+
+    def remove(i, ctx):
+        return {"user_id": ctx.user(i), field: 1 + (i // ctx.users) % max(ctx.favorites, 1)}
+
+    return [
+        Route("POST /favorite/%s" % kind, "POST", "/favorite/" + kind, body=add),
+        Route("DELETE /favorite/%s" % kind, "DELETE", "/favorite/" + kind, body=remove),
+    ]
+
+
+def fresh_users(ctx, n):
+    from models import User
+    return ctx.insert(User, [{"name": "doomed %d" % i, "email": "doomed%d@bench" % i, "password": "x", "is_active": True}
+                             for i in range(n)])
+
+
+def fresh_tokens(ctx, n):
+    from flask_jwt_extended import create_access_token
+    with ctx.app.app_context():
+        return [create_access_token(identity=ctx.user(i)) for i in range(n)]
+
+
+def routes():
+    """Read-only routes first, then the ones that write, then the destructive ones."""
+    from models import People, Planets, Vehicles
+
+    people = lambda ctx: ctx.people
+    planets = lambda ctx: ctx.planets
+    vehicles = lambda ctx: ctx.vehicles
+
+    return [
+        Route("GET /", "GET", "/"),
+        Route("GET /_internal/cache", "GET", "/_internal/cache"),
+        Route("GET /_internal/pool", "GET", "/_internal/pool"),
+        Route("GET /metrics", "GET", "/metrics"),
+        Route("GET /user", "GET", "/user?limit=100"),
+        Route("GET /user/<id>", "GET", lambda i, ctx: "/user/%d" % ctx.user(i)),
+        Route("POST /user-with-post", "POST", "/user-with-post", body=lambda i, ctx: {"id": ctx.user(i)}),
+        Route("GET /protected", "GET", "/protected", headers=lambda i, ctx: ctx.auth(ctx.user(i))),
+        Route("POST /login", "POST", "/login", slow=True,
+              body=lambda i, ctx: {"email": "user%d@bench" % ctx.user(i), "password": PASSWORD}),
+        Route("GET /search", "GET", lambda i, ctx: "/search?q=planet+%d" % ctx.pick(ctx.planets, i)),
+        Route("GET /search?q=<word>", "GET", "/search?q=character&limit=100"),
+        Route("POST /batch", "POST", "/batch", body=lambda i, ctx: {
+            "people": [ctx.pick(ctx.people, i * 10 + k) for k in range(10)],
+            "planets": [ctx.pick(ctx.planets, i * 10 + k) for k in range(10)],
+            "vehicles": [ctx.pick(ctx.vehicles, i * 10 + k) for k in range(10)],
+        }),
+        Route("GET /sync", "GET", "/sync?limit=1000"),
+        # a different limit every request, for the same reason as the catalog pages
+        Route("GET /stats/<collection>", "GET", lambda i, ctx: "/stats/people?limit=%d" % (1 + i)),
+        Route("GET /stats/<collection>/favorites", "GET", lambda i, ctx: "/stats/vehicles/favorites?top=%d" % (1 + i)),
+        Route("POST /favorites", "POST", "/favorites", body=lambda i, ctx: {"user_id": ctx.user(i)}),
+        Route("GET /favorites/<user_id>", "GET", lambda i, ctx: "/favorites/%d" % ctx.user(i),
+              headers=lambda i, ctx: ctx.auth(ctx.user(i))),
+    ] + catalog_routes("people", People, people_row, "people", "people-with-post", people, "gender=male") \
+      + catalog_routes("planets", Planets, planet_row, "planets", "planet-with-post", planets,
+                       "population_gt=500000&sort=-population") \
+      + catalog_routes("vehicles", Vehicles, vehicle_row, "vehicles", "vehicles-with-post", vehicles,
+                       "max_speed_lt=500&sort=max_speed") \
+      + favorite_routes("people", "people_id", people) \
+      + favorite_routes("planet", "planet_id", planets) \
+      + favorite_routes("vehicle", "vehicle_id", vehicles) + [
+        Route("POST /register", "POST", "/register", slow=True,
+              body=lambda i, ctx: {"email": "new%d@bench" % i, "name": "new %d" % i, "password": PASSWORD, "is_active": True}),
+        Route("PUT /user", "PUT", "/user", body=lambda i, ctx: {"id": ctx.user(i), "name": "user %d (edited)" % i}),
+        Route("DELETE /user", "DELETE", "/user", body=lambda id, ctx: {"id": id}, prepare=fresh_users),
+        Route("POST /logout", "POST", "/logout", headers=lambda token, ctx: {"Authorization": "Bearer " + token},
+              prepare=fresh_tokens),
+    ]
+
+
+def seed(app, args):
+    from models import db, User, FavoritePeople, FavoritePlanet, FavoriteVehicle
+    from passwords import _hash, LOG_ROUNDS
+    from stats import rebuild
+
+    with app.app_context():
+        seed_catalog(people=args.people, planets=args.planets, vehicles=args.vehicles)
+        # one hash for everybody, at the configured cost so login never has to rehash
+        hashed = _hash(PASSWORD, LOG_ROUNDS)
+        db.session.execute(User.__table__.insert(), [
+            {"name": "user %d" % i, "email": "user%d@bench" % i, "password": hashed, "is_active": True}
+            for i in range(1, args.users + 1)
+        ])
+        for model, field in ((FavoritePeople, "people_id"), (FavoritePlanet, "planet_id"), (FavoriteVehicle, "vehicle_id")):
+            db.session.execute(model.__table__.insert(), [
+                {"user_id": user_id, field: item_id}
+                for user_id in range(1, args.users + 1) for item_id in range(1, args.favorites + 1)
+            ])
+        db.session.commit()
+        # the inserts above skip the /stats counters, like a database before its migration
+        rebuild()
+
+
+def summarize(timings, statuses, sql_counts, elapsed):
+    timings.sort()
+    return {
+        "requests": len(timings),
+        "throughput_rps": round(len(timings) / elapsed, 1) if elapsed else 0,
+        "p50_ms": round(percentile(timings, 50) * 1000, 3),
+        "p95_ms": round(percentile(timings, 95) * 1000, 3),
+        "p99_ms": round(percentile(timings, 99) * 1000, 3),
+        "sql_per_request": round(sum(sql_counts) / len(sql_counts), 2) if sql_counts else None,
+        "statuses": {str(status): statuses.count(status) for status in sorted(set(statuses))},
+    }
+
+
+def sql_count(server_timing, content_length):
+    # a streamed body (no Content-Length) runs its queries after Server-Timing was written
+    if content_length is None:
+        return None
+    match = SQL_COUNT.search(server_timing or "")
+    return int(match.group(1)) if match else None
+
+
+def run_client(app, method, requests):
+    client = app.test_client()
+    timings, statuses, sql_counts = [], [], []
+    requests = list(requests)
+    started = time.perf_counter()
+    for path, body, headers in requests:
+        start = time.perf_counter()
+        response = client.open(path, method=method, json=body, headers=headers)
+        response.get_data()
+        timings.append(time.perf_counter() - start)
+        statuses.append(response.status_code)
+        count = sql_count(", ".join(response.headers.getlist("Server-Timing")), response.headers.get("Content-Length"))
+        if count is not None:
+            sql_counts.append(count)
+    return timings, statuses, sql_counts, time.perf_counter() - started
+
+
+def run_http(port, method, requests, concurrency):
+    def send(request):
+        path, body, headers = request
+        connection = http.client.HTTPConnection("127.0.0.1", port, timeout=60)
+        payload = None
+        if body is not None:
+            payload = json.dumps(body).encode()
+            headers = dict(headers, **{"Content-Type": "application/json"})
+        start = time.perf_counter()
+        try:
+            connection.request(method, path, body=payload, headers=headers)
+            response = connection.getresponse()
+            response.read()
+            return (time.perf_counter() - start, response.status,
+                    sql_count(response.getheader("Server-Timing"), response.getheader("Content-Length")))
+        except OSError:
+            return time.perf_counter() - start, 0, None
+        finally:
+            connection.close()
+
+    requests = list(requests)
+    started = time.perf_counter()
+    with ThreadPoolExecutor(concurrency) as pool:
+        results = list(pool.map(send, requests))
+    elapsed = time.perf_counter() - started
+    return ([timing for timing, _, _ in results], [status for _, status, _ in results],
+            [count for _, _, count in results if count is not None], elapsed)
+
+
+def uncovered(app, endpoints):
+    """Endpoints of the app that no scenario reached."""
+    return sorted(rule.endpoint for rule in app.url_map.iter_rules()
+                  if rule.endpoint not in endpoints and rule.endpoint not in NOT_BENCHMARKED
+                  and rule.endpoint != "static" and "." not in rule.endpoint)
+
+
+def worker_rss_mb(pid):
+    """Largest peak RSS among ``pid`` and its children (Linux only)."""
+    peaks = []
+    pids = [pid]
+    try:
+        with open("/proc/%d/task/%d/children" % (pid, pid)) as children:
+            pids += [int(child) for child in children.read().split()]
+    except OSError:
+        return None
+    for process in pids:
+        try:
+            with open("/proc/%d/status" % process) as status:
+                for line in status:
+                    if line.startswith("VmHWM:"):
+                        peaks.append(int(line.split()[1]) / 1024)
+        except OSError:
+            pass
+    return round(max(peaks), 1) if peaks else None
+
+
+def wait_for(port):
+    import socket
+    for _ in range(100):
+        try:
+            socket.create_connection(("127.0.0.1", port), timeout=1).close()
+            return
+        except OSError:
+            time.sleep(0.1)
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, text=True,
+                                       stderr=subprocess.DEVNULL).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(current, baseline, threshold, min_delta_ms):
+    """Human readable regressions of ``current`` against ``baseline``."""
+    regressions = []
+    for name, base in baseline["routes"].items():
+        now = current["routes"].get(name)
+        if now is None:
+            continue
+        if now["p95_ms"] > base["p95_ms"] * (1 + threshold) and now["p95_ms"] - base["p95_ms"] >= min_delta_ms:
+            regressions.append("%s: p95 %.2fms -> %.2fms" % (name, base["p95_ms"], now["p95_ms"]))
+        if base["throughput_rps"] and now["throughput_rps"] < base["throughput_rps"] * (1 - threshold) \
+                and 1000 / max(now["throughput_rps"], 1e-9) - 1000 / base["throughput_rps"] >= min_delta_ms:
+            regressions.append("%s: throughput %.1f/s -> %.1f/s" % (name, base["throughput_rps"], now["throughput_rps"]))
+        if base["sql_per_request"] is not None and now["sql_per_request"] is not None \
+                and now["sql_per_request"] > base["sql_per_request"]:
+            regressions.append("%s: SQL statements per request %s -> %s" % (name, base["sql_per_request"], now["sql_per_request"]))
+        errors = lambda result: sum(n for status, n in result["statuses"].items() if status.startswith("5") or status == "0")
+        if errors(now) > errors(base):
+            regressions.append("%s: server errors %d -> %d" % (name, errors(base), errors(now)))
+    if baseline.get("peak_rss_mb") and current.get("peak_rss_mb") \
+            and current["peak_rss_mb"] > baseline["peak_rss_mb"] * (1 + threshold):
+        regressions.append("peak RSS %.1fMB -> %.1fMB" % (baseline["peak_rss_mb"], current["peak_rss_mb"]))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--people", type=int, default=1000)
+    parser.add_argument("--planets", type=int, default=1000)
+    parser.add_argument("--vehicles", type=int, default=1000)
+    parser.add_argument("--users", type=int, default=100)
+    parser.add_argument("--favorites", type=int, default=10, help="favorite people, planets and vehicles per user")
+    parser.add_argument("--requests", type=int, default=200, help="requests per route")
+    parser.add_argument("--slow-requests", type=int, default=20, help="requests to login and register")
+    parser.add_argument("--warmup", type=int, default=5, help="untimed requests sent to each route first")
+    parser.add_argument("--routes", help="only routes whose name matches this regular expression")
+    parser.add_argument("--server", choices=("client", "gunicorn"), default="client")
+    parser.add_argument("--workers", type=int, default=4, help="gunicorn workers (gthread, from gunicorn.conf.py)")
+    parser.add_argument("--concurrency", type=int, default=8, help="client threads against gunicorn")
+    parser.add_argument("--port", type=int, default=3103)
+    parser.add_argument("--database-url", help="empty database to use instead of a temporary SQLite file")
+    parser.add_argument("--output", help="write the results here instead of stdout")
+    parser.add_argument("--baseline", help="earlier output to compare against; exit 1 on regressions")
+    parser.add_argument("--compare", help="compare this earlier output with --baseline instead of running")
+    parser.add_argument("--threshold", type=float, default=0.25, help="allowed relative slowdown or growth")
+    parser.add_argument("--min-delta-ms", type=float, default=2.0, help="ignore latency changes smaller than this")
+    args = parser.parse_args()
+
+    if args.compare:
+        with open(args.compare) as current_file:
+            result = json.load(current_file)
+    else:
+        result = run(args)
+        text = json.dumps(result, indent=2)
+        if args.output:
+            with open(args.output, "w") as output:
+                output.write(text + "\n")
+        else:
+            print(text)
+
+    if args.baseline:
+        with open(args.baseline) as baseline_file:
+            regressions = compare(result, json.load(baseline_file), args.threshold, args.min_delta_ms)
+        for regression in regressions:
+            print("REGRESSION " + regression, file=sys.stderr)
+        if regressions:
+            sys.exit(1)
+        print("no regressions against %s" % args.baseline, file=sys.stderr)
+
+
+def run(args):
+    # Server-Timing carries the SQL statement count of every response
+    os.environ["PROFILING"] = "1"
+    db_path = os.path.join(tempfile.mkdtemp(prefix="swapi-bench-"), "bench.db")
+    app = load_app(db_path, args.database_url)
+    # PROFILING=1 also logs every request at INFO
+    app.logger.setLevel("WARNING")
+    seed(app, args)
+    ctx = Context(app, args)
+
+    scenarios = routes()
+    if args.routes:
+        scenarios = [route for route in scenarios if re.search(args.routes, route.name)]
+
+    server = None
+    if args.server == "gunicorn":
+        env = dict(os.environ, DATABASE_URL=args.database_url or "sqlite:///" + db_path)
+        server = subprocess.Popen([sys.executable, "-m", "gunicorn", "wsgi", "--chdir", SRC, "-c", "gunicorn.conf.py",
+                                   "-w", str(args.workers), "-b", "127.0.0.1:%d" % args.port,
+                                   "--log-level", "warning"], cwd=ROOT, env=env)
+        wait_for(args.port)
+
+    urls = app.url_map.bind("localhost")
+    endpoints = set()
+    results = {}
+    try:
+        # views that print (GET /protected) must not end up in the JSON on stdout
+        with redirect_stdout(sys.stderr):
+            for route in scenarios:
+                count = args.slow_requests if route.slow else args.requests
+                requests = list(route.requests(ctx, args.warmup + count))
+                endpoints.add(urls.match(requests[0][0].split("?")[0], route.method)[0])
+                if server is None:
+                    send = lambda requests: run_client(app, route.method, requests)
+                else:
+                    send = lambda requests: run_http(args.port, route.method, requests, args.concurrency)
+                # first hits fill caches and connection pools, keep them out of the numbers
+                send(requests[:args.warmup])
+                results[route.name] = summarize(*send(requests[args.warmup:]))
+                print("%-32s %8.1f req/s  p95 %8.2fms" % (route.name, results[route.name]["throughput_rps"],
+                                                          results[route.name]["p95_ms"]), file=sys.stderr)
+        peak = peak_rss_mb() if server is None else worker_rss_mb(server.pid)
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait()
+
+    missing = uncovered(app, endpoints)
+    if missing and not args.routes:
+        print("not benchmarked: " + ", ".join(missing), file=sys.stderr)
+
+    return {
+        "meta": {
+            "commit": git_commit(),
+            "server": args.server,
+            "workers": args.workers if server is not None else None,
+            "concurrency": args.concurrency if server is not None else 1,
+            "volumes": {"people": args.people, "planets": args.planets, "vehicles": args.vehicles,
+                        "users": args.users, "favorites_per_user": args.favorites},
+            "requests": args.requests,
+            "slow_requests": args.slow_requests,
+            "warmup": args.warmup,
+            "python": sys.version.split()[0],
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        },
+        "peak_rss_mb": round(peak, 1) if peak is not None else None,
+        "routes": results,
+    }
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,58 @@
+"""
+GET /search latency as the catalog grows, on the in-process index used for
+SQLite:
+
+    $ python bench/bench_search.py --sizes 1000 10000 100000
+
+The catalog is grown to each size (rows per model) and the index rebuilt,
+then a selective query, a two-term query and a broad prefix are timed.
+"""
+import argparse
+import json
+import time
+
+from common import load_app, seed, people_row, planet_row, vehicle_row, percentile
+
+QUERIES = ("character 123", "planet 7", "veh")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 100000], help="rows per model")
+    parser.add_argument("--requests", type=int, default=200, help="requests per query")
+    args = parser.parse_args()
+
+    app = load_app()
+    client = app.test_client()
+    from models import People, Planets, Vehicles
+    from search import name_index
+
+    results = []
+    done = 0
+    for size in sorted(args.sizes):
+        with app.app_context():
+            for model, make_row in ((People, people_row), (Planets, planet_row), (Vehicles, vehicle_row)):
+                seed(model, lambda i: make_row(done + i), size - done)
+        done = size
+
+        name_index.invalidate()
+        start = time.perf_counter()
+        client.get("/search?q=warmup")
+        result = {"rows_per_model": size, "index_build_seconds": round(time.perf_counter() - start, 3)}
+
+        for query in QUERIES:
+            durations = []
+            for _ in range(args.requests):
+                start = time.perf_counter()
+                response = client.get("/search", query_string={"q": query, "limit": 20})
+                durations.append((time.perf_counter() - start) * 1000)
+            durations.sort()
+            result[query] = {"p50_ms": round(percentile(durations, 50), 3), "p99_ms": round(percentile(durations, 99), 3),
+                             "first_page": len(response.get_json()["results"])}
+        results.append(result)
+
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+"""
+Cost of turning a whole table into a JSON body, per model:
+
+    $ python bench/bench_serialize.py --sizes 10000 100000
+
+Three paths are timed, split into building the dicts and encoding them:
+ORM objects + serialize() + the stdlib encoder (the old list endpoints),
+the same dicts encoded by orjson, and rows selected column by column
+(serializers.row_columns) encoded by orjson.
+"""
+import argparse
+import gc
+import json
+import time
+
+from common import load_app, seed, people_row, planet_row, vehicle_row
+
+
+def best_of(repeat, run):
+    best = None
+    for _ in range(repeat):
+        gc.collect()
+        start = time.perf_counter()
+        result = run()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return result, round(best * 1000, 1)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10000, 100000], help="rows per model")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    import orjson
+
+    app = load_app()
+    from models import db, People, Planets, Vehicles
+    from serializers import row_columns, serialize_rows
+    from profiling import TimedJSONProvider
+    stdlib = TimedJSONProvider(app)
+
+    results = []
+    done = 0
+    with app.app_context():
+        for size in sorted(args.sizes):
+            for model, make_row in ((People, people_row), (Planets, planet_row), (Vehicles, vehicle_row)):
+                seed(model, lambda i: make_row(done + i), size - done)
+            done = size
+
+            for model in (People, Planets, Vehicles):
+                names, columns = row_columns(model)
+
+                def orm_dicts():
+                    db.session.expunge_all()
+                    return [item.serialize() for item in db.session.scalars(db.select(model)).all()]
+
+                def row_dicts():
+                    return serialize_rows(names, db.session.execute(db.select(*columns)).all())
+
+                dicts, orm_build = best_of(args.repeat, orm_dicts)
+                _, stdlib_encode = best_of(args.repeat, lambda: stdlib.dumps(dicts, separators=(",", ":")))
+                _, orjson_encode = best_of(args.repeat, lambda: orjson.dumps(dicts, option=orjson.OPT_SORT_KEYS))
+                rows, row_build = best_of(args.repeat, row_dicts)
+                assert rows == dicts
+                results.append({
+                    "model": model.__name__,
+                    "rows": size,
+                    "orm_stdlib_ms": {"build": orm_build, "encode": stdlib_encode, "total": round(orm_build + stdlib_encode, 1)},
+                    "orm_orjson_ms": {"build": orm_build, "encode": orjson_encode, "total": round(orm_build + orjson_encode, 1)},
+                    "rows_orjson_ms": {"build": row_build, "encode": orjson_encode, "total": round(row_build + orjson_encode, 1)},
+                })
+
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+"""
+Shared helpers for the benchmark scripts: a throwaway SQLite database, the
+Flask app bound to it and fast seeding of the catalog tables.
+"""
+import os
+import resource
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SRC = os.path.join(ROOT, "src")
+
+
+def load_app(db_path=None, database_url=None):
+    """Import ``src/app.py`` against a fresh SQLite file (or ``database_url``) and create the tables."""
+    if database_url is None:
+        if db_path is None:
+            db_path = os.path.join(tempfile.mkdtemp(prefix="swapi-bench-"), "bench.db")
+        database_url = "sqlite:///" + db_path
+    os.environ["DATABASE_URL"] = database_url
+    os.environ.setdefault("FLASK_APP_KEY", "bench")
+    # the benchmarks hammer single routes from one address on purpose
+    os.environ.setdefault("RATE_LIMIT_ENABLED", "0")
+    if SRC not in sys.path:
+        sys.path.insert(0, SRC)
+
+    import app as app_module
+    from models import db
+
+    with app_module.app.app_context():
+        db.create_all()
+    return app_module.app
+
+
+def people_row(i):
+    return {"name": "Character %d" % i, "height": 150.0 + i % 60, "birthdate": "%dBBY" % (i % 900),
+            "gender": ("male", "female", "n/a")[i % 3], "eyes": ("blue", "brown", "red")[i % 3],
+            "skin": ("fair", "gold", "white")[i % 3]}
+
+
+def planet_row(i):
+    return {"name": "Planet %d" % i, "gravity": "1 standard", "terrain": ("desert", "ocean", "forest")[i % 3],
+            "climate": ("arid", "temperate", "frozen")[i % 3], "orbital_period": 300.0 + i % 200,
+            "population": 1000 * i, "diameter": 10000.0 + i % 5000}
+
+
+def vehicle_row(i):
+    return {"name": "Vehicle %d" % i, "model": "Model %d" % (i % 50), "length": 5.0 + i % 40,
+            "max_speed": 100.0 + i % 900, "cargo_capacity": 50 * i,
+            "manufacturer": ("Incom", "Kuat", "Sienar")[i % 3]}
+
+
+def seed(model, make_row, count, chunk=10000):
+    """Insert ``count`` rows into ``model`` with executemany in chunks, stamped for /sync."""
+    from models import db
+    from sync import stamp
+
+    for start in range(0, count, chunk):
+        rows = stamp([make_row(i) for i in range(start, min(start + chunk, count))])
+        db.session.execute(model.__table__.insert(), rows)
+        db.session.commit()
+
+
+def seed_catalog(people=0, planets=0, vehicles=0):
+    from models import People, Planets, Vehicles
+
+    seed(People, people_row, people)
+    seed(Planets, planet_row, planets)
+    seed(Vehicles, vehicle_row, vehicles)
+
+
+def peak_rss_mb():
+    # ru_maxrss is reported in kilobytes on Linux and in bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform == "darwin":
+        return peak / (1024 * 1024)
+    return peak / 1024
+
+
+def percentile(sorted_values, pct):
+    """Nearest-rank percentile of an already sorted list (0 when empty)."""
+    if not sorted_values:
+        return 0
+    index = max(int(round(pct / 100.0 * len(sorted_values))) - 1, 0)
+    return sorted_values[min(index, len(sorted_values) - 1)]
@@ -0,0 +1,36 @@
+# gunicorn settings used by the Procfile and render.yml: gunicorn wsgi --chdir ./src/ -c gunicorn.conf.py
+import os
+import shutil
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "src"))
+
+# threaded workers: a /favorites/<id>/stream connection holds one thread, not a whole worker,
+# and the worker keeps answering gunicorn's heartbeat while it streams
+worker_class = "gthread"
+workers = int(os.getenv("WEB_CONCURRENCY", 2))
+threads = int(os.getenv("GUNICORN_THREADS", 32))
+# a request stuck longer than this gets its worker restarted; streams are closed well before it
+# (FAVORITES_STREAM_MAX_AGE) and only need the heartbeat above
+timeout = int(os.getenv("GUNICORN_TIMEOUT", 60))
+graceful_timeout = 30
+
+
+def on_starting(server):
+    # a clean metrics directory per boot, shared by this boot's workers (see src/metrics.py);
+    # set before the import, the workers inherit the module from this process
+    if not os.environ.get("METRICS_DIR"):
+        os.environ["METRICS_DIR"] = server.metrics_tmp_dir = tempfile.mkdtemp(prefix="swapi-metrics-")
+    import metrics
+    metrics.clear(os.environ["METRICS_DIR"])
+
+
+def child_exit(server, worker):
+    import metrics
+    metrics.retire(os.environ["METRICS_DIR"], worker.pid)
+
+
+def on_exit(server):
+    if getattr(server, "metrics_tmp_dir", None):
+        shutil.rmtree(server.metrics_tmp_dir, ignore_errors=True)
@@ -0,0 +1,37 @@
+"""empty message
+
+Revision ID: 3c5e0f7a9b21
+Revises: d96d20315308
+Create Date: 2026-10-18 08:18:35.133312
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# search indexes for /search, PostgreSQL only: other databases use the in-process index in src/search.py
+TABLES = ('people', 'planets', 'vehicles')
+
+# revision identifiers, used by Alembic.
+revision = '3c5e0f7a9b21'
+down_revision = 'd96d20315308'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    if op.get_bind().dialect.name != 'postgresql':
+        return
+
+    op.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    for table in TABLES:
+        op.execute(f"CREATE INDEX ix_{table}_name_tsv ON {table} USING gin (to_tsvector('simple', name))")
+        op.execute(f"CREATE INDEX ix_{table}_name_trgm ON {table} USING gin (lower(name) gin_trgm_ops)")
+
+
+def downgrade():
+    if op.get_bind().dialect.name != 'postgresql':
+        return
+
+    for table in TABLES:
+        op.execute(f"DROP INDEX ix_{table}_name_trgm")
+        op.execute(f"DROP INDEX ix_{table}_name_tsv")
@@ -0,0 +1,150 @@
+"""empty message
+
+Revision ID: e5ef9536e6bf
+Revises: 3c5e0f7a9b21
+Create Date: 2026-10-18 08:22:41.897868
+
+"""
+from alembic import op
+import logging
+import math
+import os
+
+import sqlalchemy as sa
+
+# the string columns turned numeric; a *_num column holds the parsed value until the swap
+NUMERIC_COLUMNS = {
+    'planets': (('orbital_period', sa.Float()), ('population', sa.BigInteger()), ('diameter', sa.Float())),
+    'vehicles': (('length', sa.Float()), ('max_speed', sa.Float()), ('cargo_capacity', sa.BigInteger())),
+}
+UNKNOWN_VALUES = ('unknown', 'n/a', 'none', 'indefinite', '')
+BATCH_SIZE = 5000
+# 1 = store values that are not numbers (e.g. "1000km") as NULL instead of stopping the upgrade
+ALLOW_NULLED_VALUES = os.getenv('MIGRATION_ALLOW_NULLED_VALUES') == '1'
+
+logger = logging.getLogger('alembic.env')
+
+# revision identifiers, used by Alembic.
+revision = 'e5ef9536e6bf'
+down_revision = '3c5e0f7a9b21'
+branch_labels = None
+depends_on = None
+
+
+def parse_number(value, integer):
+    # same rules as utils.parse_number: unknown values are NULL, anything else that isn't a number raises ValueError
+    if value is None:
+        return None
+    text = value.strip().lower().replace(',', '')
+    if text in UNKNOWN_VALUES:
+        return None
+    number = float(text)
+    if not math.isfinite(number):
+        raise ValueError(value)
+    return int(number) if integer else number
+
+
+def inspect_table(table):
+    inspector = sa.inspect(op.get_bind())
+    columns = {column['name'] for column in inspector.get_columns(table)}
+    indexes = {index['name'] for index in inspector.get_indexes(table)}
+    return columns, indexes
+
+
+def backfill(table, columns):
+    """Copy the parsed strings into the *_num columns, BATCH_SIZE rows at a time.
+
+    Runs in autocommit mode so every batch is committed as it goes: an
+    interrupted upgrade keeps what it copied and the next run resumes after the last row that got a value.
+    Parsing is idempotent, so copying a few rows twice is harmless.
+
+    A value that is neither a number nor unknown stops the upgrade before
+    its batch is written, listing the offending rows, unless
+    MIGRATION_ALLOW_NULLED_VALUES=1; then it is stored as NULL and counted.
+    """
+    bind = op.get_bind()
+    names = [column for column, _ in columns]
+    rows_table = sa.table(table, sa.column('id'), *[sa.column(name) for name in names],
+                          *[sa.column(name + '_num') for name in names])
+    copied = sa.or_(*[rows_table.c[name + '_num'].isnot(None) for name in names])
+    update = rows_table.update().where(rows_table.c.id == sa.bindparam('row_id'))
+
+    with op.get_context().autocommit_block():
+        last_id = bind.scalar(sa.select(sa.func.max(rows_table.c.id)).where(copied)) or 0
+        nulled = 0
+        while True:
+            rows = bind.execute(
+                sa.select(rows_table.c.id, *[rows_table.c[name] for name in names])
+                .where(rows_table.c.id > last_id)
+                .order_by(rows_table.c.id)
+                .limit(BATCH_SIZE)
+            ).all()
+            if not rows:
+                break
+            values, lost = [], []
+            for row in rows:
+                parsed = {'row_id': row.id}
+                for name, type_ in columns:
+                    try:
+                        parsed[name + '_num'] = parse_number(getattr(row, name), isinstance(type_, sa.BigInteger))
+                    except ValueError:
+                        parsed[name + '_num'] = None
+                        lost.append('%s.%s id=%s %r' % (table, name, row.id, getattr(row, name)))
+                values.append(parsed)
+            if lost and not ALLOW_NULLED_VALUES:
+                raise RuntimeError('%d values are not numbers: %s. Fix them, or set MIGRATION_ALLOW_NULLED_VALUES=1 '
+                                   'to store them as NULL' % (len(lost), ', '.join(lost[:20])))
+            bind.execute(update, values)
+            last_id = rows[-1].id
+            nulled += len(lost)
+            for value in lost:
+                logger.warning('Not a number, stored as NULL: %s', value)
+
+        if nulled:
+            logger.warning('%s: %d values that were not numbers were stored as NULL', table, nulled)
+
+
+def upgrade():
+    for table, columns in NUMERIC_COLUMNS.items():
+        if op.get_bind().dialect.name == 'sqlite':
+            # batch mode copy left behind by an interrupted SQLite run
+            op.execute(f'DROP TABLE IF EXISTS _alembic_tmp_{table}')
+        existing, indexes = inspect_table(table)
+        if f'ix_{table}_{columns[0][0]}_id' in indexes:
+            # converted by an earlier run that stopped on the next table
+            continue
+        if columns[0][0] + '_num' not in existing:
+            with op.batch_alter_table(table, schema=None) as batch_op:
+                for column, type_ in columns:
+                    batch_op.add_column(sa.Column(column + '_num', type_, nullable=True))
+
+        backfill(table, columns)
+
+        with op.batch_alter_table(table, schema=None) as batch_op:
+            for column, _ in columns:
+                batch_op.drop_column(column)
+        with op.batch_alter_table(table, schema=None) as batch_op:
+            for column, type_ in columns:
+                batch_op.alter_column(column + '_num', new_column_name=column, existing_type=type_, existing_nullable=True)
+        for column, _ in columns:
+            op.create_index(f'ix_{table}_{column}_id', table, [column, 'id'], unique=False)
+
+
+def downgrade():
+    for table, columns in NUMERIC_COLUMNS.items():
+        for column, _ in columns:
+            op.drop_index(f'ix_{table}_{column}_id', table_name=table)
+        with op.batch_alter_table(table, schema=None) as batch_op:
+            for column, _ in columns:
+                batch_op.add_column(sa.Column(column + '_str', sa.String(length=80), nullable=True))
+
+        for column, _ in columns:
+            op.execute(f"UPDATE {table} SET {column}_str = COALESCE(CAST({column} AS VARCHAR(80)), 'unknown')")
+
+        with op.batch_alter_table(table, schema=None) as batch_op:
+            for column, _ in columns:
+                batch_op.drop_column(column)
+        with op.batch_alter_table(table, schema=None) as batch_op:
+            for column, _ in columns:
+                batch_op.alter_column(column + '_str', new_column_name=column, existing_type=sa.String(length=80),
+                                      nullable=False)
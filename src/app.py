@@ -2,12 +2,32 @@
 This module takes care of starting the API Server, Loading the DB and Adding the endpoints
 """
 import os
-from flask import Flask, request, jsonify, url_for
+from flask import Flask, Response, request, jsonify, url_for
 from flask_migrate import Migrate
 from flask_swagger import swagger
 from flask_cors import CORS
-from utils import APIException, generate_sitemap
+from werkzeug.middleware.proxy_fix import ProxyFix
+from utils import APIException, generate_sitemap, keyset_page, internal_only, int_arg, number_field
+from serializers import row_page, ndjson_response
 from admin import setup_admin
+import click
+from blocklist import create_revocation_cache, purge_expired, start_purge_scheduler
+from response_cache import response_cache, cached
+from bulk import read_rows, bulk_create, bulk_update, bulk_delete
+from pool_stats import engine_options, pool_status
+from search import search
+from batch import multi_get, batch
+from sync import sync
+from stats import catalog_stats, favorite_stats, rebuild as rebuild_stats
+from favorites import get_document, read_document, record_change, changes_since, rename_entity, insert_favorite
+import streams
+import profiling
+import compression
+import replicas
+from replicas import read_only
+from json_provider import create_json_provider
+from metrics import metrics, init_app as init_metrics
+from rate_limit import rate_limit, init_app as init_rate_limit
 from models import db, User, People, Planets, Vehicles, FavoritePeople, FavoritePlanet, FavoriteVehicle, TokenBlockedList
 #from models import Person
 
@@ -18,33 +38,49 @@ from flask_jwt_extended import JWTManager
 
 from datetime import date, time, datetime, timezone, timedelta
 
-from flask_bcrypt import Bcrypt #librería para encriptaciones
+from passwords import hash_password, check_password, needs_rehash #encriptaciones en un pool de procesos
 
 app = Flask(__name__)
 app.url_map.strict_slashes = False
 
+# proxies delante de la app (1 en Render): la ip del cliente sale de X-Forwarded-For,
+# para los límites por ip, internal_only y profiling. Con 0 se usa la del socket
+TRUSTED_PROXY_HOPS = int(os.getenv("TRUSTED_PROXY_HOPS", 0))
+if TRUSTED_PROXY_HOPS:
+    app.wsgi_app = ProxyFix(app.wsgi_app, x_for=TRUSTED_PROXY_HOPS, x_proto=TRUSTED_PROXY_HOPS)
+
 #inicio de instancia de JWT
 app.config["JWT_SECRET_KEY"] = os.getenv("FLASK_APP_KEY")  # Change this!
 jwt = JWTManager(app)
 
-bcrypt = Bcrypt(app) #inicio mi instancia de Bcrypt
-
 db_url = os.getenv("DATABASE_URL")
 if db_url is not None:
     app.config['SQLALCHEMY_DATABASE_URI'] = db_url.replace("postgres://", "postgresql://")
 else:
     app.config['SQLALCHEMY_DATABASE_URI'] = "sqlite:////tmp/test.db"
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+app.config['SQLALCHEMY_ENGINE_OPTIONS'] = engine_options(app.config['SQLALCHEMY_DATABASE_URI'])
+replicas.init_app(app, engine_options)
 
 MIGRATE = Migrate(app, db)
 db.init_app(app)
 CORS(app)
 setup_admin(app)
+app.json = create_json_provider(app)
+compression.init_app(app)  # antes de profiling/metrics: comprime lo último
+profiling.init_app(app)
+init_metrics(app)
+init_rate_limit(app, on_limited=lambda endpoint: metrics.inc("rate_limited_total", endpoint=endpoint))
+
+# límites por cliente (sub del JWT o ip) para las rutas que más se abusan
+LOGIN_LIMIT = os.getenv("RATE_LIMIT_LOGIN", "10/minute")
+REGISTER_LIMIT = os.getenv("RATE_LIMIT_REGISTER", "5/minute")
+FAVORITES_LIMIT = os.getenv("RATE_LIMIT_FAVORITES", "120/minute")
 
 # Handle/serialize errors like a JSON object
 @app.errorhandler(APIException)
 def handle_invalid_usage(error):
-    return jsonify(error.to_dict()), error.status_code
+    return jsonify(error.to_dict()), error.status_code, error.headers
 
 # generate sitemap with all your endpoints
 @app.route('/')
@@ -52,9 +88,24 @@ def sitemap():
     return generate_sitemap(app)
 
 
+@app.route('/_internal/cache', methods=['GET'])
+@internal_only
+def cache_stats():
+    return jsonify(response_cache.stats()), 200
+
+@app.route('/_internal/pool', methods=['GET'])
+@internal_only
+def pool_stats():
+    return jsonify(dict(pool_status(db.engine), replicas=replicas.replicas.status())), 200
+
+@app.route('/metrics', methods=['GET'])
+@internal_only
+def prometheus_metrics():
+    return Response(metrics.render(), mimetype="text/plain; version=0.0.4")
+
+
 def verificacionToken(jti):
     jti#Identificador del JWT (es más corto)
-    print("jit", jti)
     token = TokenBlockedList.query.filter_by(token=jti).first()
 
     if token is None:
@@ -62,20 +113,47 @@ def verificacionToken(jti):
     
     return True
 
+revocation_cache = create_revocation_cache(
+    verificacionToken, on_lookup=lambda result: metrics.inc("token_blocklist_lookups_total", result=result)
+)
+
+# se consulta en cada ruta con @jwt_required, la base de datos solo cuando el cache no sabe la respuesta
+@jwt.token_in_blocklist_loader
+def check_if_token_revoked(jwt_header, jwt_payload):
+    return revocation_cache.is_revoked(jwt_payload["jti"], jwt_payload.get("exp"))
+
+# borra de la lista negra los tokens que ya expiraron: $ flask purge-blocklist
+@app.cli.command("purge-blocklist")
+@click.option("--batch-size", default=1000, show_default=True, help="Rows deleted per transaction.")
+@click.option("--pause", default=0.0, show_default=True, help="Seconds to sleep between batches.")
+def purge_blocklist_command(batch_size, pause):
+    deleted = purge_expired(batch_size, app.config["JWT_ACCESS_TOKEN_EXPIRES"], pause)
+    click.echo("Deleted %d expired tokens" % deleted)
+
+# recalcula los contadores de /stats desde las tablas: $ flask rebuild-stats
+@app.cli.command("rebuild-stats")
+def rebuild_stats_command():
+    counters = rebuild_stats()
+    click.echo("Rebuilt %d counters" % counters)
+
+if os.getenv("BLOCKLIST_PURGE_INTERVAL"):
+    start_purge_scheduler(app, int(os.getenv("BLOCKLIST_PURGE_INTERVAL")))
+
 @app.route('/user', methods=['GET'])
 def handle_hello():
-    users = User.query.all()  #<User Antonio>
+    users, next_cursor = keyset_page(User.query, User, request.args, filters=("email",))  #<User Antonio>
     users = list(map(lambda item: item.serialize(), users)) #{name:Antonio, password:123, ....} {name:Usuario2, password:123.... }
-    print(users)
   
     response_body = {
         "msg": "ok",
-        "users": users
+        "users": users,
+        "next_cursor": next_cursor
     }
 
-    return jsonify(users), 200
+    return jsonify(response_body), 200
 
 @app.route('/register', methods=['POST'])
+@rate_limit(REGISTER_LIMIT)
 def register_user():
     body = request.get_json() 
 
@@ -100,7 +178,8 @@ def register_user():
     if user is not None:
         raise APIException("Email is already registered", status_code=409)
 
-    password_encrypted = bcrypt.generate_password_hash(password,10).decode("utf-8")
+    with metrics.timer("bcrypt_duration_seconds", operation="hash"):
+        password_encrypted = hash_password(password)
 
    
     new_user = User(email=email, name=name, password=password_encrypted, is_active=is_active)
@@ -112,6 +191,7 @@ def register_user():
     return jsonify({"mensaje":"User created successfully"}), 201 
 
 @app.route('/login', methods=['POST'])
+@rate_limit(LOGIN_LIMIT)
 def login():
     body = request.get_json()
     email=body["email"]
@@ -123,8 +203,16 @@ def login():
         return jsonify({"message":"Login failed"}), 401
 
 
-    if not bcrypt.check_password_hash(user.password, password):
+    with metrics.timer("bcrypt_duration_seconds", operation="check"):
+        password_ok = check_password(user.password, password)
+    if not password_ok:
         return jsonify({"message":"Login failed"}), 401
+
+    # si cambió BCRYPT_LOG_ROUNDS se vuelve a encriptar con el nuevo costo
+    if needs_rehash(user.password):
+        with metrics.timer("bcrypt_duration_seconds", operation="hash"):
+            user.password = hash_password(password)
+        db.session.commit()
     
     access_token = create_access_token(identity=user.id)
     return jsonify({"token":access_token}), 200
@@ -133,15 +221,18 @@ def login():
 @jwt_required()
 def logout():
     jti = get_jwt()["jti"] 
+    exp = get_jwt().get("exp")
     now = datetime.now(timezone.utc)
 
    
     current_user = get_jwt_identity()
     user = User.query.get(current_user)
 
-    tokenBlocked = TokenBlockedList(token=jti , created_at=now, email=user.email)
+    expires_at = datetime.fromtimestamp(exp, timezone.utc) if exp is not None else None
+    tokenBlocked = TokenBlockedList(token=jti , created_at=now, expires_at=expires_at, email=user.email)
     db.session.add(tokenBlocked)
     db.session.commit()
+    revocation_cache.revoke(jti, exp)
 
     return jsonify({"message":"Logout successfully"})
 
@@ -152,10 +243,6 @@ def protected():
     current_user = get_jwt_identity()
     user = User.query.get(current_user)
 
-    token = verificacionToken(get_jwt()["jti"]) 
-    if token:
-       raise APIException('Token is blacklisted', status_code=404)
-
     print("The user is: ", user.name)
     return jsonify({"message":"You are on a protected route"}), 200
 
@@ -206,14 +293,22 @@ def edit_user():
 
 
 @app.route('/people', methods=['GET'])
+@cached("people")
+@read_only
 def get_all_people():
-    people = People.query.all()
-    people = list(map(lambda item: item.serialize(), people))
+    if request.args.get("format") == "ndjson":
+        return ndjson_response(People, request.args, filters=("gender",))
+    if "ids" in request.args:
+        people, missing = multi_get(People, request.args["ids"])
+        return jsonify({"msg": "ok", "people": people, "missing": missing}), 200
+
+    people, next_cursor = row_page(People, request.args, filters=("gender",))
 
 
     response_body = {
         "msg": "ok",
-        "people": people
+        "people": people,
+        "next_cursor": next_cursor
     }
 
     return jsonify(response_body), 200
@@ -251,12 +346,15 @@ def add_people():
     return jsonify({"mensaje":"Character created"}), 201
 
 @app.route('/people/<int:id>', methods=['GET'])
+@cached("people")
+@read_only
 def get_specific_people(id):
     people = People.query.get(id)    
   
     return jsonify(people.serialize()), 200
 
 @app.route('/people-with-post', methods=['POST'])
+@read_only
 def get_specific_people_with_post():
     body = request.get_json()   
     id = body["id"]
@@ -302,28 +400,60 @@ def edit_people():
     if "height" not in body:
         raise APIException("You need to specify the height", status_code=400)
 
-    people = People.query.get(id)   
+    people = People.query.get(body["id"])   
+    renamed = people.name != name
     people.name = name 
     people.birthdate = birthdate
     people.gender = gender
     people.eyes = eyes
     people.skin = skin
     people.height = height
+    if renamed:
+        rename_entity(People, people.id, name)
 
     db.session.commit()
   
     return jsonify(people.serialize()), 200
 
+@app.route('/people/bulk', methods=['POST'])
+def add_people_bulk():
+    results = bulk_create(People, read_rows())
+
+    return jsonify({"msg": "ok", "results": results}), 201
+
+@app.route('/people/bulk', methods=['PUT'])
+def edit_people_bulk():
+    results = bulk_update(People, read_rows())
+
+    return jsonify({"msg": "ok", "results": results}), 200
+
+@app.route('/people/bulk', methods=['DELETE'])
+def delete_people_bulk():
+    results = bulk_delete(People, read_rows())
+
+    return jsonify({"msg": "ok", "results": results}), 200
+
+
+# columnas numéricas con filtros <col>_gt/_gte/_lt/_lte y sort=[-]<col>
+PLANET_RANGES = ("orbital_period", "population", "diameter")
 
 @app.route('/planets', methods=['GET'])
+@cached("planets")
+@read_only
 def get_all_planets():
-    planets = Planets.query.all()
-    planets = list(map(lambda item: item.serialize(), planets))
+    if request.args.get("format") == "ndjson":
+        return ndjson_response(Planets, request.args, filters=("climate",), ranges=PLANET_RANGES)
+    if "ids" in request.args:
+        planets, missing = multi_get(Planets, request.args["ids"])
+        return jsonify({"msg": "ok", "planets": planets, "missing": missing}), 200
+
+    planets, next_cursor = row_page(Planets, request.args, filters=("climate",), ranges=PLANET_RANGES)
 
 
     response_body = {
         "msg": "ok",
-        "planets": planets
+        "planets": planets,
+        "next_cursor": next_cursor
     }
 
     return jsonify(response_body), 200
@@ -335,9 +465,9 @@ def add_planet():
     gravity = body["gravity"]
     terrain = body["terrain"]
     climate = body["climate"]
-    orbital_period = body["orbital period"]
-    population = body["population"]
-    diameter = body["diameter"]
+    orbital_period = number_field(body, "orbital_period")
+    population = number_field(body, "population", integer=True)
+    diameter = number_field(body, "diameter")
 
     if body is None:
         raise APIException("You need to specify the request body as json object", status_code=400)
@@ -364,12 +494,15 @@ def add_planet():
     return jsonify({"mensaje":"Planet created successfully"}), 201
 
 @app.route('/planets/<int:id>', methods=['GET'])
+@cached("planets")
+@read_only
 def get_specific_planet(id):
     planet = Planets.query.get(id)    
   
     return jsonify(planet.serialize()), 200
 
 @app.route('/planet-with-post', methods=['POST'])
+@read_only
 def get_specific_planet_with_post():
     body = request.get_json()   
     id = body["id"]
@@ -397,9 +530,9 @@ def edit_planet():
     gravity = body["gravity"]
     terrain = body["terrain"]
     climate = body["climate"]
-    orbital_period = body["orbital_period"]
-    population = body["population"]
-    diameter = body["diameter"]
+    orbital_period = number_field(body, "orbital_period")
+    population = number_field(body, "population", integer=True)
+    diameter = number_field(body, "diameter")
 
     if body is None:
         raise APIException("You need to specify the request body as json object", status_code=400)
@@ -418,30 +551,60 @@ def edit_planet():
     if "diameter" not in body:
         raise APIException("You need to specify the diameter", status_code=400)
 
-    planet = Planets.query.get(id)   
+    planet = Planets.query.get(body["id"])   
+    renamed = planet.name != name
     planet.name = name 
-    palnet.gravity = gravity
+    planet.gravity = gravity
     planet.terrain = terrain
     planet.climate = climate
     planet.orbital_period = orbital_period
     planet.population = population
     planet.diameter = diameter
+    if renamed:
+        rename_entity(Planets, planet.id, name)
 
     db.session.commit()
   
     return jsonify(planet.serialize()), 200
 
+@app.route('/planets/bulk', methods=['POST'])
+def add_planets_bulk():
+    results = bulk_create(Planets, read_rows())
+
+    return jsonify({"msg": "ok", "results": results}), 201
 
+@app.route('/planets/bulk', methods=['PUT'])
+def edit_planets_bulk():
+    results = bulk_update(Planets, read_rows())
+
+    return jsonify({"msg": "ok", "results": results}), 200
+
+@app.route('/planets/bulk', methods=['DELETE'])
+def delete_planets_bulk():
+    results = bulk_delete(Planets, read_rows())
+
+    return jsonify({"msg": "ok", "results": results}), 200
+
+
+VEHICLE_RANGES = ("length", "max_speed", "cargo_capacity")
 
 @app.route('/vehicles', methods=['GET'])
+@cached("vehicles")
+@read_only
 def get_all_vehicles():
-    vehicles = Vehicles.query.all()
-    vehicles = list(map(lambda item: item.serialize(), vehicles))
+    if request.args.get("format") == "ndjson":
+        return ndjson_response(Vehicles, request.args, filters=("manufacturer",), ranges=VEHICLE_RANGES)
+    if "ids" in request.args:
+        vehicles, missing = multi_get(Vehicles, request.args["ids"])
+        return jsonify({"msg": "ok", "vehicles": vehicles, "missing": missing}), 200
+
+    vehicles, next_cursor = row_page(Vehicles, request.args, filters=("manufacturer",), ranges=VEHICLE_RANGES)
 
 
     response_body = {
         "msg": "ok",
-        "vehicles": vehicles
+        "vehicles": vehicles,
+        "next_cursor": next_cursor
     }
 
     return jsonify(response_body), 200
@@ -451,9 +614,9 @@ def add_vehicle():
     body = request.get_json()
     name = body["name"]
     model = body["model"]
-    length = body["length"]
-    max_speed = body["max_speed"]
-    cargo_capacity = body["cargo_capacity"]
+    length = number_field(body, "length")
+    max_speed = number_field(body, "max_speed")
+    cargo_capacity = number_field(body, "cargo_capacity", integer=True)
     manufacturer = body["manufacturer"]
 
     if body is None:
@@ -479,12 +642,15 @@ def add_vehicle():
     return jsonify({"mensaje":"Vehicle created successfully"}), 201
 
 @app.route('/vehicles/<int:id>', methods=['GET'])
+@cached("vehicles")
+@read_only
 def get_specific_vehicle(id):
     vehicle = Vehicles.query.get(id)    
   
     return jsonify(vehicle.serialize()), 200
 
 @app.route('/vehicles-with-post', methods=['POST'])
+@read_only
 def get_specific_vehicle_with_post():
     body = request.get_json()   
     id = body["id"]
@@ -510,9 +676,9 @@ def edit_vehicle():
     body = request.get_json()
     name = body["name"]
     model = body["model"]
-    length = body["length"]
-    max_speed = body["max_speed"]
-    cargo_capacity = body["cargo_capacity"]
+    length = number_field(body, "length")
+    max_speed = number_field(body, "max_speed")
+    cargo_capacity = number_field(body, "cargo_capacity", integer=True)
     manufacturer = body["manufacturer"]
 
     if body is None:
@@ -530,20 +696,78 @@ def edit_vehicle():
     if "manufacturer" not in body:
         raise APIException("You need to specify the manufacturer", status_code=400)
 
-    vehicle = Vehicles.query.get(id)   
+    vehicle = Vehicles.query.get(body["id"])   
+    renamed = vehicle.name != name
     vehicle.name = name 
     vehicle.model = model
     vehicle.length = length
     vehicle.max_speed = max_speed
     vehicle.cargo_capacity = cargo_capacity
-    manufacturer = manufacturer
+    vehicle.manufacturer = manufacturer
+    if renamed:
+        rename_entity(Vehicles, vehicle.id, name)
 
     db.session.commit()
   
     return jsonify(vehicle.serialize()), 200
 
+@app.route('/vehicles/bulk', methods=['POST'])
+def add_vehicles_bulk():
+    results = bulk_create(Vehicles, read_rows())
+
+    return jsonify({"msg": "ok", "results": results}), 201
+
+@app.route('/vehicles/bulk', methods=['PUT'])
+def edit_vehicles_bulk():
+    results = bulk_update(Vehicles, read_rows())
+
+    return jsonify({"msg": "ok", "results": results}), 200
+
+@app.route('/vehicles/bulk', methods=['DELETE'])
+def delete_vehicles_bulk():
+    results = bulk_delete(Vehicles, read_rows())
+
+    return jsonify({"msg": "ok", "results": results}), 200
+
+
+@app.route('/batch', methods=['POST'])
+@read_only
+def get_batch():
+    body = request.get_json(silent=True)
+
+    return jsonify(batch(body)), 200
+
+
+@app.route('/sync', methods=['GET'])
+@read_only
+def sync_catalog():
+    return jsonify(sync(request.args)), 200
+
+
+@app.route('/stats/<collection>', methods=['GET'])
+@cached("catalog_count")
+@read_only
+def get_catalog_stats(collection):
+    return jsonify(catalog_stats(collection, request.args)), 200
+
+
+@app.route('/stats/<collection>/favorites', methods=['GET'])
+@cached("catalog_count")
+@read_only
+def get_favorite_stats(collection):
+    return jsonify(favorite_stats(collection, request.args)), 200
+
+
+@app.route('/search', methods=['GET'])
+@read_only
+def search_catalog():
+    results, next_cursor = search(request.args)
+
+    return jsonify({"msg": "ok", "results": results, "next_cursor": next_cursor}), 200
+
 
 @app.route('/favorite/people', methods=['POST'])
+@rate_limit(FAVORITES_LIMIT)
 def add_favorite_people():
     body = request.get_json()
     user_id = body["user_id"]
@@ -557,21 +781,21 @@ def add_favorite_people():
     if not user:
         raise APIException('User not found', status_code=404)
 
-    fav_exist = FavoritePeople.query.filter_by(user_id = user.id, people_id = character.id).first() is not None
-    
-    if fav_exist:
+    document = get_document(user.id, for_update=True)
+    favorite_id = insert_favorite(FavoritePeople, user_id=user.id, people_id=character.id)
+    if favorite_id is None:
         raise APIException('The user has already added it to favorites', status_code=400)
 
-    favorite_people = FavoritePeople(user_id=user.id, people_id=character.id)
-    db.session.add(favorite_people)
+    record_change(document, "add", {"name": character.name, "id": character.id, "url": "/people"})
     db.session.commit()
 
     return jsonify({
-        "people_name":favorite_people.serialize()["people_name"],
-        "user": favorite_people.serialize()["user_name"]
+        "people_name": character.name,
+        "user": user.name
     }), 201
 
 @app.route('/favorite/people', methods=['DELETE'])
+@rate_limit(FAVORITES_LIMIT)
 def remove_favorite_people():
     body = request.get_json()
     user_id = body["user_id"]
@@ -582,12 +806,15 @@ def remove_favorite_people():
     if not favorite_people:
         raise APIException('Favorite people not found', status_code=404)
 
+    document = get_document(favorite_people.user_id, for_update=True)
     db.session.delete(favorite_people)
+    record_change(document, "remove", {"name": favorite_people.people.name, "id": favorite_people.people_id, "url": "/people"})
     db.session.commit()
 
     return jsonify({"msg":"Favorite people removed successfully"}), 200
 
 @app.route('/favorite/planet', methods=['POST'])
+@rate_limit(FAVORITES_LIMIT)
 def add_favorite_planet():
     body = request.get_json()
     user_id = body["user_id"]
@@ -601,21 +828,21 @@ def add_favorite_planet():
     if not user:
         raise APIException('User not found', status_code=404)
 
-    fav_exist = FavoritePlanet.query.filter_by(user_id = user.id, planet_id = planet.id).first() is not None
-    
-    if fav_exist:
+    document = get_document(user.id, for_update=True)
+    favorite_id = insert_favorite(FavoritePlanet, user_id=user.id, planet_id=planet.id)
+    if favorite_id is None:
         raise APIException('The user has already added it to favorites', status_code=400)
 
-    favorite_planet = FavoritePlanet(user_id=user.id, planet_id=planet.id)
-    db.session.add(favorite_planet)
+    record_change(document, "add", {"name": planet.name, "id": planet.id, "url": "/planets"})
     db.session.commit()
 
     return jsonify({
-        "planet_name":favorite_planet.serialize()["planet_name"],
-        "user": favorite_planet.serialize()["user_name"]
+        "planet_name": planet.name,
+        "user": user.name
     }), 201
 
 @app.route('/favorite/planet', methods=['DELETE'])
+@rate_limit(FAVORITES_LIMIT)
 def remove_favorite_planet():
     body = request.get_json()
     user_id = body["user_id"]
@@ -626,12 +853,15 @@ def remove_favorite_planet():
     if not favorite_planet:
         raise APIException('Favorite planet not found', status_code=404)
 
+    document = get_document(favorite_planet.user_id, for_update=True)
     db.session.delete(favorite_planet)
+    record_change(document, "remove", {"name": favorite_planet.planets.name, "id": favorite_planet.planet_id, "url": "/planets"})
     db.session.commit()
 
     return jsonify({"msg":"Favorite planet removed successfully"}), 200
 
 @app.route('/favorite/vehicle', methods=['POST'])
+@rate_limit(FAVORITES_LIMIT)
 def add_favorite_vehicle():
     body = request.get_json()
     user_id = body["user_id"]
@@ -645,22 +875,22 @@ def add_favorite_vehicle():
     if not user:
         raise APIException('User not found', status_code=404)
 
-    fav_exist = FavoriteVehicle.query.filter_by(user_id=user.id, vehicle_id=vehicle.id).first() is not None
-
-    if fav_exist:
+    document = get_document(user.id, for_update=True)
+    favorite_id = insert_favorite(FavoriteVehicle, user_id=user.id, vehicle_id=vehicle.id)
+    if favorite_id is None:
         raise APIException('The user has already added it to favorites', status_code=400)
 
-    favorite_vehicle = FavoriteVehicle(user_id=user.id, vehicle_id=vehicle.id)
-    db.session.add(favorite_vehicle)
+    record_change(document, "add", {"name": vehicle.name, "id": vehicle.id, "url": "/vehicles"})
     db.session.commit()
 
     return jsonify({
-        "vehicle_name": favorite_vehicle.serialize()["vehicle_name"],
-        "user": favorite_vehicle.serialize()["user_name"]
+        "vehicle_name": vehicle.name,
+        "user": user.name
     }), 201
 
 
 @app.route('/favorite/vehicle', methods=['DELETE'])
+@rate_limit(FAVORITES_LIMIT)
 def remove_favorite_vehicle():
     body = request.get_json()
     user_id = body["user_id"]
@@ -671,12 +901,22 @@ def remove_favorite_vehicle():
     if not favorite_vehicle:
         raise APIException('Favorite vehicle not found', status_code=404)
 
+    document = get_document(favorite_vehicle.user_id, for_update=True)
     db.session.delete(favorite_vehicle)
+    record_change(document, "remove", {"name": favorite_vehicle.vehicles.name, "id": favorite_vehicle.vehicle_id, "url": "/vehicles"})
     db.session.commit()
 
     return jsonify({"msg": "Favorite vehicle removed successfully"}), 200
 
+def favorites_response(document, since):
+    if since is not None:
+        return {"msg": "ok", "version": document.version, "changes": changes_since(document.user_id, since)}
+
+    return {"msg": "ok", "version": document.version, "all_favorites": document.favorites}
+
 @app.route('/favorites', methods=['POST'])
+@rate_limit(FAVORITES_LIMIT)
+@read_only
 def get_favorites_with_post():
     body = request.get_json()
     user_id = body["user_id"]
@@ -684,42 +924,35 @@ def get_favorites_with_post():
     if user_id is None:
         raise APIException("You need to specify the user_id as a query parameter", status_code=400)
 
-    user = User.query.get(user_id)
-    if not user:
-        raise APIException('User not found', status_code=404)
+    since = int_arg(body, "since", minimum=0)
+    document = read_document(user_id)
 
-    favorite_people = list(map(lambda item: {"name": item.serialize()["people_name"], "id": item.serialize()["people_id"], "url": "/people"}, FavoritePeople.query.filter_by(user_id=user.id)))
-    favorite_planet = list(map(lambda item: {"name": item.serialize()["planet_name"], "id": item.serialize()["planet_id"], "url": "/planets"}, FavoritePlanet.query.filter_by(user_id=user.id)))
-    favorite_vehicle = list(map(lambda item: {"name": item.serialize()["vehicle_name"], "id": item.serialize()["vehicle_id"], "url": "/vehicles"}, FavoriteVehicle.query.filter_by(user_id=user.id)))
-
-    return jsonify({
-        "msg":"ok",
-        "all_favorites": favorite_people + favorite_planet + favorite_vehicle,
-    }), 200
+    return jsonify(favorites_response(document, since)), 200
 
 @app.route('/favorites/<int:user_id>', methods=['GET'])
+@rate_limit(FAVORITES_LIMIT)
 @jwt_required()
+@read_only
 def get_favorites(user_id):
     current_user = get_jwt_identity()
     if user_id != current_user:
         raise APIException('Unauthorized', status_code=401)
     
-    user = User.query.get(user_id)
-    if not user:
-        raise APIException('User not found', status_code=404)
+    since = int_arg(request.args, "since", minimum=0)
+    document = read_document(user_id)
 
-    token = verificacionToken(get_jwt()["jti"])
-    if token:
-       raise APIException('Token está en lista negra', status_code=404)
+    return jsonify(favorites_response(document, since)), 200
 
-    favorite_people = list(map(lambda item: {"name": item.serialize()["people_name"], "id": item.serialize()["people_id"], "url": "/people"}, FavoritePeople.query.filter_by(user_id=current_user)))
-    favorite_planet = list(map(lambda item: {"name": item.serialize()["planet_name"], "id": item.serialize()["planet_id"], "url": "/planets"}, FavoritePlanet.query.filter_by(user_id=current_user)))
-    favorite_vehicle = list(map(lambda item: {"name": item.serialize()["vehicle_name"], "id": item.serialize()["vehicle_id"], "url": "/vehicles"}, FavoriteVehicle.query.filter_by(user_id=current_user)))
+# EventSource no puede mandar headers: el token también vale como ?jwt=
+@app.route('/favorites/<int:user_id>/stream', methods=['GET'])
+@rate_limit(FAVORITES_LIMIT)
+@jwt_required(locations=["headers", "query_string"])
+def stream_favorites(user_id):
+    current_user = get_jwt_identity()
+    if user_id != current_user:
+        raise APIException('Unauthorized', status_code=401)
 
-    return jsonify({
-        "msg":"ok",
-        "all_favorites": favorite_people + favorite_planet + favorite_vehicle,
-    }), 200
+    return streams.stream(user_id, request, expires_at=get_jwt().get("exp"))
 
 
 
@@ -0,0 +1,226 @@
+"""
+ASGI entry point: $ uvicorn asgi:application --app-dir ./src/
+
+The read-only catalog and favorites routes are served natively on an async
+SQLAlchemy engine (asyncpg for Postgres, aiosqlite for SQLite), so a single
+process can keep thousands of requests waiting on the database at once.
+Every other route, and the admin, is handed to the same Flask app used by
+wsgi.py through a thread pool. The native routes answer exactly like their
+Flask counterparts but skip the Flask-only layers (response cache, metrics,
+profiling). Rate limits still apply, keyed by the client IP and the Flask
+endpoint the route stands in for.
+"""
+import asyncio
+import re
+from urllib.parse import parse_qs
+
+from asgiref.wsgi import WsgiToAsgi
+from flask_jwt_extended import decode_token
+from jwt.exceptions import PyJWTError
+from flask_jwt_extended.exceptions import JWTExtendedException
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+
+from app import app, revocation_cache, TRUSTED_PROXY_HOPS
+from pool_stats import engine_options
+from models import db, User, People, Planets, Vehicles, UserFavorites, FavoriteChange, favorites_statements, favorite_entries
+from utils import APIException, keyset_query, split_page, int_arg
+import rate_limit
+from serializers import row_columns, serialize_rows
+
+def client_address(scope):
+    """Client ip of an ASGI request, read from X-Forwarded-For like ProxyFix does in app.py."""
+    client = scope.get("client")
+    address = client[0] if client else None
+    if TRUSTED_PROXY_HOPS:
+        forwarded = [value for name, value in scope.get("headers", ()) if name == b"x-forwarded-for"]
+        hops = b",".join(forwarded).decode("latin-1").split(",") if forwarded else []
+        if len(hops) >= TRUSTED_PROXY_HOPS:
+            address = hops[-TRUSTED_PROXY_HOPS].strip()
+    return address
+
+
+ASYNC_DRIVERS = {
+    "postgresql": "postgresql+asyncpg",
+    "postgresql+psycopg2": "postgresql+asyncpg",
+    "sqlite": "sqlite+aiosqlite",
+    "mysql": "mysql+aiomysql",
+}
+
+COLLECTIONS = {
+    "people": (People, ("gender",), ()),
+    "planets": (Planets, ("climate",), ("orbital_period", "population", "diameter")),
+    "vehicles": (Vehicles, ("manufacturer",), ("length", "max_speed", "cargo_capacity")),
+}
+
+
+def async_url(url):
+    scheme, rest = url.split("://", 1)
+    return ASYNC_DRIVERS.get(scheme, scheme) + "://" + rest
+
+
+class Request:
+    def __init__(self, scope, receive):
+        self.scope = scope
+        self.receive = receive
+        self.headers = {name.decode("latin-1").lower(): value.decode("latin-1") for name, value in scope["headers"]}
+        self.args = {name: values[0] for name, values in parse_qs(scope["query_string"].decode()).items()}
+
+    async def json(self):
+        body = b""
+        while True:
+            message = await self.receive()
+            body += message.get("body", b"")
+            if not message.get("more_body"):
+                break
+        try:
+            return app.json.loads(body) if body else None
+        except ValueError:
+            raise APIException("The request body must be valid json", status_code=400)
+
+
+class AsyncAPI:
+    def __init__(self, flask_app):
+        self.flask_app = flask_app
+        self.wsgi = WsgiToAsgi(flask_app)
+        url = flask_app.config["SQLALCHEMY_DATABASE_URI"]
+        options = engine_options(url)
+        options.pop("poolclass", None)  # the async engine brings its own queue pool
+        self.engine = create_async_engine(async_url(url), **options)
+        self.session = async_sessionmaker(self.engine, expire_on_commit=False)
+        self.urls = flask_app.url_map.bind("localhost")
+        self.routes = [
+            ("GET", re.compile(r"^/(people|planets|vehicles)/?$"), self.get_collection),
+            ("GET", re.compile(r"^/(people|planets|vehicles)/(\d+)/?$"), self.get_item),
+            ("POST", re.compile(r"^/favorites/?$"), self.get_favorites_with_post),
+            ("GET", re.compile(r"^/favorites/(\d+)/?$"), self.get_favorites),
+        ]
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "lifespan":
+            return await self.lifespan(receive, send)
+        if scope["type"] == "http":
+            for method, pattern, handler in self.routes:
+                match = pattern.match(scope["path"])
+                if match and scope["method"] == method:
+                    return await self.dispatch(handler, match.groups(), scope, receive, send)
+        return await self.wsgi(scope, receive, send)
+
+    async def lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message["type"] == "lifespan.startup":
+                await send({"type": "lifespan.startup.complete"})
+            elif message["type"] == "lifespan.shutdown":
+                await self.engine.dispose()
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+
+    async def dispatch(self, handler, params, scope, receive, send):
+        request = Request(scope, receive)
+        if request.args.get("format") == "ndjson" or "ids" in request.args:
+            # streaming exports and multi-gets stay on the Flask path
+            return await self.wsgi(scope, receive, send)
+        headers = {}
+        try:
+            decision = self.rate_limit(scope)
+            if decision is not None:
+                headers = decision.headers()
+            body, status = await handler(request, *params)
+        except APIException as error:
+            body, status = error.to_dict(), error.status_code
+            headers.update(error.headers)
+        payload = (app.json.dumps(body) + "\n").encode("utf-8")
+        await send({
+            "type": "http.response.start",
+            "status": status,
+            "headers": [
+                (b"content-type", b"application/json"),
+                (b"content-length", str(len(payload)).encode()),
+                (b"access-control-allow-origin", b"*"),
+            ] + [(name.lower().encode(), value.encode()) for name, value in headers.items()],
+        })
+        await send({"type": "http.response.body", "body": payload})
+
+    def rate_limit(self, scope):
+        if not rate_limit.ENABLED:
+            return None
+        endpoint, _ = self.urls.match(scope["path"].rstrip("/") or "/", scope["method"])
+        limit = getattr(self.flask_app.view_functions[endpoint], "rate_limit", rate_limit.DEFAULT_LIMIT)
+        if limit is None:
+            return None
+        return rate_limit.check(endpoint, "ip:%s" % client_address(scope), limit)
+
+    async def get_collection(self, request, name):
+        model, filters, ranges = COLLECTIONS[name]
+        names, columns = row_columns(model)
+        statement, limit, sort = keyset_query(db.select(*columns), model, request.args, filters, ranges)
+        async with self.session() as session:
+            rows = (await session.execute(statement)).all()
+        rows, next_cursor = split_page(rows, limit, sort)
+        return {"msg": "ok", name: serialize_rows(names, rows), "next_cursor": next_cursor}, 200
+
+    async def get_item(self, request, name, id):
+        model = COLLECTIONS[name][0]
+        async with self.session() as session:
+            item = await session.get(model, int(id))
+        if item is None:
+            raise APIException("Not found", status_code=404)
+        return item.serialize(), 200
+
+    async def favorites(self, session, user_id, since):
+        # the Flask side materializes documents on first write; until then build the list on the fly
+        document = await session.get(UserFavorites, user_id)
+        if document is None:
+            user = await session.get(User, user_id)
+            if not user:
+                raise APIException('User not found', status_code=404)
+            loaded = []
+            for statement in favorites_statements(user_id):
+                loaded.append((await session.scalars(statement)).all())
+            document = UserFavorites(user_id=user_id, version=0, favorites=favorite_entries(*loaded))
+
+        if since is not None:
+            changes = await session.scalars(
+                db.select(FavoriteChange)
+                .where(FavoriteChange.user_id == user_id, FavoriteChange.version > since)
+                .order_by(FavoriteChange.version)
+            )
+            return {"msg": "ok", "version": document.version, "changes": [change.serialize() for change in changes]}, 200
+
+        return {"msg": "ok", "version": document.version, "all_favorites": document.favorites}, 200
+
+    async def get_favorites_with_post(self, request):
+        body = await request.json()
+        user_id = body.get("user_id") if isinstance(body, dict) else None
+        if user_id is None:
+            raise APIException("You need to specify the user_id as a query parameter", status_code=400)
+        since = int_arg(body, "since", minimum=0)
+
+        async with self.session() as session:
+            return await self.favorites(session, user_id, since)
+
+    def identity(self, request):
+        scheme, _, token = request.headers.get("authorization", "").partition(" ")
+        if scheme != "Bearer" or not token:
+            raise APIException("Missing Authorization Header", status_code=401, payload={"msg": "Missing Authorization Header"})
+        with self.flask_app.app_context():
+            try:
+                decoded = decode_token(token)
+            except (PyJWTError, JWTExtendedException) as error:
+                raise APIException(str(error), status_code=422, payload={"msg": str(error)})
+            if revocation_cache.is_revoked(decoded["jti"], decoded.get("exp")):
+                raise APIException("Token has been revoked", status_code=401, payload={"msg": "Token has been revoked"})
+            return decoded["sub"]
+
+    async def get_favorites(self, request, user_id):
+        # the blocklist may have to ask the database through Flask-SQLAlchemy, keep it off the event loop
+        current_user = await asyncio.to_thread(self.identity, request)
+        if int(user_id) != current_user:
+            raise APIException('Unauthorized', status_code=401)
+        since = int_arg(request.args, "since", minimum=0)
+
+        async with self.session() as session:
+            return await self.favorites(session, int(user_id), since)
+
+
+application = AsyncAPI(app)
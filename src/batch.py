@@ -0,0 +1,84 @@
+"""
+Multi-get for catalog entities: ``GET /people?ids=1,5,9`` and ``POST /batch``.
+
+Each model is resolved with a single ``id IN (...)`` query. Objects the
+request's session has already loaded (an earlier lookup in the same batch,
+the same id asked twice) come from its identity map instead. Results keep
+the order of the requested ids, and ids that don't exist are reported under
+``missing`` instead of failing the whole lookup.
+"""
+from models import db, People, Planets, Vehicles
+from utils import APIException, MAX_PAGE_SIZE
+
+COLLECTIONS = {"people": People, "planets": Planets, "vehicles": Vehicles}
+MAX_IDS = MAX_PAGE_SIZE
+
+
+def parse_ids(value, name="ids"):
+    """A comma separated string or a json list of ids."""
+    if isinstance(value, str):
+        value = [part for part in value.split(",") if part.strip()]
+    if not isinstance(value, list):
+        raise APIException("The %s must be a list of ids" % name, status_code=400)
+    try:
+        ids = [int(id) for id in value if not isinstance(id, bool)]
+    except (TypeError, ValueError):
+        raise APIException("The %s must be a list of integers" % name, status_code=400)
+    if len(ids) != len(value):
+        raise APIException("The %s must be a list of integers" % name, status_code=400)
+    return ids
+
+
+def from_identity_map(model, ids):
+    mapper = db.inspect(model)
+    found = {}
+    for id in ids:
+        item = db.session.identity_map.get(mapper.identity_key_from_primary_key((id,)))
+        # expired objects would go back to the database one by one on serialize()
+        if item is not None and not db.inspect(item).expired:
+            found[id] = item
+    return found
+
+
+def get_many(model, ids):
+    """(serialized items in the order of ``ids``, ids that don't exist)."""
+    unique = set(ids)
+    found = from_identity_map(model, unique)
+    pending = unique.difference(found)
+    if pending:
+        for item in db.session.scalars(db.select(model).where(model.id.in_(pending))):
+            found[item.id] = item
+
+    items = [found[id].serialize() for id in ids if id in found]
+    missing = [id for id in ids if id not in found]
+    return items, missing
+
+
+def check_size(count):
+    if count > MAX_IDS:
+        raise APIException("A lookup can hold at most %d ids" % MAX_IDS, status_code=413)
+
+
+def multi_get(model, value):
+    ids = parse_ids(value)
+    check_size(len(ids))
+    return get_many(model, ids)
+
+
+def batch(body):
+    """Resolve ``{"people": [1, 5], "planets": [3], ...}`` into one response body."""
+    if not isinstance(body, dict) or not body:
+        raise APIException("You need to specify the lookups as a json object of id lists", status_code=400)
+    unknown = [name for name in body if name not in COLLECTIONS]
+    if unknown:
+        raise APIException("Unknown collection: " + ", ".join(unknown), status_code=400)
+
+    lookups = {name: parse_ids(value, name) for name, value in body.items()}
+    check_size(sum(len(ids) for ids in lookups.values()))
+
+    response = {"msg": "ok", "missing": {}}
+    for name, ids in lookups.items():
+        response[name], missing = get_many(COLLECTIONS[name], ids)
+        if missing:
+            response["missing"][name] = missing
+    return response
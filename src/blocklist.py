@@ -0,0 +1,173 @@
+"""
+Cache in front of the TokenBlockedList table.
+
+Revocations are rare but every @jwt_required request asks whether its token
+was revoked, so answers are remembered until the token itself expires:
+revoked JTIs live in a backend (this process only, or the shared store so
+every gunicorn worker sees a logout at once) and JTIs known to be valid live
+in a short-lived local negative cache.
+"""
+import os
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+
+from models import db, TokenBlockedList
+from shared_store import get_store
+
+# used when a token carries no "exp" claim
+DEFAULT_TTL = 24 * 60 * 60
+
+
+class TTLSet:
+    """Bounded set whose members expire at a given unix time (LRU once full)."""
+
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+
+    def add(self, key, expires_at):
+        with self._lock:
+            self._items[key] = expires_at
+            self._items.move_to_end(key)
+            while len(self._items) > self.maxsize:
+                self._items.popitem(last=False)
+
+    def discard(self, key):
+        with self._lock:
+            self._items.pop(key, None)
+
+    def __contains__(self, key):
+        with self._lock:
+            expires_at = self._items.get(key)
+            if expires_at is None:
+                return False
+            if expires_at <= time.time():
+                del self._items[key]
+                return False
+            self._items.move_to_end(key)
+            return True
+
+    def __len__(self):
+        return len(self._items)
+
+
+class MemoryBackend:
+    def __init__(self, maxsize):
+        self._revoked = TTLSet(maxsize)
+
+    def add(self, jti, expires_at):
+        self._revoked.add(jti, expires_at)
+
+    def contains(self, jti):
+        return jti in self._revoked
+
+
+class SharedBackend:
+    prefix = "blocklist:"
+
+    def __init__(self, store):
+        self.store = store
+
+    def add(self, jti, expires_at):
+        ttl = max(int(expires_at - time.time()), 1)
+        self.store.set(self.prefix + jti, 1, ex=ttl)
+
+    def contains(self, jti):
+        return bool(self.store.exists(self.prefix + jti))
+
+
+class RevocationCache:
+    def __init__(self, backend, load_revoked, negative_ttl=30, maxsize=10000, on_lookup=None):
+        self.backend = backend
+        self.load_revoked = load_revoked
+        self.negative_ttl = negative_ttl
+        self.on_lookup = on_lookup or (lambda result: None)
+        self._valid = TTLSet(maxsize)
+
+    def _expiry(self, expires_at):
+        return expires_at if expires_at is not None else time.time() + DEFAULT_TTL
+
+    def is_revoked(self, jti, expires_at=None):
+        if self.backend.contains(jti):
+            self.on_lookup("cache_revoked")
+            return True
+        if jti in self._valid:
+            self.on_lookup("cache_valid")
+            return False
+
+        expires_at = self._expiry(expires_at)
+        if self.load_revoked(jti):
+            self.on_lookup("db_revoked")
+            self.backend.add(jti, expires_at)
+            return True
+        self.on_lookup("db_valid")
+        # a logout handled by another worker is picked up after negative_ttl at most
+        self._valid.add(jti, min(expires_at, time.time() + self.negative_ttl))
+        return False
+
+    def revoke(self, jti, expires_at=None):
+        self._valid.discard(jti)
+        self.backend.add(jti, self._expiry(expires_at))
+
+
+def create_revocation_cache(load_revoked, on_lookup=None):
+    """Build the cache from BLOCKLIST_BACKEND (memory|shared) and friends."""
+    maxsize = int(os.getenv("BLOCKLIST_CACHE_SIZE", 10000))
+    if os.getenv("BLOCKLIST_BACKEND", "memory") == "shared":
+        backend = SharedBackend(get_store())
+    else:
+        backend = MemoryBackend(maxsize)
+    negative_ttl = int(os.getenv("BLOCKLIST_NEGATIVE_TTL", 30))
+    return RevocationCache(backend, load_revoked, negative_ttl=negative_ttl, maxsize=maxsize, on_lookup=on_lookup)
+
+
+def purge_expired(batch_size=1000, legacy_ttl=timedelta(minutes=15), pause=0):
+    """Delete blocklist rows whose token has expired, ``batch_size`` rows per transaction.
+
+    Rows written before expires_at existed are removed once they are older
+    than ``legacy_ttl`` (the access token lifetime). Short transactions keep
+    row locks brief so logouts are never blocked behind the purge.
+    """
+    now = datetime.now(timezone.utc).replace(tzinfo=None)
+    expired = db.or_(
+        TokenBlockedList.expires_at < now,
+        db.and_(TokenBlockedList.expires_at.is_(None), TokenBlockedList.created_at < now - legacy_ttl),
+    )
+
+    deleted = 0
+    while True:
+        ids = db.session.scalars(db.select(TokenBlockedList.id).where(expired).limit(batch_size)).all()
+        if not ids:
+            break
+        db.session.execute(db.delete(TokenBlockedList).where(TokenBlockedList.id.in_(ids)))
+        db.session.commit()
+        deleted += len(ids)
+        if len(ids) < batch_size:
+            break
+        if pause:
+            time.sleep(pause)
+    return deleted
+
+
+def start_purge_scheduler(app, interval, batch_size=1000):
+    """Run purge_expired every ``interval`` seconds in a daemon thread."""
+    def run():
+        while True:
+            time.sleep(interval)
+            with app.app_context():
+                try:
+                    deleted = purge_expired(batch_size, app.config["JWT_ACCESS_TOKEN_EXPIRES"])
+                    if deleted:
+                        app.logger.info("Purged %d expired blocklist tokens", deleted)
+                except Exception:
+                    db.session.rollback()
+                    app.logger.exception("Blocklist purge failed")
+                finally:
+                    db.session.remove()
+
+    thread = threading.Thread(target=run, name="blocklist-purge", daemon=True)
+    thread.start()
+    return thread
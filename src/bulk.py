@@ -0,0 +1,172 @@
+"""
+Batch create/update/delete for the catalog models.
+
+Bodies are a JSON array or NDJSON (one object per line). Every row is
+validated, and its numeric fields parsed, before anything is written; rows are then written with one
+executemany statement per chunk of BULK_CHUNK_SIZE rows, each chunk in its
+own transaction, and the caller gets one result per input row. Written rows
+are stamped for /sync, counted for /stats and recorded for the search index
+here, since executemany skips the session's flush hooks.
+"""
+import json
+import os
+
+from flask import request
+from models import db, People, Planets, Vehicles
+from utils import APIException, parse_number, numeric_fields
+from favorites import rename_entities
+from sync import stamp, tombstones
+from stats import count_created, count_updated, count_deleted
+from search import RECORDED, record_changes
+
+CHUNK_SIZE = int(os.getenv("BULK_CHUNK_SIZE", 1000))
+MAX_ROWS = int(os.getenv("BULK_MAX_ROWS", 50000))
+
+REQUIRED_FIELDS = {
+    People: ("name", "birthdate", "gender", "eyes", "skin", "height"),
+    Planets: ("name", "gravity", "terrain", "climate", "orbital_period", "population", "diameter"),
+    Vehicles: ("name", "model", "length", "max_speed", "cargo_capacity", "manufacturer"),
+}
+
+
+def read_rows():
+    if request.mimetype == "application/x-ndjson":
+        try:
+            rows = [json.loads(line) for line in request.get_data(as_text=True).splitlines() if line.strip()]
+        except ValueError:
+            raise APIException("The request body must be valid NDJSON", status_code=400)
+    else:
+        rows = request.get_json(silent=True)
+        if not isinstance(rows, list):
+            raise APIException("You need to specify the request body as a json array", status_code=400)
+
+    if len(rows) > MAX_ROWS:
+        raise APIException("A batch can hold at most %d rows" % MAX_ROWS, status_code=413)
+    return rows
+
+
+def column_error(column, value):
+    """Why ``value`` (numbers already parsed) can't be stored in ``column``, or None."""
+    if value is None:
+        return None if column.nullable else "can't be null"
+    if column.type.python_type is str:
+        if not isinstance(value, str):
+            return "must be a string"
+        if column.type.length is not None and len(value) > column.type.length:
+            return "can be at most %d characters long" % column.type.length
+    return None
+
+
+def validate(model, rows, mode):
+    fields = REQUIRED_FIELDS[model]
+    errors = []
+    for index, row in enumerate(rows):
+        if mode == "delete" and isinstance(row, int) and not isinstance(row, bool):
+            continue
+        if not isinstance(row, dict):
+            errors.append({"index": index, "message": "Each row must be a json object"})
+            continue
+        if mode != "create" and not isinstance(row.get("id"), int):
+            errors.append({"index": index, "message": "You need to specify the id"})
+        if mode == "create":
+            missing = [field for field in fields if field not in row]
+            if missing:
+                errors.append({"index": index, "message": "You need to specify the " + ", ".join(missing)})
+        unknown = [field for field in row if field != "id" and field not in fields]
+        if mode != "delete" and unknown:
+            errors.append({"index": index, "message": "Unknown fields: " + ", ".join(unknown)})
+        if mode != "delete":
+            for field, integer in numeric_fields(model).items():
+                if field not in row:
+                    continue
+                try:
+                    row[field] = parse_number(row[field], integer)
+                except (TypeError, ValueError):
+                    errors.append({"index": index, "message": "The " + field + " field must be a number or \"unknown\""})
+            for field in fields:
+                if field in row:
+                    message = column_error(model.__table__.columns[field], row[field])
+                    if message:
+                        errors.append({"index": index, "message": "The " + field + " field " + message})
+
+    if errors:
+        raise APIException("Invalid rows, nothing was written", status_code=400, payload={"errors": errors})
+
+
+def chunks(items):
+    for start in range(0, len(items), CHUNK_SIZE):
+        yield start, items[start:start + CHUNK_SIZE]
+
+
+def existing_ids(model, ids):
+    return set(db.session.scalars(db.select(model.id).where(model.id.in_(ids))))
+
+
+def stored_names(model, ids):
+    return dict(db.session.execute(db.select(model.id, model.name).where(model.id.in_(ids))).all())
+
+
+def insert_ids(model, values):
+    """INSERT ``values`` with executemany and return the new ids in the same order."""
+    if db.session.get_bind().dialect.name == "sqlite":
+        # SQLite can't sort RETURNING rows, so sort_by_parameter_order would send one INSERT per row.
+        # Its rowids are handed out one after the other under the database write lock: sorted, they
+        # follow the order of the values
+        return sorted(db.session.scalars(db.insert(model).returning(model.id), values, execution_options=RECORDED).all())
+    statement = db.insert(model).returning(model.id, sort_by_parameter_order=True)
+    return db.session.scalars(statement, values, execution_options=RECORDED).all()
+
+
+def bulk_create(model, rows):
+    validate(model, rows, "create")
+    fields = REQUIRED_FIELDS[model]
+    results = []
+    for start, chunk in chunks(rows):
+        values = stamp([{field: row[field] for field in fields} for row in chunk])
+        count_created(model, values)
+        ids = insert_ids(model, values)
+        record_changes(model, {id: row["name"] for id, row in zip(ids, values)})
+        db.session.commit()
+        results += [{"index": start + i, "id": id, "status": "created"} for i, id in enumerate(ids)]
+    return results
+
+
+def bulk_update(model, rows):
+    validate(model, rows, "update")
+    results = []
+    for start, chunk in chunks(rows):
+        names = stored_names(model, [row["id"] for row in chunk])
+        found = set(names)
+        # executemany needs every row to carry the same keys, so group by key set
+        groups = {}
+        for row in stamp([dict(row) for row in chunk if row["id"] in found]):
+            groups.setdefault(tuple(sorted(row)), []).append(row)
+        count_updated(model, [row for row in chunk if row["id"] in found])
+        for group in groups.values():
+            db.session.execute(db.update(model), group, execution_options=RECORDED)
+        # only names that really change reach the documents (the last one wins for a repeated id)
+        renamed = {row["id"]: row["name"] for row in chunk if row["id"] in found and "name" in row}
+        renamed = {id: name for id, name in renamed.items() if name != names[id]}
+        rename_entities(model, renamed)
+        record_changes(model, renamed)
+        db.session.commit()
+        results += [{"index": start + i, "id": row["id"], "status": "updated" if row["id"] in found else "not_found"}
+                    for i, row in enumerate(chunk)]
+    return results
+
+
+def bulk_delete(model, rows):
+    validate(model, rows, "delete")
+    ids = [row if isinstance(row, int) else row["id"] for row in rows]
+    results = []
+    for start, chunk in chunks(ids):
+        found = existing_ids(model, chunk)
+        if found:
+            count_deleted(model, sorted(found))
+            db.session.execute(db.delete(model).where(model.id.in_(found)), execution_options=RECORDED)
+            record_changes(model, dict.fromkeys(found))
+            tombstones(model, sorted(found))
+        db.session.commit()
+        results += [{"index": start + i, "id": id, "status": "deleted" if id in found else "not_found"}
+                    for i, id in enumerate(chunk)]
+    return results
@@ -0,0 +1,103 @@
+"""
+Response compression negotiated through Accept-Encoding.
+
+Brotli is used when the brotli package is installed and the client prefers
+or accepts it; gzip otherwise. Bodies under COMPRESS_MIN_SIZE bytes and
+types that don't compress (anything but JSON, NDJSON and text) go out as
+they are. Streamed NDJSON is compressed on the fly and flushed every
+COMPRESS_STREAM_FLUSH bytes of input, so rows keep arriving while an
+export runs.
+
+Cached responses keep their compressed variants on the cache entry (see
+response_cache.CacheEntry.variant). They are compressed once, at higher
+levels, and served from there, so a hot payload is never compressed twice.
+"""
+import gzip
+import os
+import zlib
+
+from flask import request
+from werkzeug.datastructures import Accept
+from werkzeug.http import parse_accept_header
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+MIN_SIZE = int(os.getenv("COMPRESS_MIN_SIZE", 1024))
+GZIP_LEVEL = int(os.getenv("COMPRESS_GZIP_LEVEL", 6))
+BROTLI_QUALITY = int(os.getenv("COMPRESS_BROTLI_QUALITY", 4))
+STREAM_FLUSH = int(os.getenv("COMPRESS_STREAM_FLUSH", 64 * 1024))
+# cached variants are compressed once and sent many times, so they get more CPU
+CACHED_GZIP_LEVEL = 9
+CACHED_BROTLI_QUALITY = 9
+
+ENCODINGS = ("br", "gzip") if brotli is not None else ("gzip",)
+COMPRESSIBLE = ("application/json", "application/x-ndjson")
+# server-sent events have to reach the client as soon as they are written
+INCOMPRESSIBLE = ("text/event-stream",)
+
+
+def compressible(mimetype):
+    return mimetype not in INCOMPRESSIBLE and (mimetype in COMPRESSIBLE or mimetype.startswith("text/"))
+
+
+def negotiate(accept_encoding):
+    """Best encoding allowed by an Accept-Encoding header, or None for identity."""
+    if not accept_encoding:
+        return None
+    return parse_accept_header(accept_encoding, Accept).best_match(ENCODINGS)
+
+
+def compress(body, encoding, cached=False):
+    if encoding == "br":
+        return brotli.compress(body, quality=CACHED_BROTLI_QUALITY if cached else BROTLI_QUALITY)
+    return gzip.compress(body, compresslevel=CACHED_GZIP_LEVEL if cached else GZIP_LEVEL, mtime=0)
+
+
+def compress_stream(chunks, encoding):
+    if encoding == "br":
+        compressor = brotli.Compressor(quality=BROTLI_QUALITY)
+        process, flush, finish = compressor.process, compressor.flush, compressor.finish
+    else:
+        compressor = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+        process, finish = compressor.compress, compressor.flush
+        flush = lambda: compressor.flush(zlib.Z_SYNC_FLUSH)
+
+    pending = 0
+    for chunk in chunks:
+        data = process(chunk)
+        pending += len(chunk)
+        if pending >= STREAM_FLUSH:
+            data += flush()
+            pending = 0
+        if data:
+            yield data
+    yield finish()
+
+
+def init_app(app):
+    """Register before the other after_request hooks so compression runs last."""
+    @app.after_request
+    def compress_response(response):
+        if (response.status_code < 200 or response.status_code in (204, 206, 304)
+                or "Content-Encoding" in response.headers or response.direct_passthrough
+                or not compressible(response.mimetype)):
+            return response
+
+        response.vary.add("Accept-Encoding")
+        encoding = negotiate(request.headers.get("Accept-Encoding"))
+        if encoding is None:
+            return response
+
+        if response.is_streamed:
+            response.response = compress_stream(response.iter_encoded(), encoding)
+            response.headers.pop("Content-Length", None)
+        else:
+            body = response.get_data()
+            if len(body) < MIN_SIZE:
+                return response
+            response.set_data(compress(body, encoding))
+        response.headers["Content-Encoding"] = encoding
+        return response
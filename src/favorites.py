@@ -0,0 +1,159 @@
+"""
+Materialized favorites: one UserFavorites row per user holding the merged
+``all_favorites`` list, so reading a user's favorites is a primary-key
+lookup instead of a rebuild from the three favorite tables.
+
+The add/remove handlers patch the document in the same transaction that
+changes the favorite tables, bump its version and append the change to
+FavoriteChange, which lets clients ask only for what changed since the
+version they already have. A document is built from the favorite tables
+the first time a user is read or written.
+"""
+from sqlalchemy.exc import IntegrityError
+
+from models import db, User, UserFavorites, FavoriteChange, People, Planets, Vehicles, FavoritePeople, FavoritePlanet, FavoriteVehicle, load_favorites, favorite_entries
+from utils import APIException
+from stats import count_favorite
+
+# order of the groups inside all_favorites
+URLS = ("/people", "/planets", "/vehicles")
+
+KINDS = {
+    People: ("/people", FavoritePeople, FavoritePeople.people_id),
+    Planets: ("/planets", FavoritePlanet, FavoritePlanet.planet_id),
+    Vehicles: ("/vehicles", FavoriteVehicle, FavoriteVehicle.vehicle_id),
+}
+MODELS = {url: model for model, (url, favorite_model, column) in KINDS.items()}
+
+
+def build_document(user_id):
+    return UserFavorites(user_id=user_id, version=0, favorites=favorite_entries(*load_favorites(user_id)))
+
+
+def get_document(user_id, for_update=False):
+    """Return the user's document, materializing it on first use.
+
+    With ``for_update`` the row is locked until the end of the transaction
+    so concurrent writers for the same user apply their changes in turn.
+    """
+    query = db.select(UserFavorites).where(UserFavorites.user_id == user_id)
+    if for_update:
+        query = query.with_for_update()
+    document = db.session.scalars(query).first()
+    if document is not None:
+        return document
+
+    # build from and re-read on the primary: a lagging replica may miss the favorites or the row
+    # another request just inserted
+    db.session.info["wrote"] = True
+    document = build_document(user_id)
+    try:
+        with db.session.begin_nested():
+            db.session.add(document)
+    except IntegrityError:
+        # another request materialized it first, use theirs
+        document = db.session.scalars(query).one()
+    return document
+
+
+def insert_favorite(model, **values):
+    """Insert a favorite row unless the user already has it, in one statement.
+
+    Returns the new id, or None when the (user, entity) pair already
+    existed. Relies on the unique (user_id, entity_id) index, so it holds
+    under concurrent requests without a separate existence check.
+    """
+    dialect = db.session.get_bind().dialect.name
+    if dialect == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert
+    elif dialect == "sqlite":
+        from sqlalchemy.dialects.sqlite import insert
+    else:
+        try:
+            with db.session.begin_nested():
+                return db.session.scalar(db.insert(model).values(**values).returning(model.id))
+        except IntegrityError:
+            return None
+
+    return db.session.scalar(insert(model).values(**values).on_conflict_do_nothing().returning(model.id))
+
+
+def insert_entry(entries, entry):
+    group = URLS.index(entry["url"])
+    position = len(entries)
+    for index, other in enumerate(entries):
+        if URLS.index(other["url"]) > group:
+            position = index
+            break
+    return entries[:position] + [entry] + entries[position:]
+
+
+def record_change(document, action, entry):
+    """Apply an add/remove of ``entry`` ({name, id, url}) to ``document`` and log it."""
+    if action == "add":
+        favorites = insert_entry(document.favorites, entry)
+    else:
+        favorites = [other for other in document.favorites
+                     if not (other["url"] == entry["url"] and other["id"] == entry["id"])]
+
+    # assign a new list so the JSON column is flagged as changed
+    document.favorites = favorites
+    document.version += 1
+    db.session.add(FavoriteChange(user_id=document.user_id, version=document.version, action=action,
+                                  url=entry["url"], entity_id=entry["id"], name=entry["name"]))
+    count_favorite(MODELS[entry["url"]], entry["id"], 1 if action == "add" else -1)
+    return document
+
+
+def changes_since(user_id, version):
+    changes = db.session.scalars(
+        db.select(FavoriteChange)
+        .where(FavoriteChange.user_id == user_id, FavoriteChange.version > version)
+        .order_by(FavoriteChange.version)
+    )
+    return [change.serialize() for change in changes]
+
+
+def rename_entity(model, entity_id, name):
+    """Propagate a catalog rename into every document that lists the entity."""
+    rename_entities(model, {entity_id: name})
+
+
+def rename_entities(model, names):
+    """Propagate several renames ({entity id: new name}) with one lookup of the documents."""
+    if not names:
+        return
+    url, favorite_model, column = KINDS[model]
+    listed = {}
+    for user_id, entity_id in db.session.execute(
+        db.select(favorite_model.user_id, column).where(column.in_(list(names)))
+    ):
+        listed.setdefault(user_id, set()).add(entity_id)
+    if not listed:
+        return
+
+    documents = db.session.scalars(
+        db.select(UserFavorites).where(UserFavorites.user_id.in_(list(listed)))
+        .order_by(UserFavorites.user_id).with_for_update()
+    )
+    for document in documents:
+        for entity_id in sorted(listed[document.user_id]):
+            name = names[entity_id]
+            entry = {"name": name, "id": entity_id, "url": url}
+            favorites = [entry if other["url"] == url and other["id"] == entity_id else other for other in document.favorites]
+            if favorites != document.favorites:
+                document.favorites = favorites
+                document.version += 1
+                db.session.add(FavoriteChange(user_id=document.user_id, version=document.version, action="rename",
+                                              url=url, entity_id=entity_id, name=name))
+
+
+def read_document(user_id):
+    """Document for a read endpoint: one primary-key lookup once materialized."""
+    document = db.session.get(UserFavorites, user_id)
+    if document is None:
+        if db.session.get(User, user_id) is None:
+            raise APIException('User not found', status_code=404)
+        document = get_document(user_id)
+        db.session.commit()
+    return document
@@ -0,0 +1,53 @@
+"""
+JSON encoding for the app: orjson when it is installed, Flask's stdlib
+encoder otherwise (or with JSON_PROVIDER=stdlib).
+
+The orjson provider keeps what clients see from the default one: sorted
+keys, dates in Flask's HTTP date format, indented responses in debug mode.
+Responses are encoded straight to bytes instead of going through a str.
+Non-ASCII text comes out as UTF-8 rather than \\u escapes.
+"""
+import os
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+from profiling import TimedJSONProvider, serialize_timer
+
+
+class OrjsonProvider(TimedJSONProvider):
+    def options(self, indent=False):
+        # datetimes go through self.default so they keep Flask's format
+        option = orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_NON_STR_KEYS
+        if self.sort_keys:
+            option |= orjson.OPT_SORT_KEYS
+        if indent:
+            option |= orjson.OPT_INDENT_2
+        return option
+
+    def dumps(self, obj, **kwargs):
+        if kwargs:
+            # stdlib-only arguments such as indent or cls
+            return super().dumps(obj, **kwargs)
+        with serialize_timer():
+            return orjson.dumps(obj, default=self.default, option=self.options()).decode()
+
+    def loads(self, s, **kwargs):
+        if kwargs:
+            return super().loads(s, **kwargs)
+        return orjson.loads(s)
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        indent = self.compact is False or (self.compact is None and self._app.debug)
+        with serialize_timer():
+            body = orjson.dumps(obj, default=self.default, option=self.options(indent))
+        return self._app.response_class(body + b"\n", mimetype=self.mimetype)
+
+
+def create_json_provider(app):
+    if orjson is not None and os.getenv("JSON_PROVIDER", "orjson") != "stdlib":
+        return OrjsonProvider(app)
+    return TimedJSONProvider(app)
@@ -0,0 +1,213 @@
+"""
+Prometheus metrics in the text exposition format.
+
+Each process keeps its counters and fixed-bucket histograms in memory. When
+METRICS_DIR is set every worker also writes a snapshot to its own file
+there, at most once per METRICS_FLUSH_INTERVAL seconds, and /metrics adds up
+the files of all workers. gunicorn.conf.py sets it for every boot: it starts
+from an empty directory (a new temp dir unless METRICS_DIR is given) and
+renames the file of each worker that exits, so its counts keep adding up
+and a reused pid starts from a clean file. A single process (flask run,
+CLI commands) keeps its metrics in memory only.
+"""
+import atexit
+import glob
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+from flask import g, request
+
+from profiling import request_stats
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERY_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100, 250)
+HASH_BUCKETS = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5)
+
+
+def format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def format_labels(labels):
+    if not labels:
+        return ""
+    escaped = []
+    for name, value in labels:
+        value = str(value).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+        escaped.append('%s="%s"' % (name, value))
+    return "{" + ",".join(escaped) + "}"
+
+
+def dump(counters, histograms):
+    return {
+        "counters": [[name, labels, value] for (name, labels), value in counters.items()],
+        "histograms": [[name, labels, list(series[0]), series[1], series[2]]
+                       for (name, labels), series in histograms.items()],
+    }
+
+
+def merge(snapshots):
+    """Add up snapshots into ({(name, labels): value}, {(name, labels): [buckets, sum, count]})."""
+    counters, histograms = {}, {}
+    for snapshot in snapshots:
+        for name, labels, value in snapshot["counters"]:
+            key = (name, tuple(tuple(pair) for pair in labels))
+            counters[key] = counters.get(key, 0) + value
+        for name, labels, buckets, total, count in snapshot["histograms"]:
+            key = (name, tuple(tuple(pair) for pair in labels))
+            series = histograms.setdefault(key, [[0] * len(buckets), 0.0, 0])
+            series[0] = [a + b for a, b in zip(series[0], buckets)]
+            series[1] += total
+            series[2] += count
+    return counters, histograms
+
+
+def write(path, snapshot):
+    with open(path + ".tmp", "w") as f:
+        json.dump(snapshot, f)
+    os.replace(path + ".tmp", path)
+
+
+def clear(directory):
+    """Remove the snapshots of an earlier run (gunicorn on_starting)."""
+    os.makedirs(directory, exist_ok=True)
+    for path in glob.glob(os.path.join(directory, "metrics_*.json*")):
+        os.remove(path)
+
+
+def retire(directory, pid):
+    """Keep the snapshot of an exited worker under a name its pid can't reuse (gunicorn child_exit).
+
+    A rename, so /metrics never sees the numbers twice or not at all."""
+    path = os.path.join(directory, "metrics_%d.json" % pid)
+    if os.path.exists(path):
+        os.replace(path, os.path.join(directory, "metrics_exited_%d_%d.json" % (pid, time.time_ns())))
+
+
+class Metrics:
+    def __init__(self, directory=None, flush_interval=1.0):
+        self.directory = directory
+        self.flush_interval = flush_interval
+        self.definitions = {}
+        self.counters = {}
+        self.histograms = {}
+        self._lock = threading.Lock()
+        self._last_flush = 0.0
+
+    def counter(self, name, help):
+        self.definitions[name] = ("counter", help, None)
+
+    def histogram(self, name, help, buckets):
+        self.definitions[name] = ("histogram", help, tuple(buckets))
+
+    def inc(self, name, amount=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self.counters[key] = self.counters.get(key, 0) + amount
+
+    def observe(self, name, value, **labels):
+        buckets = self.definitions[name][2]
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            series = self.histograms.get(key)
+            if series is None:
+                series = self.histograms[key] = [[0] * len(buckets), 0.0, 0]
+            for i, bound in enumerate(buckets):
+                if value <= bound:
+                    series[0][i] += 1
+                    break
+            series[1] += value
+            series[2] += 1
+
+    @contextmanager
+    def timer(self, name, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start, **labels)
+
+    def snapshot(self):
+        with self._lock:
+            return dump(self.counters, self.histograms)
+
+    def flush(self, force=False):
+        if not self.directory or not (self.counters or self.histograms):
+            return
+        now = time.time()
+        if not force and now - self._last_flush < self.flush_interval:
+            return
+        self._last_flush = now
+        os.makedirs(self.directory, exist_ok=True)
+        write(os.path.join(self.directory, "metrics_%d.json" % os.getpid()), self.snapshot())
+
+    def collect(self):
+        """Merge this process with the snapshot files of every other worker."""
+        snapshots = [self.snapshot()]
+        if self.directory:
+            own = os.path.join(self.directory, "metrics_%d.json" % os.getpid())
+            for path in glob.glob(os.path.join(self.directory, "metrics_*.json")):
+                if path == own:
+                    continue
+                try:
+                    with open(path) as f:
+                        snapshots.append(json.load(f))
+                except (OSError, ValueError):
+                    continue  # a worker is rewriting it right now
+
+        return merge(snapshots)
+
+    def render(self):
+        counters, histograms = self.collect()
+        lines = []
+        for name, (kind, help, bounds) in sorted(self.definitions.items()):
+            lines.append("# HELP %s %s" % (name, help))
+            lines.append("# TYPE %s %s" % (name, kind))
+            if kind == "counter":
+                for (series_name, labels), value in sorted(counters.items()):
+                    if series_name == name:
+                        lines.append("%s%s %s" % (name, format_labels(labels), format_value(value)))
+                continue
+            for (series_name, labels), (buckets, total, count) in sorted(histograms.items()):
+                if series_name != name:
+                    continue
+                cumulative = 0
+                for bound, hits in zip(bounds + (float("inf"),), buckets + [count - sum(buckets)]):
+                    cumulative += hits
+                    lines.append("%s_bucket%s %d" % (name, format_labels(labels + (("le", format_value(bound)),)), cumulative))
+                lines.append("%s_sum%s %s" % (name, format_labels(labels), format_value(total)))
+                lines.append("%s_count%s %d" % (name, format_labels(labels), count))
+        return "\n".join(lines) + "\n"
+
+
+metrics = Metrics(os.getenv("METRICS_DIR"), float(os.getenv("METRICS_FLUSH_INTERVAL", 1)))
+metrics.counter("http_requests_total", "Requests handled, by Flask endpoint, method and status code.")
+metrics.histogram("http_request_duration_seconds", "Time until the response is returned, by Flask endpoint.", LATENCY_BUCKETS)
+metrics.histogram("db_queries_per_request", "SQL statements executed per request, by Flask endpoint.", QUERY_BUCKETS)
+metrics.histogram("bcrypt_duration_seconds", "Time spent hashing or checking passwords.", HASH_BUCKETS)
+metrics.counter("token_blocklist_lookups_total", "Token revocation checks, by where the answer came from.")
+metrics.counter("rate_limited_total", "Requests rejected with 429 by the rate limiter, by Flask endpoint.")
+atexit.register(metrics.flush, True)
+
+
+def init_app(app):
+    @app.before_request
+    def start_timer():
+        g.metrics_start = time.perf_counter()
+
+    @app.after_request
+    def record_request(response):
+        start = g.pop("metrics_start", None)
+        if start is None:
+            return response
+        endpoint = request.endpoint or "unmatched"
+        metrics.inc("http_requests_total", endpoint=endpoint, method=request.method, status=response.status_code)
+        metrics.observe("http_request_duration_seconds", time.perf_counter() - start, endpoint=endpoint)
+        metrics.observe("db_queries_per_request", request_stats()["sql_count"], endpoint=endpoint)
+        metrics.flush()
+        return response
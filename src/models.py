@@ -1,6 +1,10 @@
 from flask_sqlalchemy import SQLAlchemy
+from replicas import RoutingSession
 
-db = SQLAlchemy()
+db = SQLAlchemy(session_options={"class_": RoutingSession})
+
+# columnas de /sync en People, Planets y Vehicles: no forman parte de serialize()
+SYNC_COLUMNS = ("updated_at", "change_seq")
 
 class User(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -28,9 +32,11 @@ class People(db.Model):
     name = db.Column(db.String(120), unique=False, nullable=False)
     height = db.Column(db.Float, unique=False, nullable=False)
     birthdate = db.Column(db.String(80), unique=False, nullable=False)
-    gender = db.Column(db.String(80), unique=False, nullable=False)
-    eyes = db.Column(db.String(80), unique=False, nullable=False)
+    gender = db.Column(db.String(80), unique=False, nullable=False, index=True)
+    eyes = db.Column(db.String(80), unique=False, nullable=False, index=True)
     skin = db.Column(db.String(80), unique=False, nullable=False)
+    updated_at = db.Column(db.DateTime, nullable=True)
+    change_seq = db.Column(db.BigInteger, nullable=True, index=True)
     favorite_people = db.relationship('FavoritePeople', backref= 'people', lazy=True)
     
     def serialize(self):
@@ -46,30 +52,41 @@ class People(db.Model):
         }
     
 class FavoritePeople (db.Model):
+    # también sirve de índice para buscar por user_id
+    __table_args__ = (db.Index('ix_favorite_people_user_id_people_id', 'user_id', 'people_id', unique=True),)
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
-    people_id = db.Column(db.Integer, db.ForeignKey('people.id'), nullable=False)
+    people_id = db.Column(db.Integer, db.ForeignKey('people.id'), nullable=False, index=True)
 
     def serialize(self):
         return {
             "id": self.id,
             "people_id": self.people_id,
             "user_id": self.user_id,
-            "people_name": People.query.get(self.people_id).serialize()["name"],
-            "user_name": User.query.get(self.user_id).serialize()["name"],
-            "user":User.query.get(self.user_id).serialize(),
-            "people":People.query.get(self.people_id).serialize()
+            "people_name": self.people.name,
+            "user_name": self.user.name,
+            "user": self.user.serialize(),
+            "people": self.people.serialize()
         }
 
 class Planets(db.Model):
+    # (columna, id) para filtrar por rango y ordenar con cursor
+    __table_args__ = (
+        db.Index('ix_planets_orbital_period_id', 'orbital_period', 'id'),
+        db.Index('ix_planets_population_id', 'population', 'id'),
+        db.Index('ix_planets_diameter_id', 'diameter', 'id'),
+    )
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(120), unique=False, nullable=False)
     gravity = db.Column(db.String(80), unique=False, nullable=False)
-    terrain = db.Column(db.String(80), unique=False, nullable=False)
-    climate = db.Column(db.String(80), unique=False, nullable=False)
-    orbital_period = db.Column(db.String(80), unique=False, nullable=False)
-    population = db.Column(db.String(80), unique=False, nullable=False)
-    diameter = db.Column(db.String(80), unique=False, nullable=False)
+    terrain = db.Column(db.String(80), unique=False, nullable=False, index=True)
+    climate = db.Column(db.String(80), unique=False, nullable=False, index=True)
+    # None cuando el valor es "unknown"
+    orbital_period = db.Column(db.Float, nullable=True)
+    population = db.Column(db.BigInteger, nullable=True)
+    diameter = db.Column(db.Float, nullable=True)
+    updated_at = db.Column(db.DateTime, nullable=True)
+    change_seq = db.Column(db.BigInteger, nullable=True, index=True)
     favorite_planet = db.relationship('FavoritePlanet', backref= 'planets', lazy=True)
 
     def __repr__(self):
@@ -88,29 +105,40 @@ class Planets(db.Model):
         }
 
 class FavoritePlanet (db.Model):
+    # también sirve de índice para buscar por user_id
+    __table_args__ = (db.Index('ix_favorite_planet_user_id_planet_id', 'user_id', 'planet_id', unique=True),)
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
-    planet_id = db.Column(db.Integer, db.ForeignKey('planets.id'), nullable=False)
+    planet_id = db.Column(db.Integer, db.ForeignKey('planets.id'), nullable=False, index=True)
 
     def serialize(self):
         return {
             "id": self.id,
             "planet_id": self.planet_id,
             "user_id": self.user_id,
-            "planet_name": Planets.query.get(self.planet_id).serialize()["name"],
-            "user_name": User.query.get(self.user_id).serialize()["name"],
-            "user":User.query.get(self.user_id).serialize(),
-            "planet":Planets.query.get(self.planet_id).serialize()
+            "planet_name": self.planets.name,
+            "user_name": self.user.name,
+            "user": self.user.serialize(),
+            "planet": self.planets.serialize()
         }
 
 class Vehicles(db.Model):
+    # (columna, id) para filtrar por rango y ordenar con cursor
+    __table_args__ = (
+        db.Index('ix_vehicles_length_id', 'length', 'id'),
+        db.Index('ix_vehicles_max_speed_id', 'max_speed', 'id'),
+        db.Index('ix_vehicles_cargo_capacity_id', 'cargo_capacity', 'id'),
+    )
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(120), unique=False, nullable=False)
     model = db.Column(db.String(80), unique=False, nullable=False)
-    length = db.Column(db.String(80), unique=False, nullable=False)
-    max_speed = db.Column(db.String(80), unique=False, nullable=False)
-    cargo_capacity = db.Column(db.String(80), unique=False, nullable=False)
-    manufacturer = db.Column(db.String(80), unique=False, nullable=False)
+    # None cuando el valor es "unknown"
+    length = db.Column(db.Float, nullable=True)
+    max_speed = db.Column(db.Float, nullable=True)
+    cargo_capacity = db.Column(db.BigInteger, nullable=True)
+    manufacturer = db.Column(db.String(80), unique=False, nullable=False, index=True)
+    updated_at = db.Column(db.DateTime, nullable=True)
+    change_seq = db.Column(db.BigInteger, nullable=True, index=True)
     favorite_vehicle = db.relationship('FavoriteVehicle', backref= 'vehicles', lazy=True)
 
     def __repr__(self):
@@ -128,25 +156,88 @@ class Vehicles(db.Model):
         }
 
 class FavoriteVehicle (db.Model):
+    # también sirve de índice para buscar por user_id
+    __table_args__ = (db.Index('ix_favorite_vehicle_user_id_vehicle_id', 'user_id', 'vehicle_id', unique=True),)
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
-    vehicle_id = db.Column(db.Integer, db.ForeignKey('vehicles.id'), nullable=False)
+    vehicle_id = db.Column(db.Integer, db.ForeignKey('vehicles.id'), nullable=False, index=True)
 
     def serialize(self):
         return {
             "id": self.id,
             "vehicle_id": self.vehicle_id,
             "user_id": self.user_id,
-            "vehicle_name": Vehicles.query.get(self.vehicle_id).serialize()["name"],
-            "user_name": User.query.get(self.user_id).serialize()["name"],
-            "user":User.query.get(self.user_id).serialize(),
-            "vehicle":Vehicles.query.get(self.vehicle_id).serialize()
+            "vehicle_name": self.vehicles.name,
+            "user_name": self.user.name,
+            "user": self.user.serialize(),
+            "vehicle": self.vehicles.serialize()
+        }
+
+class UserFavorites(db.Model):
+    # all_favorites de cada usuario ya armado, lo mantienen los endpoints /favorite/*
+    __tablename__ = 'user_favorites'
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), primary_key=True)
+    version = db.Column(db.Integer, nullable=False, default=0)
+    favorites = db.Column(db.JSON, nullable=False, default=list)
+
+    def serialize(self):
+        return {
+            "user_id": self.user_id,
+            "version": self.version,
+            "all_favorites": self.favorites
         }
 
+class FavoriteChange(db.Model):
+    __tablename__ = 'favorite_change'
+    __table_args__ = (db.UniqueConstraint('user_id', 'version'),)
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    version = db.Column(db.Integer, nullable=False)
+    action = db.Column(db.String(10), nullable=False)
+    url = db.Column(db.String(20), nullable=False)
+    entity_id = db.Column(db.Integer, nullable=False)
+    name = db.Column(db.String(120), nullable=False)
+
+    def serialize(self):
+        return {
+            "version": self.version,
+            "action": self.action,
+            "url": self.url,
+            "id": self.entity_id,
+            "name": self.name
+        }
+
+def favorites_statements(user_id):
+    """Selects for a user's favorite people, planets and vehicles.
+
+    The user and the catalog row of every favorite are joined in eagerly so
+    ``serialize()`` never has to go back to the database.
+    """
+    return (
+        db.select(FavoritePeople).options(db.joinedload(FavoritePeople.user), db.joinedload(FavoritePeople.people))
+        .where(FavoritePeople.user_id == user_id).order_by(FavoritePeople.id),
+        db.select(FavoritePlanet).options(db.joinedload(FavoritePlanet.user), db.joinedload(FavoritePlanet.planets))
+        .where(FavoritePlanet.user_id == user_id).order_by(FavoritePlanet.id),
+        db.select(FavoriteVehicle).options(db.joinedload(FavoriteVehicle.user), db.joinedload(FavoriteVehicle.vehicles))
+        .where(FavoriteVehicle.user_id == user_id).order_by(FavoriteVehicle.id),
+    )
+
+def load_favorites(user_id):
+    """Return a user's favorite people, planets and vehicles in three queries."""
+    return tuple(db.session.scalars(statement).all() for statement in favorites_statements(user_id))
+
+def favorite_entries(favorite_people, favorite_planet, favorite_vehicle):
+    favorite_people = [{"name": item.people.name, "id": item.people_id, "url": "/people"} for item in favorite_people]
+    favorite_planet = [{"name": item.planets.name, "id": item.planet_id, "url": "/planets"} for item in favorite_planet]
+    favorite_vehicle = [{"name": item.vehicles.name, "id": item.vehicle_id, "url": "/vehicles"} for item in favorite_vehicle]
+
+    return favorite_people + favorite_planet + favorite_vehicle
+
 class TokenBlockedList(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     token = db.Column(db.String(250), unique=True, nullable=False)
     created_at = db.Column(db.DateTime, nullable=False)
+    expires_at = db.Column(db.DateTime, nullable=True, index=True)
     email = db.Column(db.String(50), unique=False)
 
     def serialize(self):
@@ -154,6 +245,31 @@ class TokenBlockedList(db.Model):
             "id":self.id,
             "token":self.token,
             "created":self.created_at,
+            "expires":self.expires_at,
             "email":self.email
         }
 
+class CatalogSequence(db.Model):
+    # un solo registro con el último número de cambio entregado; el UPDATE que lo
+    # incrementa lo deja bloqueado hasta el commit, así los números se confirman en orden
+    __tablename__ = 'catalog_sequence'
+    id = db.Column(db.Integer, primary_key=True)
+    value = db.Column(db.BigInteger, nullable=False, default=0)
+
+class CatalogTombstone(db.Model):
+    # filas borradas de people/planets/vehicles, para que /sync también las informe
+    __tablename__ = 'catalog_tombstone'
+    id = db.Column(db.Integer, primary_key=True)
+    table_name = db.Column(db.String(20), nullable=False)
+    entity_id = db.Column(db.Integer, nullable=False)
+    change_seq = db.Column(db.BigInteger, nullable=False, index=True)
+    deleted_at = db.Column(db.DateTime, nullable=False)
+
+class CatalogCount(db.Model):
+    # contadores de /stats: filas por valor de cada columna agrupada, los mantiene stats.py
+    __tablename__ = 'catalog_count'
+    __table_args__ = (db.Index('ix_catalog_count_table_name_dimension_count', 'table_name', 'dimension', 'count'),)
+    table_name = db.Column(db.String(20), primary_key=True)
+    dimension = db.Column(db.String(40), primary_key=True)
+    value = db.Column(db.String(120), primary_key=True)
+    count = db.Column(db.BigInteger, nullable=False, default=0)
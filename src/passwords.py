@@ -0,0 +1,163 @@
+"""
+Password hashing off the request worker.
+
+bcrypt costs ~100 ms of CPU per call, so hashing and verification run in a
+small process pool (PASSWORD_POOL_SIZE processes, 0 runs them inline). At
+most PASSWORD_CONCURRENCY operations run at once on the whole host, counted
+with lock files in PASSWORD_SLOT_DIR so every gunicorn worker shares the
+limit; it defaults to the number of workers (WEB_CONCURRENCY), one login in
+flight per worker. Up to PASSWORD_QUEUE_LIMIT more wait for a turn, for at
+most PASSWORD_QUEUE_TIMEOUT seconds. A request that finds the queue full, or
+whose wait runs out, is turned away with 503 and Retry-After, which keeps
+the catalog endpoints responsive during a login storm. A waiting request
+only holds one thread of its gthread worker (gunicorn.conf.py), so what the
+limits bound is the CPU bcrypt takes from the rest of the app; raise
+PASSWORD_CONCURRENCY together with PASSWORD_POOL_SIZE only when the host
+has cores to spare.
+BCRYPT_LOG_ROUNDS sets the work factor for new hashes.
+"""
+import os
+import random
+import tempfile
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, TimeoutError
+
+try:
+    import fcntl
+except ImportError:  # Windows: the limit falls back to one per process
+    fcntl = None
+
+import bcrypt
+
+from utils import APIException
+
+LOG_ROUNDS = int(os.getenv("BCRYPT_LOG_ROUNDS", 10))
+POOL_SIZE = int(os.getenv("PASSWORD_POOL_SIZE", 2))
+# one login in flight per gunicorn worker unless told otherwise
+CONCURRENCY = int(os.getenv("PASSWORD_CONCURRENCY", os.getenv("WEB_CONCURRENCY", 2)))
+QUEUE_LIMIT = int(os.getenv("PASSWORD_QUEUE_LIMIT", 32))
+QUEUE_TIMEOUT = float(os.getenv("PASSWORD_QUEUE_TIMEOUT", 5))
+TIMEOUT = float(os.getenv("PASSWORD_TIMEOUT", 10))
+SLOT_DIR = os.getenv("PASSWORD_SLOT_DIR", os.path.join(tempfile.gettempdir(), "swapi-password-slots"))
+RETRY_AFTER = 1
+# how often a waiting request tries the slots again
+POLL_INTERVAL = 0.01
+
+
+def _encode(password):
+    # bcrypt only ever looked at the first 72 bytes; newer releases raise instead
+    return password.encode("utf-8")[:72]
+
+
+def _hash(password, rounds):
+    return bcrypt.hashpw(_encode(password), bcrypt.gensalt(rounds)).decode("utf-8")
+
+
+def _check(hashed, password):
+    return bcrypt.checkpw(_encode(password), hashed.encode("utf-8"))
+
+
+class HostSlots:
+    """Semaphore shared by every process on the host: one flock'ed file per slot."""
+
+    def __init__(self, directory, count, name="slot"):
+        self.paths = [os.path.join(directory, "%s-%d.lock" % (name, i)) for i in range(count)]
+        if fcntl is None:
+            self._local = threading.BoundedSemaphore(count)
+        else:
+            os.makedirs(directory, exist_ok=True)
+
+    def try_acquire(self):
+        for path in random.sample(self.paths, len(self.paths)):
+            fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o600)
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                return fd
+            except BlockingIOError:
+                os.close(fd)
+        return None
+
+    def acquire(self, timeout=0):
+        """Return a token for release(), or None when no slot freed up within ``timeout`` seconds."""
+        if fcntl is None:
+            acquired = self._local.acquire(timeout=timeout) if timeout > 0 else self._local.acquire(blocking=False)
+            return True if acquired else None
+        # flock can't wait with a timeout, so poll
+        deadline = time.monotonic() + timeout
+        while True:
+            token = self.try_acquire()
+            if token is not None or time.monotonic() >= deadline:
+                return token
+            time.sleep(POLL_INTERVAL * random.uniform(0.5, 1.5))
+
+    def release(self, token):
+        if fcntl is None:
+            self._local.release()
+        else:
+            fcntl.flock(token, fcntl.LOCK_UN)
+            os.close(token)
+
+
+class PasswordPool:
+    def __init__(self, size, concurrency, queue_limit, timeout, queue_timeout=5, slot_dir=SLOT_DIR):
+        self.size = size
+        self.timeout = timeout
+        self.queue_timeout = queue_timeout
+        # admitted = running or waiting, running = holding one of the concurrency slots
+        self._admitted = HostSlots(slot_dir, concurrency + queue_limit, "queue")
+        self._running = HostSlots(slot_dir, concurrency)
+        self._executor = None
+        self._lock = threading.Lock()
+
+    def executor(self):
+        # created on first use so each gunicorn worker forks its own pool
+        with self._lock:
+            if self._executor is None:
+                self._executor = ProcessPoolExecutor(max_workers=self.size)
+            return self._executor
+
+    def run(self, fn, *args):
+        ticket = self._admitted.acquire()
+        if ticket is None:
+            raise APIException("Too many login requests, try again shortly", status_code=503,
+                               headers={"Retry-After": str(RETRY_AFTER)})
+        try:
+            slot = self._running.acquire(self.queue_timeout)
+            if slot is None:
+                raise APIException("Too many login requests, try again shortly", status_code=503,
+                                   headers={"Retry-After": str(RETRY_AFTER)})
+            try:
+                return self.call(fn, *args)
+            finally:
+                self._running.release(slot)
+        finally:
+            self._admitted.release(ticket)
+
+    def call(self, fn, *args):
+        if self.size <= 0:
+            return fn(*args)
+        try:
+            return self.executor().submit(fn, *args).result(timeout=self.timeout)
+        except TimeoutError:
+            raise APIException("Login is taking too long, try again shortly", status_code=503,
+                               headers={"Retry-After": str(RETRY_AFTER)})
+
+
+pool = PasswordPool(POOL_SIZE, CONCURRENCY, QUEUE_LIMIT, TIMEOUT, QUEUE_TIMEOUT)
+
+
+def hash_password(password):
+    return pool.run(_hash, password, LOG_ROUNDS)
+
+
+def check_password(hashed, password):
+    return pool.run(_check, hashed, password)
+
+
+def needs_rehash(hashed):
+    """True when ``hashed`` was made with a work factor other than BCRYPT_LOG_ROUNDS."""
+    try:
+        return int(hashed.split("$")[2]) != LOG_ROUNDS
+    except (IndexError, ValueError):
+        return True
@@ -0,0 +1,131 @@
+"""
+Connection pool settings and instrumentation.
+
+The pool is configured from DB_POOL_SIZE, DB_MAX_OVERFLOW, DB_POOL_TIMEOUT,
+DB_POOL_RECYCLE and DB_POOL_PRE_PING. Checkout wait times, connections in
+use, overflow and invalidations are counted per worker process so the pool
+can be sized against the number of gunicorn workers.
+"""
+import os
+import threading
+import time
+
+from sqlalchemy import event, exc
+from sqlalchemy.pool import QueuePool
+
+
+class PoolStats:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        self.connects = 0
+        self.checkouts = 0
+        self.checkins = 0
+        self.in_use = 0
+        self.max_in_use = 0
+        self.invalidations = 0
+        self.soft_invalidations = 0
+        self.timeouts = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+
+    def record_wait(self, seconds):
+        with self._lock:
+            self.wait_total += seconds
+            self.wait_max = max(self.wait_max, seconds)
+
+    def to_dict(self):
+        return {
+            "connects": self.connects,
+            "checkouts": self.checkouts,
+            "checkins": self.checkins,
+            "in_use": self.in_use,
+            "max_in_use": self.max_in_use,
+            "invalidations": self.invalidations,
+            "soft_invalidations": self.soft_invalidations,
+            "timeouts": self.timeouts,
+            "wait_total_ms": round(self.wait_total * 1000, 3),
+            "wait_avg_ms": round(self.wait_total * 1000 / self.checkouts, 3) if self.checkouts else 0,
+            "wait_max_ms": round(self.wait_max * 1000, 3),
+        }
+
+
+pool_stats = PoolStats()
+
+
+class TimedQueuePool(QueuePool):
+    """QueuePool that measures how long each checkout waits for a connection."""
+
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            return super()._do_get()
+        except exc.TimeoutError:
+            pool_stats.timeouts += 1
+            raise
+        finally:
+            pool_stats.record_wait(time.perf_counter() - start)
+
+
+@event.listens_for(TimedQueuePool, "connect")
+def on_connect(dbapi_connection, connection_record):
+    pool_stats.connects += 1
+
+
+@event.listens_for(TimedQueuePool, "checkout")
+def on_checkout(dbapi_connection, connection_record, connection_proxy):
+    with pool_stats._lock:
+        pool_stats.checkouts += 1
+        pool_stats.in_use += 1
+        pool_stats.max_in_use = max(pool_stats.max_in_use, pool_stats.in_use)
+
+
+@event.listens_for(TimedQueuePool, "checkin")
+def on_checkin(dbapi_connection, connection_record):
+    with pool_stats._lock:
+        pool_stats.checkins += 1
+        pool_stats.in_use = max(pool_stats.in_use - 1, 0)
+
+
+@event.listens_for(TimedQueuePool, "invalidate")
+def on_invalidate(dbapi_connection, connection_record, exception):
+    pool_stats.invalidations += 1
+
+
+@event.listens_for(TimedQueuePool, "soft_invalidate")
+def on_soft_invalidate(dbapi_connection, connection_record, exception):
+    pool_stats.soft_invalidations += 1
+
+
+def engine_options(database_url):
+    """SQLALCHEMY_ENGINE_OPTIONS for ``database_url`` built from the DB_POOL_* variables."""
+    options = {"pool_pre_ping": os.getenv("DB_POOL_PRE_PING", "true").lower() in ("1", "true", "yes")}
+    if ":memory:" in database_url:
+        # in-memory SQLite lives in a single connection, there is no pool to size
+        return options
+
+    options.update({
+        "poolclass": TimedQueuePool,
+        "pool_size": int(os.getenv("DB_POOL_SIZE", 5)),
+        "max_overflow": int(os.getenv("DB_MAX_OVERFLOW", 10)),
+        "pool_timeout": float(os.getenv("DB_POOL_TIMEOUT", 30)),
+        "pool_recycle": int(os.getenv("DB_POOL_RECYCLE", 1800)),
+    })
+    return options
+
+
+def pool_status(engine):
+    status = {"pid": os.getpid(), "stats": pool_stats.to_dict()}
+    pool = engine.pool
+    if isinstance(pool, QueuePool):
+        status.update({
+            "size": pool.size(),
+            "checked_out": pool.checkedout(),
+            "checked_in": pool.checkedin(),
+            "overflow": max(pool.overflow(), 0),
+            "max_overflow": pool._max_overflow,
+            "timeout": pool.timeout(),
+        })
+    return status
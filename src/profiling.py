@@ -0,0 +1,118 @@
+"""
+Per-request profiling.
+
+SQL statements and their time are counted for every request (two
+perf_counter calls per statement); the report itself is opt-in, either for
+every request with PROFILING=1 or per request with an ``X-Profile`` header
+sent from PROFILING_TRUSTED_IPS. Profiled responses carry a Server-Timing
+header with the SQL, serialization and total time, and a sample of them
+(PROFILING_SAMPLE_RATE, or ``X-Profile: cprofile``) is run under cProfile
+with the stats written to PROFILING_DIR.
+"""
+import cProfile
+import os
+import random
+import time
+from contextlib import contextmanager
+
+from flask import g, request, has_request_context
+from flask.json.provider import DefaultJSONProvider
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+
+@contextmanager
+def serialize_timer():
+    """Add the time spent in the block to the current request's serialization time."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        if has_request_context():
+            g.serialize_time = g.get("serialize_time", 0.0) + time.perf_counter() - start
+
+
+class TimedJSONProvider(DefaultJSONProvider):
+    """JSON provider that adds the time spent encoding to the current request."""
+
+    def dumps(self, obj, **kwargs):
+        with serialize_timer():
+            return super().dumps(obj, **kwargs)
+
+
+@event.listens_for(Engine, "before_cursor_execute")
+def start_query_timer(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("query_start", []).append(time.perf_counter())
+
+
+@event.listens_for(Engine, "after_cursor_execute")
+def stop_query_timer(conn, cursor, statement, parameters, context, executemany):
+    elapsed = time.perf_counter() - conn.info["query_start"].pop()
+    if has_request_context():
+        g.sql_count = g.get("sql_count", 0) + 1
+        g.sql_time = g.get("sql_time", 0.0) + elapsed
+
+
+def request_stats():
+    """SQL count/time and serialization time of the current request so far."""
+    return {
+        "sql_count": g.get("sql_count", 0),
+        "sql_time": g.get("sql_time", 0.0),
+        "serialize_time": g.get("serialize_time", 0.0),
+    }
+
+
+def profiling_requested():
+    if os.getenv("PROFILING", "0") == "1":
+        return True
+    if "X-Profile" not in request.headers:
+        return False
+    trusted = os.getenv("PROFILING_TRUSTED_IPS", "127.0.0.1").split(",")
+    return request.remote_addr in [ip.strip() for ip in trusted]
+
+
+def init_app(app):
+    if not isinstance(app.json, TimedJSONProvider):
+        app.json = TimedJSONProvider(app)
+    sample_rate = float(os.getenv("PROFILING_SAMPLE_RATE", 0))
+    profile_dir = os.getenv("PROFILING_DIR", "/tmp/profiles")
+
+    @app.before_request
+    def start_profiling():
+        g.request_start = time.perf_counter()
+        g.sql_count = 0
+        g.sql_time = 0.0
+        g.serialize_time = 0.0
+        g.profiling = profiling_requested()
+        if not g.profiling:
+            return
+        if request.headers.get("X-Profile") == "cprofile" or random.random() < sample_rate:
+            g.profiler = cProfile.Profile()
+            g.profiler.enable()
+
+    @app.after_request
+    def report_profiling(response):
+        if not g.get("profiling"):
+            return response
+
+        total = time.perf_counter() - g.request_start
+        stats = request_stats()
+        response.headers.add("Server-Timing", 'db;dur=%.2f;desc="%d queries"' % (stats["sql_time"] * 1000, stats["sql_count"]))
+        response.headers.add("Server-Timing", "serialize;dur=%.2f" % (stats["serialize_time"] * 1000))
+        response.headers.add("Server-Timing", "total;dur=%.2f" % (total * 1000))
+        size = None if response.is_streamed else response.calculate_content_length()
+        if size is not None:
+            response.headers["X-Response-Size"] = str(size)
+
+        profiler = g.pop("profiler", None)
+        if profiler is not None:
+            profiler.disable()
+            os.makedirs(profile_dir, exist_ok=True)
+            path = os.path.join(profile_dir, "%d-%s-%d.prof" % (time.time() * 1000, request.endpoint, os.getpid()))
+            profiler.dump_stats(path)
+            response.headers["X-Profile-File"] = os.path.basename(path)
+
+        app.logger.info("%s %s %d %.2fms sql=%d/%.2fms serialize=%.2fms size=%s", request.method, request.path,
+                        response.status_code, total * 1000, stats["sql_count"], stats["sql_time"] * 1000,
+                        stats["serialize_time"] * 1000, size)
+        return response
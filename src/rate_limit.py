@@ -0,0 +1,214 @@
+"""
+Per-route, per-client rate limits.
+
+Each request counts against ``<endpoint>:<identity>``, where the identity is
+the JWT ``sub`` when the request carries a valid token and the client IP
+otherwise (taken from X-Forwarded-For behind TRUSTED_PROXY_HOPS proxies). Limits come from @rate_limit("10/minute") on the view, or from
+RATE_LIMIT_DEFAULT for every other route (unset = unlimited).
+
+The counter is a sliding window: the hits of the current fixed window plus
+the previous window's hits weighted by how much of it still overlaps the
+last ``window`` seconds. That costs two integers per key, unlike a log of
+timestamps, and avoids the burst at window edges of a plain fixed window.
+Counters live in this process (RATE_LIMIT_BACKEND=memory) or in the shared
+store, so every gunicorn worker draws from the same quota (shared).
+
+Every limited response carries RateLimit-Limit, RateLimit-Remaining,
+RateLimit-Reset and RateLimit-Policy; rejected requests get a 429 with
+Retry-After.
+"""
+import math
+import os
+import threading
+import time
+
+from flask import g, request
+from flask_jwt_extended import get_jwt_identity, verify_jwt_in_request
+from flask_jwt_extended.exceptions import JWTExtendedException
+from jwt.exceptions import PyJWTError
+
+from shared_store import get_store
+from utils import APIException
+
+UNITS = {"second": 1, "minute": 60, "hour": 3600, "day": 86400}
+
+
+class Limit:
+    def __init__(self, count, window):
+        self.count = count
+        self.window = window
+
+    @classmethod
+    def parse(cls, spec):
+        """``"10/minute"``, ``"1000/hour"`` or ``"5/30s"``."""
+        count, _, period = spec.strip().partition("/")
+        if period in UNITS:
+            window = UNITS[period]
+        elif period.endswith("s") and period[:-1].isdigit():
+            window = int(period[:-1])
+        else:
+            raise ValueError("Invalid rate limit %r" % spec)
+        return cls(int(count), window)
+
+    def policy(self):
+        return "%d;w=%d" % (self.count, self.window)
+
+
+class MemoryBackend:
+    def __init__(self, maxsize=100000):
+        self.maxsize = maxsize
+        # key -> [window index, hits in the previous window, hits in the current one]
+        self._windows = {}
+        self._lock = threading.Lock()
+
+    def hit(self, key, window, now, amount=1):
+        """Add ``amount`` hits to the window holding ``now``; returns (previous, current)."""
+        index = int(now // window)
+        with self._lock:
+            entry = self._windows.get(key)
+            if entry is None or entry[0] < index - 1:
+                entry = self._windows[key] = [index, 0, 0]
+            elif entry[0] == index - 1:
+                entry[:] = [index, entry[2], 0]
+            entry[2] += amount
+            if len(self._windows) > self.maxsize:
+                self._prune(index)
+            return entry[1], entry[2]
+
+    def _prune(self, index):
+        # windows older than the previous one no longer count for anybody
+        for key in [key for key, entry in self._windows.items() if entry[0] < index - 1]:
+            del self._windows[key]
+
+
+class SharedBackend:
+    prefix = "ratelimit:"
+
+    def __init__(self, store):
+        self.store = store
+
+    def hit(self, key, window, now, amount=1):
+        index = int(now // window)
+        current_key = "%s%s:%d" % (self.prefix, key, index)
+        current = self.store.incr(current_key, amount)
+        if current == amount:
+            self.store.expire(current_key, window * 2)
+        previous = self.store.get("%s%s:%d" % (self.prefix, key, index - 1))
+        return int(previous or 0), current
+
+
+class Decision:
+    def __init__(self, limit, allowed, remaining, reset, retry_after):
+        self.limit = limit
+        self.allowed = allowed
+        self.remaining = remaining
+        self.reset = reset
+        self.retry_after = retry_after
+
+    def headers(self):
+        headers = {
+            "RateLimit-Limit": str(self.limit.count),
+            "RateLimit-Remaining": str(self.remaining),
+            "RateLimit-Reset": str(self.reset),
+            "RateLimit-Policy": self.limit.policy(),
+        }
+        if not self.allowed:
+            headers["Retry-After"] = str(self.retry_after)
+        return headers
+
+
+class RateLimiter:
+    def __init__(self, backend, clock=time.time):
+        self.backend = backend
+        self.clock = clock
+
+    def hit(self, key, limit):
+        now = self.clock()
+        window = limit.window
+        elapsed = now % window
+        previous, current = self.backend.hit(key, window, now)
+        used = previous * (window - elapsed) / window + current
+
+        allowed = used <= limit.count
+        if not allowed:
+            # rejected requests don't eat into the quota, so a client that backs off recovers
+            previous, current = self.backend.hit(key, window, now, -1)
+            used -= 1
+
+        retry_after = 0 if allowed else self.wait(limit, previous, current, elapsed)
+        remaining = max(int(limit.count - used), 0)
+        reset = max(retry_after, math.ceil(window - elapsed)) if remaining == 0 else math.ceil(window - elapsed)
+        return Decision(limit, allowed, remaining, reset, retry_after)
+
+    def wait(self, limit, previous, current, elapsed):
+        """Seconds until one more hit fits in the sliding window."""
+        window = limit.window
+        room = limit.count - 1
+        if current <= room:
+            # the previous window's share has to shrink until the hit fits
+            fade = window - elapsed - (room - current) * window / previous
+            return max(math.ceil(fade), 1)
+        # wait for the next window, where this one's hits become the fading share
+        return max(math.ceil(window - elapsed + window * (1 - room / current)), 1)
+
+
+def rate_limit(spec):
+    """Give a view its own limit; put it right under @app.route."""
+    def decorator(view):
+        view.rate_limit = Limit.parse(spec) if spec else None
+        return view
+    return decorator
+
+
+def client_identity():
+    if "Authorization" in request.headers:
+        try:
+            verify_jwt_in_request(optional=True)
+            user = get_jwt_identity()
+        except (JWTExtendedException, PyJWTError):
+            user = None
+        if user is not None:
+            return "user:%s" % user
+    return "ip:%s" % request.remote_addr
+
+
+def create_limiter():
+    """Build the limiter from RATE_LIMIT_BACKEND (memory|shared)."""
+    if os.getenv("RATE_LIMIT_BACKEND", "memory") == "shared":
+        return RateLimiter(SharedBackend(get_store()))
+    return RateLimiter(MemoryBackend(int(os.getenv("RATE_LIMIT_CACHE_SIZE", 100000))))
+
+
+limiter = create_limiter()
+DEFAULT_LIMIT = Limit.parse(os.getenv("RATE_LIMIT_DEFAULT")) if os.getenv("RATE_LIMIT_DEFAULT") else None
+ENABLED = os.getenv("RATE_LIMIT_ENABLED", "1") == "1"
+
+
+def check(endpoint, identity, limit, on_limited=None):
+    """Count a hit; raises a 429 APIException once ``limit`` is exceeded."""
+    decision = limiter.hit("%s:%s" % (endpoint, identity), limit)
+    if not decision.allowed:
+        if on_limited is not None:
+            on_limited(endpoint)
+        raise APIException("Too many requests", status_code=429, headers=decision.headers())
+    return decision
+
+
+def init_app(app, on_limited=None):
+    if not ENABLED:
+        return
+
+    @app.before_request
+    def apply_rate_limit():
+        view = app.view_functions.get(request.endpoint)
+        limit = getattr(view, "rate_limit", DEFAULT_LIMIT)
+        if limit is None or request.method == "OPTIONS":
+            return
+        g.rate_limit = check(request.endpoint, client_identity(), limit, on_limited)
+
+    @app.after_request
+    def rate_limit_headers(response):
+        decision = g.pop("rate_limit", None)
+        if decision is not None:
+            response.headers.update(decision.headers())
+        return response
@@ -0,0 +1,148 @@
+"""
+Read replicas for the GET endpoints.
+
+DATABASE_READ_URLS (comma separated) adds one engine per replica as an
+extra Flask-SQLAlchemy bind. Views decorated with @read_only run their
+plain SELECTs on a replica picked round-robin. Everything else goes to the
+primary: writes, SELECT ... FOR UPDATE, and every query of a request after
+it has written, so a request always reads its own writes.
+
+A replica whose connection fails is taken out of the rotation for
+DB_REPLICA_RETRY_INTERVAL seconds and the view is re-run on the next one,
+or on the primary when none is left. Once the interval has passed, the
+replica is pinged before it gets traffic again.
+
+Replicas are assumed to trail the primary by at most DB_REPLICA_MAX_LAG
+seconds. For that long after a commit invalidates a response cache group,
+@cached views fill the cache from the primary (g.read_primary), so a
+lagging replica can't put pre-write data back under a fresh ETag.
+"""
+import itertools
+import os
+import threading
+import time
+from functools import wraps
+
+from flask import current_app, g, has_app_context
+from flask_sqlalchemy.session import Session
+from sqlalchemy import event, exc
+from sqlalchemy.sql import Select
+
+READ_URLS = [url.strip() for url in os.getenv("DATABASE_READ_URLS", "").split(",") if url.strip()]
+RETRY_INTERVAL = float(os.getenv("DB_REPLICA_RETRY_INTERVAL", 30))
+MAX_LAG = float(os.getenv("DB_REPLICA_MAX_LAG", 5))
+
+
+class ReplicaSet:
+    def __init__(self, keys, retry_interval=30):
+        self.keys = list(keys)
+        self.retry_interval = retry_interval
+        self._down = {}
+        self._next = itertools.count()
+        self._lock = threading.Lock()
+
+    def __bool__(self):
+        return bool(self.keys)
+
+    def ping(self, engine):
+        try:
+            with engine.connect() as connection:
+                connection.exec_driver_sql("SELECT 1")
+            return True
+        except exc.DBAPIError:
+            return False
+
+    def choose(self, engines, exclude=()):
+        """Bind key of the next healthy replica, or None to use the primary."""
+        start = next(self._next)
+        for offset in range(len(self.keys)):
+            key = self.keys[(start + offset) % len(self.keys)]
+            if key in exclude:
+                continue
+            retry_at = self._down.get(key)
+            if retry_at is None:
+                return key
+            if retry_at <= time.monotonic():
+                if self.ping(engines[key]):
+                    self.mark_up(key)
+                    return key
+                self.mark_down(key)
+        return None
+
+    def mark_down(self, key):
+        with self._lock:
+            self._down[key] = time.monotonic() + self.retry_interval
+
+    def mark_up(self, key):
+        with self._lock:
+            self._down.pop(key, None)
+
+    def status(self):
+        now = time.monotonic()
+        return {key: "up" if self._down.get(key, now) <= now else "down" for key in self.keys}
+
+
+replicas = ReplicaSet(["replica%d" % index for index in range(len(READ_URLS))], RETRY_INTERVAL)
+
+
+class RoutingSession(Session):
+    """Flask-SQLAlchemy session that sends read-only SELECTs to the request's replica."""
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if (bind is None and isinstance(clause, Select) and clause._for_update_arg is None
+                and not self._flushing and not self.info.get("wrote") and has_app_context()):
+            key = g.get("read_replica")
+            if key is not None:
+                return self._db.engines[key]
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+
+@event.listens_for(RoutingSession, "after_flush")
+def stick_to_primary(session, flush_context):
+    session.info["wrote"] = True
+
+
+@event.listens_for(RoutingSession, "do_orm_execute")
+def stick_to_primary_on_dml(orm_execute_state):
+    if orm_execute_state.is_insert or orm_execute_state.is_update or orm_execute_state.is_delete:
+        orm_execute_state.session.info["wrote"] = True
+
+
+def read_only(view):
+    """Run ``view`` against a read replica when DATABASE_READ_URLS is set."""
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        if not replicas or g.get("read_primary"):
+            return view(*args, **kwargs)
+
+        db = current_app.extensions["sqlalchemy"]
+        tried = []
+        while True:
+            key = replicas.choose(db.engines, exclude=tried)
+            g.read_replica = key
+            try:
+                return view(*args, **kwargs)
+            except exc.OperationalError:
+                if key is None or db.session.info.get("wrote"):
+                    raise
+                # the replica went away mid-request, try the next one
+                replicas.mark_down(key)
+                db.session.rollback()
+                tried.append(key)
+    return wrapper
+
+
+def init_app(app, engine_options):
+    """Register the replicas as binds; call before db.init_app."""
+    binds = app.config.setdefault("SQLALCHEMY_BINDS", {})
+    for key, url in zip(replicas.keys, READ_URLS):
+        options = engine_options(url)
+        options.pop("poolclass", None)  # keep /_internal/pool about the primary
+        binds[key] = dict(options, url=url)
+
+    @app.before_request
+    def reset_routing():
+        # requests sharing an app context (tests, the CLI) must not inherit the previous one's routing
+        g.pop("read_replica", None)
+        g.pop("read_primary", None)
+        app.extensions["sqlalchemy"].session.info.pop("wrote", None)
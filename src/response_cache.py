@@ -0,0 +1,204 @@
+"""
+In-process cache for the catalog GET endpoints.
+
+Responses are keyed by path and query string and evicted LRU once the cache
+is full or after RESPONSE_CACHE_TTL seconds. Every entry carries a strong
+ETag so a matching If-None-Match is answered with 304 straight from the
+cache. Entries are grouped by table and dropped when a session that touched
+that table commits; other workers only see the change once their copy
+expires, so keep the TTL short. Behind read replicas an entry refilled
+right after an invalidation is read from the primary (see replicas.py), so
+the other workers are at most TTL + DB_REPLICA_MAX_LAG seconds behind.
+
+Compressed variants of an entry are built the first time a client asks for
+them and kept with it, each under its own ETag.
+"""
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict
+from functools import wraps
+from urllib.parse import urlencode
+
+from flask import g, request, make_response
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from compression import compress, compressible, negotiate, MIN_SIZE
+from replicas import MAX_LAG
+
+
+class CacheEntry:
+    def __init__(self, body, status, mimetype, etag, group, expires_at):
+        self.body = body
+        self.status = status
+        self.mimetype = mimetype
+        self.etag = etag
+        self.group = group
+        self.expires_at = expires_at
+        self.variants = {}
+
+    def variant(self, encoding):
+        body = self.variants.get(encoding)
+        if body is None:
+            # two requests racing here compress twice, the result is the same
+            body = self.variants[encoding] = compress(self.body, encoding, cached=True)
+        return body
+
+
+class ResponseCache:
+    def __init__(self, maxsize=512, ttl=30):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.not_modified = 0
+        self.invalidations = 0
+        self._entries = OrderedDict()
+        # group -> time of its last invalidation
+        self._invalidated = {}
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry.expires_at <= time.time():
+                self._entries.pop(key, None)
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry
+
+    def put(self, key, entry):
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, *groups):
+        with self._lock:
+            now = time.time()
+            for group in groups:
+                self._invalidated[group] = now
+            stale = [key for key, entry in self._entries.items() if entry.group in groups]
+            for key in stale:
+                del self._entries[key]
+            self.invalidations += len(stale)
+
+    def invalidated_at(self, group):
+        return self._invalidated.get(group, 0)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        return {
+            "entries": len(self._entries),
+            "maxsize": self.maxsize,
+            "ttl": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "not_modified": self.not_modified,
+            "invalidations": self.invalidations,
+        }
+
+
+response_cache = ResponseCache(
+    maxsize=int(os.getenv("RESPONSE_CACHE_SIZE", 512)),
+    ttl=int(os.getenv("RESPONSE_CACHE_TTL", 30)),
+)
+
+
+def cache_key():
+    return request.path + "?" + urlencode(sorted(request.args.items(multi=True)))
+
+
+def entry_response(entry):
+    encoding = None
+    if compressible(entry.mimetype) and len(entry.body) >= MIN_SIZE:
+        encoding = negotiate(request.headers.get("Accept-Encoding"))
+    etag = entry.etag if encoding is None else "%s-%s" % (entry.etag, encoding)
+
+    if etag in request.if_none_match:
+        response_cache.not_modified += 1
+        response = make_response("", 304)
+    elif encoding is None:
+        response = make_response(entry.body, entry.status)
+        response.mimetype = entry.mimetype
+    else:
+        response = make_response(entry.variant(encoding), entry.status)
+        response.mimetype = entry.mimetype
+        response.headers["Content-Encoding"] = encoding
+    response.set_etag(etag)
+    if compressible(entry.mimetype):
+        response.vary.add("Accept-Encoding")
+    return response
+
+
+def cached(group):
+    """Serve a GET view from the response cache; ``group`` is the table it reads."""
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            if request.args.get("format") == "ndjson":
+                return view(*args, **kwargs)
+
+            key = cache_key()
+            entry = response_cache.get(key)
+            if entry is not None:
+                response = entry_response(entry)
+                response.headers["X-Cache"] = "HIT"
+                return response
+
+            invalidated_at = response_cache.invalidated_at(group)
+            # a replica may not have the write behind the invalidation yet
+            g.read_primary = time.time() - invalidated_at < MAX_LAG
+            response = make_response(view(*args, **kwargs))
+            if response.status_code != 200 or response.is_streamed:
+                return response
+
+            body = response.get_data()
+            etag = hashlib.sha1(body).hexdigest()
+            entry = CacheEntry(body, response.status_code, response.mimetype, etag, group,
+                               time.time() + response_cache.ttl)
+            # not if a commit landed while the view ran: its data may predate it
+            if response_cache.invalidated_at(group) == invalidated_at:
+                response_cache.put(key, entry)
+
+            response = entry_response(entry)
+            response.headers["X-Cache"] = "MISS"
+            return response
+        return wrapper
+    return decorator
+
+
+@event.listens_for(Session, "after_flush")
+def remember_touched_tables(session, flush_context):
+    touched = session.info.setdefault("cache_groups", set())
+    for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+        touched.add(obj.__tablename__)
+
+
+@event.listens_for(Session, "do_orm_execute")
+def remember_bulk_tables(orm_execute_state):
+    # bulk insert/update/delete statements never show up in session.new/dirty/deleted
+    if orm_execute_state.is_insert or orm_execute_state.is_update or orm_execute_state.is_delete:
+        mapper = orm_execute_state.bind_mapper
+        if mapper is not None:
+            orm_execute_state.session.info.setdefault("cache_groups", set()).add(mapper.local_table.name)
+
+
+@event.listens_for(Session, "after_commit")
+def invalidate_touched_tables(session):
+    touched = session.info.pop("cache_groups", None)
+    if touched:
+        response_cache.invalidate(*touched)
+
+
+@event.listens_for(Session, "after_rollback")
+def forget_touched_tables(session):
+    session.info.pop("cache_groups", None)
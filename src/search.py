@@ -0,0 +1,293 @@
+"""
+Name search across People, Planets and Vehicles for GET /search.
+
+On PostgreSQL one UNION ALL query ranks the three tables with ts_rank over
+to_tsvector('simple', name) plus trigram similarity; both are served by the
+GIN indexes created in migration 3c5e0f7a9b21. Every other database uses an
+in-process inverted index: a sorted token list answers prefix lookups by
+bisection and a multi-term query walks only the postings of its rarest term,
+so a search costs in proportion to what it matches, not to the catalog size.
+The index is built on the first search and patched when a write commits:
+ORM writes are picked up from session events, the bulk endpoints record
+their rows with record_changes() like they do for /stats. Every
+SEARCH_INDEX_TTL seconds (so other workers' writes show up) and after a
+bulk statement nobody recorded, it is rebuilt in a background thread while
+searches keep using the current one.
+
+Every term of ``q`` must match a word of the name, as a whole word or a
+prefix. Results are ranked by how much of each word the terms cover, with a
+bonus when the name starts with the query; pages are walked with an offset
+cursor since a ranking has no stable key to seek on.
+"""
+import heapq
+import os
+import re
+import threading
+import time
+from bisect import bisect_left, insort
+
+from flask import current_app
+from sqlalchemy import event, func, literal, or_, union_all
+from sqlalchemy.orm import Session
+
+from models import db, People, Planets, Vehicles
+from utils import APIException, int_arg, DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE
+
+SEARCHABLE = {
+    "/people": People,
+    "/planets": Planets,
+    "/vehicles": Vehicles,
+}
+URLS = {model: url for url, model in SEARCHABLE.items()}
+
+INDEX_TTL = int(os.getenv("SEARCH_INDEX_TTL", 300))
+# execution option of bulk statements whose rows went through record_changes()
+RECORDED = {"search_recorded": True}
+
+TOKEN = re.compile(r"\w+")
+
+
+def tokenize(text):
+    return TOKEN.findall(text.lower())
+
+
+class NameIndex:
+    """Inverted index of catalog names keyed by (url, id)."""
+
+    def __init__(self, ttl=300):
+        self.ttl = ttl
+        self.built_at = None
+        self.stale = False
+        self._rebuilding = False
+        self._names = {}
+        self._postings = {}
+        self._tokens = []
+        # changes committed while a build reads the tables, replayed on its result
+        self._pending = []
+        self._lock = threading.Lock()
+
+    def _add(self, key, name):
+        self._names[key] = name
+        for token in set(tokenize(name)):
+            keys = self._postings.get(token)
+            if keys is None:
+                keys = self._postings[token] = set()
+                insort(self._tokens, token)
+            keys.add(key)
+
+    def _remove(self, key):
+        name = self._names.pop(key, None)
+        if name is None:
+            return
+        for token in set(tokenize(name)):
+            keys = self._postings[token]
+            keys.discard(key)
+            if not keys:
+                del self._postings[token]
+                del self._tokens[bisect_left(self._tokens, token)]
+
+    def _patch(self, changes):
+        for key, name in changes.items():
+            self._remove(key)
+            if name is not None:
+                self._add(key, name)
+
+    def apply(self, changes):
+        """Apply committed writes: ``changes`` maps (url, id) to the new name or None when deleted."""
+        with self._lock:
+            for pending in self._pending:
+                pending.update(changes)
+            if self.built_at is not None:
+                self._patch(changes)
+
+    def invalidate(self):
+        self.stale = True
+
+    def ensure_built(self):
+        if self.built_at is None:
+            # nothing to serve yet
+            self.build()
+        elif self.stale or time.time() - self.built_at >= self.ttl:
+            self.rebuild_in_background()
+
+    def build(self):
+        pending = {}
+        with self._lock:
+            self.stale = False
+            self._pending.append(pending)
+        try:
+            # built aside, searches keep using the current index meanwhile
+            fresh = NameIndex()
+            for url, model in SEARCHABLE.items():
+                for id, name in db.session.execute(db.select(model.id, model.name)):
+                    fresh._add((url, id), name)
+        except Exception:
+            with self._lock:
+                self._pending.remove(pending)
+            raise
+
+        with self._lock:
+            self._pending.remove(pending)
+            # commits that landed while we were reading
+            fresh._patch(pending)
+            self._names, self._postings, self._tokens = fresh._names, fresh._postings, fresh._tokens
+            self.built_at = time.time()
+
+    def rebuild_in_background(self):
+        with self._lock:
+            if self._rebuilding:
+                return
+            self._rebuilding = True
+        threading.Thread(target=self._rebuild, args=(current_app._get_current_object(),),
+                         name="search-index", daemon=True).start()
+
+    def _rebuild(self, app):
+        try:
+            with app.app_context():
+                try:
+                    self.build()
+                except Exception:
+                    app.logger.exception("Search index rebuild failed")
+                finally:
+                    db.session.remove()
+        finally:
+            self._rebuilding = False
+
+    def _span(self, term):
+        # tokens starting with term sit together in the sorted list
+        return bisect_left(self._tokens, term), bisect_left(self._tokens, term + "\uffff")
+
+    def _matches(self, term):
+        """Keys whose name has a word starting with ``term``, scored by how much of the word it covers."""
+        scores = {}
+        start, end = self._span(term)
+        for token in self._tokens[start:end]:
+            score = len(term) / len(token)
+            for key in self._postings[token]:
+                if score > scores.get(key, 0):
+                    scores[key] = score
+        return scores
+
+    def _selectivity(self, term):
+        start, end = self._span(term)
+        return sum(len(self._postings[token]) for token in self._tokens[start:end])
+
+    def search(self, query, count):
+        """The best ``count`` (score, url, id, name) matching all terms of ``query``."""
+        self.ensure_built()
+        terms = tokenize(query)
+        with self._lock:
+            # walk the postings of the rarest term only and check the others against its names
+            terms = sorted(set(terms), key=self._selectivity)
+            scores = self._matches(terms[0])
+            for term in terms[1:]:
+                narrowed = {}
+                for key, score in scores.items():
+                    best = max((len(term) / len(word) for word in tokenize(self._names[key]) if word.startswith(term)), default=0)
+                    if best:
+                        narrowed[key] = score + best
+                scores = narrowed
+            names = {key: self._names[key] for key in scores}
+
+        query = " ".join(tokenize(query))
+        results = []
+        for key, score in scores.items():
+            name = names[key]
+            if name.lower().startswith(query):
+                score += 1
+            results.append((score, key[0], key[1], name))
+        order = list(SEARCHABLE)
+        return heapq.nsmallest(count, results, key=lambda result: (-result[0], len(result[3]), order.index(result[1]), result[2]))
+
+
+name_index = NameIndex(ttl=INDEX_TTL)
+
+
+def postgres_search(terms, offset, limit):
+    query = " ".join(terms)
+    tsquery = func.to_tsquery("simple", " & ".join(term + ":*" for term in terms))
+    selects = []
+    for url, model in SEARCHABLE.items():
+        vector = func.to_tsvector("simple", model.name)
+        rank = func.ts_rank(vector, tsquery) + func.similarity(func.lower(model.name), query)
+        selects.append(
+            db.select(rank.label("rank"), literal(url).label("url"), model.id, model.name)
+            .where(or_(vector.op("@@")(tsquery), func.lower(model.name).op("%")(query)))
+        )
+    ranked = union_all(*selects).subquery()
+    statement = (
+        db.select(ranked)
+        .order_by(ranked.c.rank.desc(), func.length(ranked.c.name), ranked.c.url, ranked.c.id)
+        .offset(offset)
+        .limit(limit + 1)
+    )
+    return [tuple(row) for row in db.session.execute(statement)]
+
+
+def search(args):
+    """One page of results for ``args["q"]`` plus the cursor of the next page."""
+    query = args.get("q", "")
+    terms = tokenize(query)
+    if not terms:
+        raise APIException("You need to specify the q parameter", status_code=400)
+    limit = int_arg(args, "limit", DEFAULT_PAGE_SIZE, minimum=1, maximum=MAX_PAGE_SIZE)
+    offset = int_arg(args, "cursor", 0, minimum=0)
+
+    if db.session.get_bind().dialect.name == "postgresql":
+        results = postgres_search(terms, offset, limit)
+    else:
+        results = name_index.search(query, offset + limit + 1)[offset:]
+
+    next_cursor = None
+    if len(results) > limit:
+        results = results[:limit]
+        next_cursor = str(offset + limit)
+
+    page = [{"name": name, "id": id, "url": url, "rank": round(float(rank), 4)} for rank, url, id, name in results]
+    return page, next_cursor
+
+
+@event.listens_for(Session, "after_flush")
+def remember_renamed(session, flush_context):
+    changes = session.info.setdefault("search_changes", {})
+    for obj in list(session.new) + list(session.dirty):
+        url = URLS.get(type(obj))
+        if url is not None:
+            changes[(url, obj.id)] = obj.name
+    for obj in session.deleted:
+        url = URLS.get(type(obj))
+        if url is not None:
+            changes[(url, obj.id)] = None
+
+
+def record_changes(model, names):
+    """Bulk endpoints: ``names`` maps the ids a RECORDED statement wrote to their name (None = deleted)."""
+    url = URLS[model]
+    changes = db.session.info.setdefault("search_changes", {})
+    for id, name in names.items():
+        changes[(url, id)] = name
+
+
+@event.listens_for(Session, "do_orm_execute")
+def remember_bulk_writes(orm_execute_state):
+    # other bulk statements don't say which rows they touched, rebuild from the tables instead
+    if orm_execute_state.is_insert or orm_execute_state.is_update or orm_execute_state.is_delete:
+        mapper = orm_execute_state.bind_mapper
+        if (mapper is not None and mapper.class_ in URLS
+                and not orm_execute_state.execution_options.get("search_recorded")):
+            orm_execute_state.session.info["search_rebuild"] = True
+
+
+@event.listens_for(Session, "after_commit")
+def apply_committed(session):
+    changes = session.info.pop("search_changes", None)
+    if changes:
+        name_index.apply(changes)
+    if session.info.pop("search_rebuild", False):
+        name_index.invalidate()
+
+
+@event.listens_for(Session, "after_rollback")
+def forget_uncommitted(session):
+    session.info.pop("search_changes", None)
+    session.info.pop("search_rebuild", None)
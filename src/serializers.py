@@ -0,0 +1,57 @@
+"""
+Column-driven serialization for the read-only catalog lists.
+
+Instead of loading ORM objects and calling serialize() on each one, the list
+endpoints select the model's columns and zip every result row with the
+column names. That skips object hydration, the identity map and attribute
+instrumentation. For People, Planets and Vehicles serialize() returns
+exactly their columns, so the output is the same.
+"""
+from functools import lru_cache
+
+from flask import Response, current_app, stream_with_context
+
+from models import db, SYNC_COLUMNS
+from utils import apply_filters, keyset_query, split_page, int_arg, STREAM_BATCH_SIZE
+
+
+@lru_cache(maxsize=None)
+def row_columns(model):
+    """(names, column attributes) of ``model`` in mapper order, without the sync columns."""
+    names = tuple(prop.key for prop in db.inspect(model).column_attrs if prop.key not in SYNC_COLUMNS)
+    return names, tuple(getattr(model, name) for name in names)
+
+
+def serialize_rows(names, rows):
+    return [dict(zip(names, row)) for row in rows]
+
+
+def row_page(model, args, filters=(), ranges=()):
+    """keyset_page for a whole model, serialized straight from the result rows."""
+    names, columns = row_columns(model)
+    statement, limit, sort = keyset_query(db.select(*columns), model, args, filters, ranges)
+    rows, next_cursor = split_page(db.session.execute(statement).all(), limit, sort)
+    return serialize_rows(names, rows), next_cursor
+
+
+def ndjson_response(model, args, filters=(), ranges=()):
+    """Stream every matching row as one JSON document per line.
+
+    Rows are read through a server-side cursor in batches of
+    ``STREAM_BATCH_SIZE`` and written out as they arrive, so memory use and
+    time to first byte do not depend on the size of the table.
+    """
+    cursor = int_arg(args, "cursor", minimum=0)
+    names, columns = row_columns(model)
+
+    statement = apply_filters(db.select(*columns), model, args, filters, ranges)
+    if cursor is not None:
+        statement = statement.filter(model.id > cursor)
+    statement = statement.order_by(model.id).execution_options(yield_per=STREAM_BATCH_SIZE)
+
+    def generate():
+        dumps = current_app.json.dumps
+        for row in db.session.execute(statement):
+            yield dumps(dict(zip(names, row))) + "\n"
+
+    return Response(stream_with_context(generate()), mimetype="application/x-ndjson")
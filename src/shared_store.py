@@ -0,0 +1,145 @@
+"""
+Key/value store shared by every gunicorn worker.
+
+REDIS_URL points at a Redis server. The special value ``local://`` gives an
+in-process stand-in with the same interface, which is what the tests and a
+single-process development server use.
+"""
+import fnmatch
+import os
+import queue
+import threading
+import time
+
+_stores = {}
+_lock = threading.Lock()
+
+
+class LocalStore:
+    """The subset of the redis-py client API used by this app, kept in memory."""
+
+    def __init__(self):
+        self._data = {}
+        self._expires = {}
+        self._subscribers = []
+        self._lock = threading.RLock()
+
+    def _alive(self, name):
+        expires = self._expires.get(name)
+        if expires is not None and expires <= time.time():
+            self._data.pop(name, None)
+            self._expires.pop(name, None)
+        return name in self._data
+
+    def get(self, name):
+        with self._lock:
+            return self._data.get(name) if self._alive(name) else None
+
+    def set(self, name, value, ex=None, nx=False):
+        with self._lock:
+            if nx and self._alive(name):
+                return None
+            self._data[name] = str(value).encode() if not isinstance(value, bytes) else value
+            if ex is not None:
+                self._expires[name] = time.time() + ex
+            else:
+                self._expires.pop(name, None)
+            return True
+
+    def incr(self, name, amount=1):
+        with self._lock:
+            value = (int(self._data[name]) if self._alive(name) else 0) + amount
+            self._data[name] = str(value).encode()
+            return value
+
+    def expire(self, name, seconds):
+        with self._lock:
+            if not self._alive(name):
+                return False
+            self._expires[name] = time.time() + seconds
+            return True
+
+    def exists(self, *names):
+        with self._lock:
+            return sum(1 for name in names if self._alive(name))
+
+    def delete(self, *names):
+        with self._lock:
+            removed = 0
+            for name in names:
+                if self._alive(name):
+                    removed += 1
+                self._data.pop(name, None)
+                self._expires.pop(name, None)
+            return removed
+
+    def publish(self, channel, message):
+        channel = channel.encode() if isinstance(channel, str) else channel
+        message = message.encode() if isinstance(message, str) else message
+        with self._lock:
+            subscribers = list(self._subscribers)
+        return sum(subscriber.deliver(channel, message) for subscriber in subscribers)
+
+    def pubsub(self, ignore_subscribe_messages=False):
+        return LocalPubSub(self)
+
+
+class LocalPubSub:
+    """redis-py's PubSub for LocalStore: (p)subscribe, get_message, listen, close."""
+
+    def __init__(self, store):
+        self.store = store
+        self.channels = set()
+        self.patterns = set()
+        self._messages = queue.Queue()
+
+    def subscribe(self, *channels):
+        self.channels.update(channel.encode() if isinstance(channel, str) else channel for channel in channels)
+        self._register()
+
+    def psubscribe(self, *patterns):
+        self.patterns.update(pattern.encode() if isinstance(pattern, str) else pattern for pattern in patterns)
+        self._register()
+
+    def _register(self):
+        with self.store._lock:
+            if self not in self.store._subscribers:
+                self.store._subscribers.append(self)
+
+    def deliver(self, channel, data):
+        if channel in self.channels:
+            self._messages.put({"type": "message", "pattern": None, "channel": channel, "data": data})
+            return 1
+        for pattern in self.patterns:
+            if fnmatch.fnmatchcase(channel.decode(), pattern.decode()):
+                self._messages.put({"type": "pmessage", "pattern": pattern, "channel": channel, "data": data})
+                return 1
+        return 0
+
+    def get_message(self, timeout=0.0):
+        try:
+            return self._messages.get(timeout=timeout) if timeout else self._messages.get_nowait()
+        except queue.Empty:
+            return None
+
+    def listen(self):
+        while True:
+            yield self._messages.get()
+
+    def close(self):
+        with self.store._lock:
+            if self in self.store._subscribers:
+                self.store._subscribers.remove(self)
+
+
+def get_store(url=None):
+    """Return the client for ``url`` (REDIS_URL by default), one per process."""
+    url = url or os.getenv("REDIS_URL", "local://")
+    with _lock:
+        if url not in _stores:
+            if url.startswith("local://"):
+                _stores[url] = LocalStore()
+            else:
+                import redis  # only needed when a real Redis server is configured
+                _stores[url] = redis.Redis.from_url(url)
+        return _stores[url]
@@ -0,0 +1,284 @@
+"""
+Catalog aggregates: ``GET /stats/<collection>`` and ``GET /stats/<collection>/favorites``.
+
+Counts live in the CatalogCount table, one row per (table, grouped column,
+value), and are kept up to date by the writes themselves: every insert,
+update or delete of a People, Planets or Vehicles row and every favorite
+added or removed applies its +1/-1 in the same transaction. Favorites are
+counted per entity (for the top-N) and per grouped column of the entity
+("vehicle favorites by manufacturer"); when an entity moves to another
+group its favorites move with it. A stats request therefore reads a
+handful of rows of a small table and never scans the catalog.
+
+ORM changes are counted from a before_flush hook; the bulk endpoints and
+the favorite handlers call count_* themselves, like sync.stamp. ``flask
+rebuild-stats`` recomputes everything with GROUP BY over the indexed
+columns, for databases created with db.create_all() or after a drift.
+"""
+from collections import defaultdict
+
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from models import db, CatalogCount, People, Planets, Vehicles, FavoritePeople, FavoritePlanet, FavoriteVehicle
+from utils import APIException, int_arg, DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE
+
+# columnas agrupadas (todas con índice) de cada colección
+GROUPS = {
+    People: ("gender", "eyes"),
+    Planets: ("climate", "terrain"),
+    Vehicles: ("manufacturer",),
+}
+FAVORITES = {
+    People: (FavoritePeople, FavoritePeople.people_id),
+    Planets: (FavoritePlanet, FavoritePlanet.planet_id),
+    Vehicles: (FavoriteVehicle, FavoriteVehicle.vehicle_id),
+}
+COLLECTIONS = {"people": People, "planets": Planets, "vehicles": Vehicles}
+TOP = 10
+
+
+def favorite_key(model, entity_id):
+    favorite, column = FAVORITES[model]
+    return (favorite.__tablename__, column.key, str(entity_id))
+
+
+def add_entity(deltas, model, values, amount, favorites=0):
+    """Count (or with a negative ``amount``, uncount) one entity and its ``favorites``."""
+    favorite_table = FAVORITES[model][0].__tablename__
+    for column in GROUPS[model]:
+        deltas[(model.__tablename__, column, values[column])] += amount
+        if favorites:
+            deltas[(favorite_table, column, values[column])] += amount * favorites
+
+
+def favorite_counts(model, ids):
+    """{entity id: number of favorites} from the counters."""
+    if not ids:
+        return {}
+    favorite, column = FAVORITES[model]
+    rows = db.session.execute(
+        db.select(CatalogCount.value, CatalogCount.count)
+        .where(CatalogCount.table_name == favorite.__tablename__, CatalogCount.dimension == column.key,
+               CatalogCount.value.in_([str(id) for id in ids]))
+    )
+    return {int(value): count for value, count in rows}
+
+
+def apply(deltas):
+    """Add ``deltas`` ({(table_name, dimension, value): amount}) to the counters."""
+    rows = [{"table_name": table_name, "dimension": dimension, "value": str(value), "count": amount}
+            for (table_name, dimension, value), amount in sorted(deltas.items()) if amount]
+    if not rows:
+        return
+
+    dialect = db.session.get_bind().dialect.name
+    if dialect in ("postgresql", "sqlite"):
+        if dialect == "postgresql":
+            from sqlalchemy.dialects.postgresql import insert
+        else:
+            from sqlalchemy.dialects.sqlite import insert
+        statement = insert(CatalogCount)
+        statement = statement.on_conflict_do_update(
+            index_elements=[CatalogCount.table_name, CatalogCount.dimension, CatalogCount.value],
+            set_={"count": CatalogCount.count + statement.excluded["count"]},
+        )
+        db.session.execute(statement, rows)
+        return
+
+    for row in rows:
+        updated = db.session.execute(
+            db.update(CatalogCount)
+            .where(CatalogCount.table_name == row["table_name"], CatalogCount.dimension == row["dimension"],
+                   CatalogCount.value == row["value"])
+            .values(count=CatalogCount.count + row["count"])
+        ).rowcount
+        if not updated:
+            db.session.execute(db.insert(CatalogCount).values(**row))
+
+
+def previous_values(obj):
+    state = db.inspect(obj)
+    values = {}
+    for column in GROUPS[type(obj)]:
+        history = state.attrs[column].history
+        values[column] = history.deleted[0] if history.deleted else getattr(obj, column)
+    return values
+
+
+def current_values(obj):
+    return {column: getattr(obj, column) for column in GROUPS[type(obj)]}
+
+
+@event.listens_for(Session, "before_flush")
+def count_changes(session, flush_context, instances):
+    created = [obj for obj in session.new if type(obj) in GROUPS]
+    deleted = [obj for obj in session.deleted if type(obj) in GROUPS]
+    updated = [obj for obj in session.dirty if type(obj) in GROUPS and session.is_modified(obj)
+               and previous_values(obj) != current_values(obj)]
+    if not created and not deleted and not updated:
+        return
+
+    deltas = defaultdict(int)
+    for obj in created:
+        add_entity(deltas, type(obj), current_values(obj), 1)
+    for obj in deleted + updated:
+        model = type(obj)
+        favorites = favorite_counts(model, [obj.id]).get(obj.id, 0)
+        add_entity(deltas, model, previous_values(obj), -1, favorites)
+        if obj in session.deleted:
+            deltas[favorite_key(model, obj.id)] -= favorites
+        else:
+            add_entity(deltas, model, current_values(obj), 1, favorites)
+    apply(deltas)
+
+
+def count_created(model, rows):
+    """Count row dicts about to be inserted in bulk."""
+    deltas = defaultdict(int)
+    for row in rows:
+        add_entity(deltas, model, row, 1)
+    apply(deltas)
+
+
+def stored_values(model, ids):
+    columns = [getattr(model, column) for column in GROUPS[model]]
+    rows = db.session.execute(db.select(model.id, *columns).where(model.id.in_(ids)))
+    return {row[0]: dict(zip(GROUPS[model], row[1:])) for row in rows}
+
+
+def count_updated(model, rows):
+    """Move the counts of rows about to be updated in bulk; call before the UPDATE."""
+    rows = [row for row in rows if any(column in row for column in GROUPS[model])]
+    if not rows:
+        return
+    ids = [row["id"] for row in rows]
+    previous = stored_values(model, ids)
+    favorites = favorite_counts(model, ids)
+    deltas = defaultdict(int)
+    for row in rows:
+        old = previous.get(row["id"])
+        if old is None:
+            continue
+        new = dict(old, **{column: row[column] for column in GROUPS[model] if column in row})
+        if new != old:
+            add_entity(deltas, model, old, -1, favorites.get(row["id"], 0))
+            add_entity(deltas, model, new, 1, favorites.get(row["id"], 0))
+            # the same id can come twice in a batch
+            previous[row["id"]] = new
+    apply(deltas)
+
+
+def count_deleted(model, ids):
+    """Uncount rows about to be deleted in bulk; call before the DELETE."""
+    if not ids:
+        return
+    favorites = favorite_counts(model, ids)
+    deltas = defaultdict(int)
+    for id, values in stored_values(model, ids).items():
+        add_entity(deltas, model, values, -1, favorites.get(id, 0))
+        deltas[favorite_key(model, id)] -= favorites.get(id, 0)
+    apply(deltas)
+
+
+def count_favorite(model, entity_id, amount):
+    """A favorite of ``entity_id`` was added (1) or removed (-1)."""
+    entity = db.session.get(model, entity_id)
+    deltas = defaultdict(int)
+    deltas[favorite_key(model, entity_id)] += amount
+    if entity is not None:
+        favorite_table = FAVORITES[model][0].__tablename__
+        for column, value in current_values(entity).items():
+            deltas[(favorite_table, column, value)] += amount
+    apply(deltas)
+
+
+def rebuild():
+    """Recompute every counter from the tables."""
+    db.session.execute(db.delete(CatalogCount))
+    deltas = defaultdict(int)
+    for model, columns in GROUPS.items():
+        favorite, key = FAVORITES[model]
+        for column in columns:
+            group = getattr(model, column)
+            for value, count in db.session.execute(db.select(group, db.func.count()).group_by(group)):
+                deltas[(model.__tablename__, column, value)] = count
+            favorites = db.select(group, db.func.count()).select_from(favorite).join(model, key == model.id)
+            for value, count in db.session.execute(favorites.group_by(group)):
+                deltas[(favorite.__tablename__, column, value)] = count
+        per_entity = db.select(key, db.func.count()).select_from(favorite).join(model, key == model.id).group_by(key)
+        for id, count in db.session.execute(per_entity):
+            deltas[favorite_key(model, id)] = count
+    apply(deltas)
+    db.session.commit()
+    return len([amount for amount in deltas.values() if amount])
+
+
+def collection_model(name):
+    model = COLLECTIONS.get(name)
+    if model is None:
+        raise APIException("Unknown collection: " + name, status_code=404)
+    return model
+
+
+def dimensions(model, args):
+    by = args.get("by")
+    if by is None or by == "":
+        return GROUPS[model]
+    columns = [column.strip() for column in by.split(",") if column.strip()]
+    unknown = [column for column in columns if column not in GROUPS[model]]
+    if unknown:
+        raise APIException("The by parameter must be one of: " + ", ".join(GROUPS[model]), status_code=400)
+    return columns
+
+
+def counts(table_name, dimension, limit):
+    rows = db.session.execute(
+        db.select(CatalogCount.value, CatalogCount.count)
+        .where(CatalogCount.table_name == table_name, CatalogCount.dimension == dimension, CatalogCount.count > 0)
+        .order_by(CatalogCount.count.desc(), CatalogCount.value).limit(limit)
+    )
+    return [{"value": value, "count": count} for value, count in rows]
+
+
+def total(table_name, dimension):
+    return db.session.scalar(
+        db.select(db.func.coalesce(db.func.sum(CatalogCount.count), 0))
+        .where(CatalogCount.table_name == table_name, CatalogCount.dimension == dimension, CatalogCount.count > 0)
+    )
+
+
+def catalog_stats(name, args):
+    """Grouped counts of a collection, largest group first."""
+    model = collection_model(name)
+    columns = dimensions(model, args)
+    limit = int_arg(args, "limit", default=DEFAULT_PAGE_SIZE, minimum=1, maximum=MAX_PAGE_SIZE)
+
+    body = {"msg": "ok", "total": total(model.__tablename__, GROUPS[model][0])}
+    for column in columns:
+        body[column] = counts(model.__tablename__, column, limit)
+    return body
+
+
+def favorite_stats(name, args):
+    """Most favorited entities of a collection and its favorites by grouped column."""
+    model = collection_model(name)
+    favorite, key = FAVORITES[model]
+    columns = dimensions(model, args)
+    top = int_arg(args, "top", default=TOP, minimum=1, maximum=MAX_PAGE_SIZE)
+    limit = int_arg(args, "limit", default=DEFAULT_PAGE_SIZE, minimum=1, maximum=MAX_PAGE_SIZE)
+
+    leaders = counts(favorite.__tablename__, key.key, top)
+    names = dict(db.session.execute(
+        db.select(model.id, model.name).where(model.id.in_([int(leader["value"]) for leader in leaders]))
+    ).all()) if leaders else {}
+
+    body = {
+        "msg": "ok",
+        "total": total(favorite.__tablename__, key.key),
+        "top": [{"id": int(leader["value"]), "name": names.get(int(leader["value"])), "count": leader["count"]}
+                for leader in leaders],
+    }
+    for column in columns:
+        body[column] = counts(favorite.__tablename__, column, limit)
+    return body
@@ -0,0 +1,283 @@
+"""
+Server-sent events for favorites: ``GET /favorites/<user_id>/stream``.
+
+Every FavoriteChange row (add, remove, rename) is published once its
+transaction commits and fanned out to the streams the user has open. The
+event id is the document version, so a reconnecting EventSource sends it
+back as Last-Event-ID and gets exactly the changes it missed: from a
+bounded replay buffer kept per user when it still covers them, from the
+FavoriteChange table otherwise.
+
+With FAVORITES_STREAM_BACKEND=shared the events go through the pub/sub of
+the shared store (REDIS_URL) and every worker forwards them to its own
+subscribers; the memory backend only reaches streams of the same process.
+
+A stream holds a thread for as long as it is open: gunicorn.conf.py runs
+gthread workers, so it takes one of GUNICORN_THREADS and the worker keeps
+serving other requests and answering gunicorn's heartbeat. Streams end after
+FAVORITES_STREAM_MAX_AGE seconds or when the token expires, whichever comes
+first, and the browser reconnects on its own.
+"""
+import bisect
+import json
+import os
+import queue
+import threading
+import time
+from collections import OrderedDict
+
+from flask import Response, stream_with_context
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from favorites import changes_since, read_document
+from models import db, FavoriteChange
+from shared_store import get_store
+from utils import APIException
+
+HEARTBEAT = float(os.getenv("FAVORITES_STREAM_HEARTBEAT", 15))
+MAX_AGE = float(os.getenv("FAVORITES_STREAM_MAX_AGE", 300))
+RETRY_MS = int(os.getenv("FAVORITES_STREAM_RETRY_MS", 3000))
+# events kept per user for Last-Event-ID, and users kept (LRU)
+REPLAY_SIZE = int(os.getenv("FAVORITES_STREAM_REPLAY_SIZE", 100))
+REPLAY_USERS = int(os.getenv("FAVORITES_STREAM_REPLAY_USERS", 10000))
+# events a slow client may have pending before its stream is closed
+QUEUE_SIZE = 1000
+
+
+class Subscription:
+    def __init__(self, maxsize):
+        self.queue = queue.Queue(maxsize)
+        self.overflowed = False
+
+
+class Broker:
+    """In-process fan-out of a user's events to their open streams."""
+
+    def __init__(self, replay_size=100, replay_users=10000):
+        self.replay_size = replay_size
+        self.replay_users = replay_users
+        self._subscribers = {}
+        self._replay = OrderedDict()
+        self._lock = threading.Lock()
+
+    def subscribe(self, user_id):
+        subscription = Subscription(QUEUE_SIZE)
+        with self._lock:
+            self._subscribers.setdefault(user_id, set()).add(subscription)
+        return subscription
+
+    def unsubscribe(self, user_id, subscription):
+        with self._lock:
+            subscribers = self._subscribers.get(user_id, set())
+            subscribers.discard(subscription)
+            if not subscribers:
+                self._subscribers.pop(user_id, None)
+
+    def deliver(self, user_id, change):
+        with self._lock:
+            buffer = self._replay.get(user_id)
+            if buffer is None:
+                buffer = self._replay[user_id] = []
+                while len(self._replay) > self.replay_users:
+                    self._replay.popitem(last=False)
+            self._replay.move_to_end(user_id)
+            # with several workers publishing, versions may arrive out of order: keep the buffer sorted
+            position = bisect.bisect_left(buffer, change["version"], key=lambda buffered: buffered["version"])
+            if position == len(buffer) or buffer[position]["version"] != change["version"]:
+                buffer.insert(position, change)
+                if len(buffer) > self.replay_size:
+                    del buffer[0]
+            subscribers = list(self._subscribers.get(user_id, ()))
+
+        for subscription in subscribers:
+            try:
+                subscription.queue.put_nowait(change)
+            except queue.Full:
+                # the client reconnects with Last-Event-ID and catches up
+                subscription.overflowed = True
+
+    def replay(self, user_id, version):
+        """Changes after ``version`` from the buffer, or None if it doesn't reach back that far
+        or misses a version that hasn't been delivered yet."""
+        with self._lock:
+            buffer = self._replay.get(user_id)
+            if not buffer or buffer[0]["version"] > version + 1:
+                return None
+            changes = [change for change in buffer if change["version"] > version]
+        if any(change["version"] != version + 1 + i for i, change in enumerate(changes)):
+            return None
+        return changes
+
+    def subscribers(self):
+        with self._lock:
+            return sum(len(subscribers) for subscribers in self._subscribers.values())
+
+
+class MemoryBackend:
+    def __init__(self, broker):
+        self.broker = broker
+
+    def start(self):
+        pass
+
+    def publish(self, user_id, change):
+        self.broker.deliver(user_id, change)
+
+
+class SharedBackend:
+    prefix = "favorites:"
+
+    def __init__(self, store, broker, reconnect_interval=1.0):
+        self.store = store
+        self.broker = broker
+        self.reconnect_interval = reconnect_interval
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def start(self):
+        """Start this process' listener, once (and again in forked workers)."""
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            threading.Thread(target=self.listen, name="favorites-stream", daemon=True).start()
+
+    def publish(self, user_id, change):
+        self.start()
+        self.store.publish(self.prefix + str(user_id), json.dumps(change))
+
+    def listen(self):
+        while True:
+            pubsub = self.store.pubsub(ignore_subscribe_messages=True)
+            try:
+                pubsub.psubscribe(self.prefix + "*")
+                for message in pubsub.listen():
+                    if message["type"] != "pmessage":
+                        continue
+                    user_id = int(message["channel"][len(self.prefix):])
+                    self.broker.deliver(user_id, json.loads(message["data"]))
+            except Exception:
+                # the changes published meanwhile come back from the table on the next gap
+                time.sleep(self.reconnect_interval)
+            finally:
+                pubsub.close()
+
+
+def create_backend():
+    """Build the broker and its backend from FAVORITES_STREAM_BACKEND (memory|shared)."""
+    broker = Broker(REPLAY_SIZE, REPLAY_USERS)
+    if os.getenv("FAVORITES_STREAM_BACKEND", "memory") == "shared":
+        return SharedBackend(get_store(), broker)
+    return MemoryBackend(broker)
+
+
+backend = create_backend()
+broker = backend.broker
+
+
+@event.listens_for(Session, "after_flush")
+def collect_changes(session, flush_context):
+    changes = [obj.serialize() | {"user_id": obj.user_id} for obj in session.new if isinstance(obj, FavoriteChange)]
+    if changes:
+        session.info.setdefault("favorite_changes", []).extend(changes)
+
+
+@event.listens_for(Session, "after_commit")
+def publish_changes(session):
+    for change in session.info.pop("favorite_changes", ()):
+        user_id = change.pop("user_id")
+        backend.publish(user_id, change)
+
+
+@event.listens_for(Session, "after_rollback")
+def discard_changes(session):
+    session.info.pop("favorite_changes", None)
+
+
+def format_event(name, data, id=None):
+    lines = ["event: " + name]
+    if id is not None:
+        lines.append("id: %s" % id)
+    lines.append("data: " + json.dumps(data))
+    return "\n".join(lines) + "\n\n"
+
+
+def last_event_id(request):
+    """Last-Event-ID sent by a reconnecting EventSource, or ?last_event_id= on the first connect."""
+    value = request.headers.get("Last-Event-ID") or request.args.get("last_event_id")
+    if value is None or value == "":
+        return None
+    try:
+        version = int(value)
+    except ValueError:
+        raise APIException("The Last-Event-ID must be a favorites version", status_code=400)
+    if version < 0:
+        raise APIException("The Last-Event-ID must be a favorites version", status_code=400)
+    return version
+
+
+def missed_changes(user_id, version):
+    changes = broker.replay(user_id, version)
+    if changes is None:
+        changes = changes_since(user_id, version)
+    return changes
+
+
+def stream(user_id, request, expires_at=None):
+    """Response streaming ``user_id``'s favorite changes as text/event-stream."""
+    version = last_event_id(request)
+    backend.start()
+    # subscribe before reading so nothing committed in between is lost
+    subscription = broker.subscribe(user_id)
+    try:
+        if version is None:
+            current = read_document(user_id).version
+            backlog = []
+        else:
+            backlog = missed_changes(user_id, version)
+    except Exception:
+        broker.unsubscribe(user_id, subscription)
+        raise
+    # don't hold a pooled connection for the life of the stream
+    db.session.close()
+
+    deadline = time.time() + MAX_AGE
+    if expires_at is not None:
+        deadline = min(deadline, expires_at)
+
+    def generate():
+        try:
+            yield "retry: %d\n\n" % RETRY_MS
+            if version is None:
+                sent = current
+                yield format_event("ready", {"version": current}, id=current)
+            else:
+                sent = version
+            pending = backlog
+            while True:
+                for change in pending:
+                    if change["version"] > sent:
+                        sent = change["version"]
+                        yield format_event(change["action"], change, id=sent)
+
+                remaining = deadline - time.time()
+                if remaining <= 0 or subscription.overflowed:
+                    return
+                try:
+                    change = subscription.queue.get(timeout=min(HEARTBEAT, remaining))
+                except queue.Empty:
+                    yield ": keepalive\n\n"
+                    pending = []
+                    continue
+                if change["version"] > sent + 1:
+                    # an event went missing (publish failed, listener reconnecting): fill the gap
+                    pending = changes_since(user_id, sent) + [change]
+                    db.session.close()
+                else:
+                    pending = [change]
+        finally:
+            broker.unsubscribe(user_id, subscription)
+
+    return Response(stream_with_context(generate()), mimetype="text/event-stream",
+                    headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
@@ -0,0 +1,132 @@
+"""
+Delta sync for the catalog: ``GET /sync?since=<token>``.
+
+Every insert, update or delete of a People, Planets or Vehicles row takes
+the next number of a single catalog-wide sequence (the CatalogSequence
+row). Live rows keep the number of their last change in ``change_seq``,
+next to ``updated_at``; deleted rows leave a CatalogTombstone with theirs.
+Both columns are indexed, so a sync reads only what changed after the
+client's token.
+
+The UPDATE that hands out numbers keeps the sequence row locked until the
+transaction commits, so numbers become visible in the order they were
+taken and a client can never skip a change that commits late. The price is
+that catalog writes are serialized, which they already are on SQLite.
+
+ORM changes are stamped from a before_flush hook. The bulk endpoints write
+through executemany statements that skip it and stamp their rows
+themselves (stamp / tombstones below).
+
+Responses are paged by sequence number: ``next`` is the token for the
+following call and ``has_more`` says whether to make it right away. Within
+a page, apply ``deleted`` before ``updated``: an id freed by a delete can
+come back as a new row.
+"""
+from datetime import datetime, timezone
+
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from models import db, People, Planets, Vehicles, CatalogSequence, CatalogTombstone
+from serializers import row_columns, serialize_rows
+from utils import int_arg, DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE
+
+TRACKED = {People: "people", Planets: "planets", Vehicles: "vehicles"}
+MODELS = {name: model for model, name in TRACKED.items()}
+
+
+def utcnow():
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+def allocate(connection, count):
+    """Reserve ``count`` consecutive sequence numbers on ``connection``."""
+    table = CatalogSequence.__table__
+    bump = table.update().where(table.c.id == 1).values(value=table.c.value + count)
+    if connection.dialect.update_returning:
+        last = connection.execute(bump.returning(table.c.value)).scalar()
+    elif connection.execute(bump).rowcount:
+        last = connection.execute(db.select(table.c.value).where(table.c.id == 1)).scalar()
+    else:
+        last = None
+    if last is None:
+        # databases created with db.create_all() start without the row
+        connection.execute(table.insert().values(id=1, value=count))
+        last = count
+    return range(last - count + 1, last + 1)
+
+
+@event.listens_for(Session, "before_flush")
+def stamp_changes(session, flush_context, instances):
+    changed = [obj for obj in session.new if type(obj) in TRACKED]
+    changed += [obj for obj in session.dirty if type(obj) in TRACKED and session.is_modified(obj)]
+    deleted = [obj for obj in session.deleted if type(obj) in TRACKED]
+    if not changed and not deleted:
+        return
+
+    numbers = iter(allocate(session.connection(), len(changed) + len(deleted)))
+    now = utcnow()
+    for obj in changed:
+        obj.change_seq = next(numbers)
+        obj.updated_at = now
+    for obj in deleted:
+        session.add(CatalogTombstone(table_name=TRACKED[type(obj)], entity_id=db.inspect(obj).identity[0],
+                                     change_seq=next(numbers), deleted_at=now))
+
+
+def stamp(rows):
+    """Add change_seq/updated_at to row dicts about to be inserted or updated in bulk."""
+    now = utcnow()
+    for row, number in zip(rows, allocate(db.session.connection(), len(rows))):
+        row["change_seq"] = number
+        row["updated_at"] = now
+    return rows
+
+
+def tombstones(model, ids):
+    """Record the bulk deletion of ``ids``."""
+    if not ids:
+        return
+    now = utcnow()
+    rows = [{"table_name": TRACKED[model], "entity_id": id, "change_seq": number, "deleted_at": now}
+            for id, number in zip(ids, allocate(db.session.connection(), len(ids)))]
+    db.session.execute(db.insert(CatalogTombstone), rows)
+
+
+def sync(args):
+    since = int_arg(args, "since", default=0, minimum=0)
+    limit = int_arg(args, "limit", default=DEFAULT_PAGE_SIZE, minimum=1, maximum=MAX_PAGE_SIZE)
+
+    # the first ``limit`` changes of each source, merged by sequence number
+    changes = []
+    for model in TRACKED:
+        names, columns = row_columns(model)
+        rows = db.session.execute(
+            db.select(model.change_seq, *columns)
+            .where(model.change_seq > since).order_by(model.change_seq).limit(limit)
+        ).all()
+        changes += [(row[0], model, row[1:]) for row in rows]
+    deleted = db.session.execute(
+        db.select(CatalogTombstone.change_seq, CatalogTombstone.table_name, CatalogTombstone.entity_id)
+        .where(CatalogTombstone.change_seq > since).order_by(CatalogTombstone.change_seq).limit(limit)
+    ).all()
+    changes += [(number, None, (name, id)) for number, name, id in deleted]
+
+    changes.sort(key=lambda change: change[0])
+    page = changes[:limit]
+
+    body = {name: {"updated": [], "deleted": []} for name in MODELS}
+    for number, model, row in page:
+        if model is None:
+            body[row[0]]["deleted"].append(row[1])
+        else:
+            body[TRACKED[model]]["updated"].append(row)
+    for model, name in TRACKED.items():
+        body[name]["updated"] = serialize_rows(row_columns(model)[0], body[name]["updated"])
+
+    body.update({
+        "msg": "ok",
+        "next": str(page[-1][0] if page else since),
+        "has_more": len(changes) > limit,
+    })
+    return body
@@ -1,20 +1,182 @@
-from flask import jsonify, url_for
+import math
+import operator
+import os
+from functools import wraps
+from flask import jsonify, url_for, request
 
 class APIException(Exception):
     status_code = 400
 
-    def __init__(self, message, status_code=None, payload=None):
+    def __init__(self, message, status_code=None, payload=None, headers=None):
         Exception.__init__(self)
         self.message = message
         if status_code is not None:
             self.status_code = status_code
         self.payload = payload
+        self.headers = headers or {}
 
     def to_dict(self):
         rv = dict(self.payload or ())
         rv['message'] = self.message
         return rv
 
+def internal_only(view):
+    """Only answer requests coming from INTERNAL_ALLOWED_IPS (comma separated)."""
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        allowed = os.getenv("INTERNAL_ALLOWED_IPS", "127.0.0.1").split(",")
+        if request.remote_addr not in [ip.strip() for ip in allowed]:
+            raise APIException("Not found", status_code=404)
+        return view(*args, **kwargs)
+    return wrapper
+
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+
+def int_arg(args, name, default=None, minimum=None, maximum=None):
+    value = args.get(name)
+    if value is None or value == "":
+        return default
+    try:
+        value = int(value)
+    except ValueError:
+        raise APIException("The " + name + " parameter must be an integer", status_code=400)
+    if minimum is not None and value < minimum:
+        raise APIException("The " + name + " parameter must be at least " + str(minimum), status_code=400)
+    if maximum is not None and value > maximum:
+        value = maximum
+    return value
+
+UNKNOWN_VALUES = ("unknown", "n/a", "none", "indefinite", "")
+
+def parse_number(value, integer=False):
+    """Parse a numeric catalog value: a number, a numeric string such as
+    "1,000,000", or one of UNKNOWN_VALUES which becomes None. Anything else
+    raises ValueError."""
+    if value is None:
+        return None
+    if isinstance(value, bool):
+        raise ValueError(value)
+    if isinstance(value, str):
+        text = value.strip().lower().replace(",", "")
+        if text in UNKNOWN_VALUES:
+            return None
+        value = float(text)
+    if not math.isfinite(value):
+        raise ValueError(value)
+    return int(value) if integer else float(value)
+
+def numeric_fields(model):
+    """Map the numeric columns of ``model`` (besides keys) to whether they hold integers."""
+    return {
+        column.name: column.type.python_type is int
+        for column in model.__table__.columns
+        if not column.primary_key and not column.foreign_keys and column.type.python_type in (int, float)
+    }
+
+def number_field(body, name, integer=False):
+    try:
+        return parse_number(body[name], integer)
+    except (TypeError, ValueError):
+        raise APIException("The " + name + " field must be a number or \"unknown\"", status_code=400)
+
+def number_arg(args, name, integer=False):
+    value = args.get(name)
+    if value is None or value == "":
+        return None
+    try:
+        return int(value) if integer else float(value)
+    except ValueError:
+        raise APIException("The " + name + " parameter must be a number", status_code=400)
+
+STREAM_BATCH_SIZE = 1000
+
+RANGE_OPERATORS = {"gt": operator.gt, "gte": operator.ge, "lt": operator.lt, "lte": operator.le}
+
+def apply_filters(query, model, args, filters=(), ranges=()):
+    """``filters`` are matched by equality, ``ranges`` through <name>_gt, _gte, _lt and _lte."""
+    for name in filters:
+        value = args.get(name)
+        if value is not None:
+            query = query.filter(getattr(model, name) == value)
+    integers = numeric_fields(model)
+    for name in ranges:
+        for suffix, compare in RANGE_OPERATORS.items():
+            value = number_arg(args, name + "_" + suffix, integers[name])
+            if value is not None:
+                query = query.filter(compare(getattr(model, name), value))
+    return query
+
+def sort_arg(args, sorts):
+    """``sort=name`` or ``sort=-name`` for descending; returns (name, descending) or (None, False)."""
+    sort = args.get("sort")
+    if not sort or sort == "id":
+        return None, False
+    name = sort[1:] if sort.startswith("-") else sort
+    if name not in sorts:
+        raise APIException("The sort parameter must be one of: " + ", ".join(("id",) + tuple(sorts)), status_code=400)
+    return name, sort.startswith("-")
+
+def encode_cursor(value, id):
+    return ("null" if value is None else repr(value)) + ":" + str(id)
+
+def decode_cursor(cursor, integer):
+    value, _, id = cursor.rpartition(":")
+    try:
+        return None if value == "null" else parse_number(value, integer), int(id)
+    except ValueError:
+        raise APIException("The cursor parameter is not valid", status_code=400)
+
+def keyset_query(query, model, args, filters=(), ranges=()):
+    """Limit ``query`` (a Query or a select()) to one keyset page.
+
+    Pages are walked with ``id > cursor`` instead of OFFSET so every page costs
+    the same no matter how deep the client is. ``filters`` are the column names
+    that may be matched by equality from the query string and ``ranges`` the
+    numeric ones that may be filtered by range or sorted on with
+    ``sort=[-]name``; sorted pages seek on (value, id), with unknown (NULL)
+    values last in both directions. One extra row is fetched to tell whether
+    there is a next page; see split_page, which takes the returned sort too.
+    """
+    limit = int_arg(args, "limit", DEFAULT_PAGE_SIZE, minimum=1, maximum=MAX_PAGE_SIZE)
+    sort, descending = sort_arg(args, ranges)
+    query = apply_filters(query, model, args, filters, ranges)
+
+    if sort is None:
+        cursor = int_arg(args, "cursor", minimum=0)
+        if cursor is not None:
+            query = query.filter(model.id > cursor)
+        return query.order_by(model.id).limit(limit + 1), limit, None
+
+    column = getattr(model, sort)
+    after = operator.lt if descending else operator.gt
+    if args.get("cursor"):
+        value, id = decode_cursor(args["cursor"], numeric_fields(model)[sort])
+        if value is None:
+            query = query.filter(column.is_(None), after(model.id, id))
+        else:
+            query = query.filter(after(column, value) | ((column == value) & after(model.id, id)) | column.is_(None))
+
+    if descending:
+        order = (column.desc().nulls_last(), model.id.desc())
+    else:
+        order = (column.asc().nulls_last(), model.id.asc())
+    return query.order_by(*order).limit(limit + 1), limit, sort
+
+def split_page(items, limit, sort=None):
+    next_cursor = None
+    if len(items) > limit:
+        items = items[:limit]
+        last = items[-1]
+        next_cursor = str(last.id) if sort is None else encode_cursor(getattr(last, sort), last.id)
+
+    return items, next_cursor
+
+def keyset_page(query, model, args, filters=(), ranges=()):
+    """Return one page of ``query`` plus the cursor of the next page."""
+    query, limit, sort = keyset_query(query, model, args, filters, ranges)
+    return split_page(query.all(), limit, sort)
+
 def has_no_empty_params(rule):
     defaults = rule.defaults if rule.defaults is not None else ()
     arguments = rule.arguments if rule.arguments is not None else ()
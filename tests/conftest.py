@@ -0,0 +1,65 @@
+import os
+import sys
+
+import pytest
+from sqlalchemy import event
+
+# la app lee su configuración al importarse
+os.environ["DATABASE_URL"] = "sqlite:///:memory:"
+os.environ.setdefault("FLASK_APP_KEY", "test")
+os.environ.setdefault("RATE_LIMIT_ENABLED", "0")
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(__file__)), "src"))
+
+from app import app as flask_app  # noqa: E402
+from models import db, User, People, Planets, Vehicles  # noqa: E402
+import passwords  # noqa: E402
+
+
+@pytest.fixture
+def app():
+    with flask_app.app_context():
+        db.create_all()
+        yield flask_app
+        db.session.remove()
+        db.drop_all()
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+
+@pytest.fixture
+def statements(app):
+    """SQL statements sent to the database while the test runs."""
+    executed = []
+
+    def collect(conn, cursor, statement, parameters, context, executemany):
+        executed.append(statement)
+
+    event.listen(db.engine, "before_cursor_execute", collect)
+    yield executed
+    event.remove(db.engine, "before_cursor_execute", collect)
+
+
+def create_user(email="luke@example.com", password="secret"):
+    user = User(name="Luke", email=email, password=passwords._hash(password, 4), is_active=True)
+    db.session.add(user)
+    db.session.commit()
+    return user
+
+
+def create_catalog(count):
+    for i in range(count):
+        db.session.add(People(name="person %d" % i, height=1.72, birthdate="19BBY", gender="male",
+                              eyes="blue", skin="fair"))
+        db.session.add(Planets(name="planet %d" % i, gravity="1", terrain="desert", climate="arid",
+                               orbital_period="304", population="200000", diameter="10465"))
+        db.session.add(Vehicles(name="vehicle %d" % i, model="T-16", length="10", max_speed="1200",
+                                cargo_capacity="50", manufacturer="Incom"))
+    db.session.commit()
+
+
+def login(client, email="luke@example.com", password="secret"):
+    response = client.post("/login", json={"email": email, "password": password})
+    return {"Authorization": "Bearer " + response.get_json()["token"]}
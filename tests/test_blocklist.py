@@ -0,0 +1,56 @@
+import time
+
+from blocklist import MemoryBackend, RevocationCache, SharedBackend
+from shared_store import LocalStore
+
+from conftest import create_user, login
+
+
+def lookups():
+    seen = []
+    return seen, seen.append
+
+
+def test_revoked_tokens_are_shared_between_workers():
+    store = LocalStore()
+    first = RevocationCache(SharedBackend(store), lambda jti: False)
+    # the second worker's database answer is stale, the shared store wins
+    second = RevocationCache(SharedBackend(store), lambda jti: False)
+
+    first.revoke("jti-1", time.time() + 60)
+
+    assert second.is_revoked("jti-1", time.time() + 60)
+    assert not second.is_revoked("jti-2", time.time() + 60)
+
+
+def test_revocations_expire_with_the_token(monkeypatch):
+    store = LocalStore()
+    cache = RevocationCache(SharedBackend(store), lambda jti: False)
+    now = time.time()
+    cache.revoke("jti-1", now + 10)
+    assert cache.is_revoked("jti-1")
+
+    monkeypatch.setattr(time, "time", lambda: now + 11)
+    assert not store.exists("blocklist:jti-1")
+
+
+def test_valid_tokens_are_cached_for_negative_ttl():
+    seen, on_lookup = lookups()
+    cache = RevocationCache(MemoryBackend(10), lambda jti: False, negative_ttl=30, on_lookup=on_lookup)
+
+    assert not cache.is_revoked("jti-1", time.time() + 60)
+    assert not cache.is_revoked("jti-1", time.time() + 60)
+    assert seen == ["db_valid", "cache_valid"]
+
+    cache.revoke("jti-1", time.time() + 60)
+    assert cache.is_revoked("jti-1")
+    assert seen[-1] == "cache_revoked"
+
+
+def test_logout_revokes_the_token(app, client):
+    create_user()
+    headers = login(client)
+
+    assert client.post("/logout", headers=headers).status_code == 200
+    response = client.get("/favorites/1", headers=headers)
+    assert response.status_code == 401
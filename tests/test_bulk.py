@@ -0,0 +1,75 @@
+from favorites import read_document
+from models import db, FavoriteChange, FavoritePeople, People
+
+from conftest import create_user, create_catalog
+
+
+def favorite_all_people(count):
+    user_id = create_user().id
+    for people_id in range(1, count + 1):
+        db.session.add(FavoritePeople(user_id=user_id, people_id=people_id))
+    db.session.commit()
+    read_document(user_id)
+    return user_id
+
+
+def favorite_lookups(statements):
+    return [statement for statement in statements if "FROM favorite_people" in statement]
+
+
+def test_bulk_update_renames_in_one_lookup(app, client, statements):
+    create_catalog(50)
+    user_id = favorite_all_people(50)
+
+    statements.clear()
+    rows = [{"id": id, "name": "renamed %d" % id} for id in range(1, 51)]
+    response = client.put("/people/bulk", json=rows)
+    assert response.status_code == 200
+    assert len(favorite_lookups(statements)) == 1
+
+    db.session.expire_all()
+    document = read_document(user_id)
+    assert [entry["name"] for entry in document.favorites] == ["renamed %d" % id for id in range(1, 51)]
+    assert document.version == 50
+
+
+def test_bulk_update_skips_unchanged_names(app, client, statements):
+    create_catalog(20)
+    user_id = favorite_all_people(20)
+
+    statements.clear()
+    rows = [{"id": id, "name": "person %d" % (id - 1), "eyes": "green"} for id in range(1, 21)]
+    assert client.put("/people/bulk", json=rows).status_code == 200
+    assert favorite_lookups(statements) == []
+    assert db.session.scalar(db.select(db.func.count()).select_from(FavoriteChange)
+                             .where(FavoriteChange.user_id == user_id)) == 0
+
+
+def test_bulk_create_inserts_a_chunk_in_one_statement(app, client, statements):
+    rows = [{"name": "person %d" % i, "birthdate": "19BBY", "gender": "male", "eyes": "blue", "skin": "fair",
+             "height": 1.72} for i in range(100)]
+    statements.clear()
+    response = client.post("/people/bulk", json=rows)
+    assert response.status_code == 201
+    assert len([statement for statement in statements if statement.startswith("INSERT INTO people")]) == 1
+
+    for result in response.get_json()["results"]:
+        assert db.session.get(People, result["id"]).name == "person %d" % result["index"]
+
+
+def test_bulk_rejects_values_the_columns_cant_hold(app, client):
+    create_catalog(2)
+    rows = [{"name": "person %d" % i, "birthdate": "19BBY", "gender": "male", "eyes": "blue", "skin": "fair",
+             "height": 1.72} for i in range(3)]
+    rows[1]["name"] = None
+    rows[2]["gender"] = 7
+    response = client.post("/people/bulk", json=rows)
+    assert response.status_code == 400
+    assert [error["index"] for error in response.get_json()["errors"]] == [1, 2]
+
+    response = client.put("/people/bulk", json=[{"id": 1, "name": "renamed"}, {"id": 2, "height": "unknown"}])
+    assert response.status_code == 400
+    assert response.get_json()["errors"] == [{"index": 1, "message": "The height field can't be null"}]
+    db.session.expire_all()
+    assert db.session.get(People, 1).name == "person 0"
+    assert db.session.scalar(db.select(db.func.count()).select_from(People)) == 2
@@ -0,0 +1,51 @@
+from models import db, FavoritePeople, FavoritePlanet, FavoriteVehicle, load_favorites
+
+from conftest import create_user, create_catalog, login
+
+
+def add_favorites(user_id, count):
+    """``count`` favorites spread over people, planets and vehicles."""
+    for i in range(count):
+        if i % 3 == 0:
+            db.session.add(FavoritePeople(user_id=user_id, people_id=i // 3 + 1))
+        elif i % 3 == 1:
+            db.session.add(FavoritePlanet(user_id=user_id, planet_id=i // 3 + 1))
+        else:
+            db.session.add(FavoriteVehicle(user_id=user_id, vehicle_id=i // 3 + 1))
+    db.session.commit()
+
+
+def count_load_favorites(statements, user_id):
+    db.session.expire_all()
+    statements.clear()
+    favorites = load_favorites(user_id)
+    return sum(len(items) for items in favorites), len(statements)
+
+
+def test_load_favorites_query_count_does_not_grow(app, statements):
+    create_catalog(20)
+    few = create_user("few@example.com").id
+    many = create_user("many@example.com").id
+    add_favorites(few, 6)
+    add_favorites(many, 60)
+
+    assert count_load_favorites(statements, few) == (6, 3)
+    assert count_load_favorites(statements, many) == (60, 3)
+
+
+def test_get_favorites_query_count_does_not_grow(app, client, statements):
+    create_catalog(20)
+    counts = {}
+    for email, favorites in (("few@example.com", 6), ("many@example.com", 60)):
+        user_id = create_user(email).id
+        add_favorites(user_id, favorites)
+        headers = login(client, email)
+
+        db.session.remove()
+        statements.clear()
+        response = client.get("/favorites/%d" % user_id, headers=headers)
+        assert response.status_code == 200
+        assert len(response.get_json()["all_favorites"]) == favorites
+        counts[favorites] = len(statements)
+
+    assert counts[6] == counts[60]
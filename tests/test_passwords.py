@@ -0,0 +1,49 @@
+import threading
+import time
+
+from passwords import PasswordPool, _check, _hash
+from utils import APIException
+
+
+def run_together(pool, count, seconds):
+    """Start ``count`` calls that each take ``seconds``; returns their results or status codes."""
+    results = []
+    lock = threading.Lock()
+
+    def call():
+        try:
+            result = pool.run(time.sleep, seconds) or "ok"
+        except APIException as error:
+            result = error.status_code
+        with lock:
+            results.append(result)
+
+    threads = [threading.Thread(target=call) for _ in range(count)]
+    for thread in threads:
+        thread.start()
+        time.sleep(0.01)
+    for thread in threads:
+        thread.join()
+    return sorted(results, key=str)
+
+
+def test_callers_wait_for_a_turn(tmp_path):
+    pool = PasswordPool(0, 1, 4, timeout=10, queue_timeout=5, slot_dir=str(tmp_path))
+    assert run_together(pool, 4, 0.05) == ["ok"] * 4
+
+
+def test_full_queue_is_turned_away(tmp_path):
+    pool = PasswordPool(0, 1, 1, timeout=10, queue_timeout=5, slot_dir=str(tmp_path))
+    assert run_together(pool, 3, 0.2) == [503, "ok", "ok"]
+
+
+def test_wait_times_out(tmp_path):
+    pool = PasswordPool(0, 1, 2, timeout=10, queue_timeout=0.1, slot_dir=str(tmp_path))
+    assert run_together(pool, 2, 0.5) == [503, "ok"]
+
+
+def test_hashes_in_the_process_pool(tmp_path):
+    pool = PasswordPool(1, 1, 1, timeout=10, slot_dir=str(tmp_path))
+    hashed = pool.run(_hash, "secret", 4)
+    assert pool.run(_check, hashed, "secret")
+    assert not pool.run(_check, hashed, "wrong")
@@ -0,0 +1,99 @@
+import pytest
+from werkzeug.middleware.proxy_fix import ProxyFix
+from werkzeug.test import EnvironBuilder
+
+from rate_limit import Limit, MemoryBackend, RateLimiter, SharedBackend, client_identity
+from shared_store import LocalStore
+
+from conftest import create_user, login
+
+
+class Clock:
+    def __init__(self, now=1000.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+BACKENDS = [lambda: MemoryBackend(), lambda: SharedBackend(LocalStore())]
+
+
+def test_parse():
+    assert Limit.parse("10/minute").window == 60
+    assert Limit.parse("5/30s").policy() == "5;w=30"
+    with pytest.raises(ValueError):
+        Limit.parse("5/fortnight")
+
+
+@pytest.mark.parametrize("backend", BACKENDS)
+def test_rejects_over_the_limit(backend):
+    clock = Clock()
+    limiter = RateLimiter(backend(), clock)
+    limit = Limit.parse("3/minute")
+
+    decisions = [limiter.hit("login:ip:1.2.3.4", limit) for _ in range(4)]
+    assert [decision.allowed for decision in decisions] == [True, True, True, False]
+    assert decisions[2].remaining == 0
+    assert decisions[3].headers()["Retry-After"] == str(decisions[3].retry_after)
+
+    # other clients have their own quota
+    assert limiter.hit("login:ip:5.6.7.8", limit).allowed
+
+
+@pytest.mark.parametrize("backend", BACKENDS)
+def test_previous_window_fades(backend):
+    clock = Clock(1200.0)
+    limiter = RateLimiter(backend(), clock)
+    limit = Limit.parse("2/minute")
+    for _ in range(2):
+        limiter.hit("key", limit)
+
+    # halfway through the next window half the old hits still count
+    clock.now += 90
+    assert limiter.hit("key", limit).allowed
+    assert not limiter.hit("key", limit).allowed
+    clock.now += 30
+    assert limiter.hit("key", limit).allowed
+
+
+def test_shared_backend_is_one_quota_for_every_worker():
+    store = LocalStore()
+    clock = Clock()
+    workers = [RateLimiter(SharedBackend(store), clock) for _ in range(2)]
+    limit = Limit.parse("2/minute")
+
+    assert workers[0].hit("key", limit).allowed
+    assert workers[1].hit("key", limit).allowed
+    assert not workers[0].hit("key", limit).allowed
+
+
+def proxied_identity(app, hops, remote_addr, forwarded_for):
+    """client_identity() for a request that went through ProxyFix(x_for=hops)."""
+    seen = {}
+
+    def capture(environ, start_response):
+        seen.update(environ)
+        return []
+
+    environ = EnvironBuilder(path="/people", headers={"X-Forwarded-For": forwarded_for},
+                             environ_base={"REMOTE_ADDR": remote_addr}).get_environ()
+    ProxyFix(capture, x_for=hops)(environ, lambda *args: None)
+    with app.request_context(seen):
+        return client_identity()
+
+
+def test_identity_uses_the_forwarded_client_behind_trusted_proxies(app):
+    assert proxied_identity(app, 1, "10.0.0.1", "203.0.113.7") == "ip:203.0.113.7"
+    # a spoofed first hop is ignored, only the trusted proxies' entries count
+    assert proxied_identity(app, 1, "10.0.0.1", "1.1.1.1, 203.0.113.7") == "ip:203.0.113.7"
+    assert proxied_identity(app, 2, "10.0.0.1", "1.1.1.1, 203.0.113.7") == "ip:1.1.1.1"
+
+
+def test_identity_prefers_the_token(app, client):
+    user = create_user()
+    headers = login(client)
+    with app.test_request_context("/people", headers=headers, environ_base={"REMOTE_ADDR": "10.0.0.1"}):
+        assert client_identity() == "user:%s" % user.id
+    with app.test_request_context("/people", environ_base={"REMOTE_ADDR": "10.0.0.1"}):
+        assert client_identity() == "ip:10.0.0.1"
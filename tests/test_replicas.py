@@ -0,0 +1,88 @@
+import pytest
+from sqlalchemy import create_engine
+
+import replicas
+import response_cache
+from favorites import read_document
+from models import db, FavoritePeople, People, User
+from replicas import ReplicaSet
+from response_cache import response_cache as cache
+
+from conftest import create_catalog, create_user, login
+
+
+@pytest.fixture
+def replica(app, monkeypatch):
+    """A replica that lags: a separate database holding an old copy of the catalog."""
+    engine = create_engine("sqlite://")
+    db.metadata.create_all(engine)
+    db.engines["replica0"] = engine
+    monkeypatch.setattr(replicas, "replicas", ReplicaSet(["replica0"]))
+    cache.clear()
+    yield engine
+    db.session.remove()
+    cache.clear()
+    del db.engines["replica0"]
+    engine.dispose()
+
+
+def add_person(engine, name):
+    with engine.begin() as connection:
+        connection.execute(db.insert(People).values(name=name, height=1.72, birthdate="19BBY", gender="male",
+                                                    eyes="blue", skin="fair"))
+
+
+def test_reads_go_to_the_replica(replica, client, monkeypatch):
+    monkeypatch.setattr(response_cache, "MAX_LAG", 0)
+    create_catalog(1)
+    add_person(replica, "stale person")
+
+    assert client.get("/people/1").get_json()["name"] == "stale person"
+
+
+def test_falls_back_to_the_primary(app, client, monkeypatch):
+    engine = create_engine("sqlite:////nonexistent/replica.db")
+    db.engines["replica0"] = engine
+    monkeypatch.setattr(replicas, "replicas", ReplicaSet(["replica0"]))
+    create_catalog(1)
+    try:
+        assert client.post("/people-with-post", json={"id": 1}).status_code == 200
+        assert replicas.replicas.status() == {"replica0": "down"}
+    finally:
+        del db.engines["replica0"]
+
+
+def test_cache_is_not_refilled_from_a_lagging_replica(replica, client):
+    add_person(replica, "person 0")
+    create_catalog(1)
+    db.session.remove()
+
+    # the write just invalidated "people": the refill reads the primary
+    db.session.get(People, 1).name = "renamed"
+    db.session.commit()
+    first = client.get("/people/1")
+    assert first.get_json()["name"] == "renamed"
+    assert first.headers["X-Cache"] == "MISS"
+
+    second = client.get("/people/1")
+    assert second.get_json()["name"] == "renamed"
+    assert second.headers["X-Cache"] == "HIT"
+
+
+def test_favorites_document_missing_on_the_replica(replica, client):
+    create_catalog(1)
+    user = create_user()
+    user_id = user.id
+    db.session.add(FavoritePeople(user_id=user_id, people_id=1))
+    db.session.commit()
+    read_document(user_id)
+    headers = login(client)
+    # the replica has the user but not the document materialized on the primary yet
+    with replica.begin() as connection:
+        connection.execute(db.insert(User).values(id=user_id, name="Luke", email="luke@example.com",
+                                                  password="x", is_active=True))
+    db.session.remove()
+
+    response = client.get("/favorites/%d" % user_id, headers=headers)
+    assert response.status_code == 200
+    assert [entry["id"] for entry in response.get_json()["all_favorites"]] == [1]
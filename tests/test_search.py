@@ -0,0 +1,87 @@
+import threading
+
+import pytest
+
+import search
+from models import db, People
+from search import NameIndex
+
+from conftest import create_catalog
+
+
+@pytest.fixture
+def index(app, monkeypatch):
+    index = NameIndex(ttl=300)
+    monkeypatch.setattr(search, "name_index", index)
+    return index
+
+
+def found(client, query):
+    return [(result["url"], result["id"]) for result in client.get("/search?q=" + query).get_json()["results"]]
+
+
+def test_bulk_writes_patch_the_index(index, client, monkeypatch):
+    create_catalog(3)
+    assert found(client, "person") == [("/people", 1), ("/people", 2), ("/people", 3)]
+    monkeypatch.setattr(index, "build", lambda: pytest.fail("the index was rebuilt"))
+
+    assert client.post("/people/bulk", json=[{"name": "Leia Organa", "birthdate": "19BBY", "gender": "female",
+                                              "eyes": "brown", "skin": "light", "height": 1.5}]).status_code == 201
+    assert client.put("/people/bulk", json=[{"id": 1, "name": "Luke Skywalker"}]).status_code == 200
+    assert client.delete("/people/bulk", json=[{"id": 2}]).status_code == 200
+
+    assert found(client, "person") == [("/people", 3)]
+    assert found(client, "leia") == [("/people", 4)]
+    assert found(client, "sky") == [("/people", 1)]
+
+
+def test_expired_index_is_served_while_rebuilding(index, client, monkeypatch):
+    create_catalog(1)
+    assert found(client, "person") == [("/people", 1)]
+
+    # a write the session events didn't see, like another worker's
+    with db.engine.begin() as connection:
+        connection.execute(db.update(People).where(People.id == 1).values(name="Han Solo"))
+    started, release = threading.Event(), threading.Event()
+    build = index.build
+
+    def slow_build():
+        started.set()
+        release.wait(5)
+        build()
+
+    monkeypatch.setattr(index, "build", slow_build)
+    index.built_at -= index.ttl
+
+    assert found(client, "person") == [("/people", 1)]
+    assert started.wait(5)
+    release.set()
+    for thread in threading.enumerate():
+        if thread.name == "search-index":
+            thread.join(5)
+    assert found(client, "han") == [("/people", 1)]
+    assert found(client, "person") == []
+
+
+def test_commits_during_a_build_are_kept(index, app):
+    create_catalog(2)
+    reading = threading.Event()
+    select = db.session.execute
+
+    def execute(*args, **kwargs):
+        rows = select(*args, **kwargs).all()
+        if not reading.is_set():
+            reading.set()
+            # a commit right after the build read people
+            db.session.get(People, 2).name = "Lando Calrissian"
+            db.session.commit()
+        return rows
+
+    index.built_at = 0
+    db.session.execute = execute
+    try:
+        index.build()
+    finally:
+        del db.session.execute
+
+    assert [result[1:3] for result in index.search("lando", 10)] == [("/people", 2)]
@@ -0,0 +1,33 @@
+from streams import Broker
+
+
+def change(version):
+    return {"version": version, "action": "add", "url": "/people", "id": version}
+
+
+def test_replay_keeps_versions_in_order():
+    broker = Broker(replay_size=10)
+    for version in (1, 3, 2, 3):
+        broker.deliver(7, change(version))
+
+    assert [item["version"] for item in broker.replay(7, 0)] == [1, 2, 3]
+    assert [item["version"] for item in broker.replay(7, 1)] == [2, 3]
+
+
+def test_replay_gives_up_on_a_missing_version():
+    broker = Broker(replay_size=10)
+    for version in (1, 3):
+        broker.deliver(7, change(version))
+
+    # version 2 is still on its way: the stream falls back to the table
+    assert broker.replay(7, 0) is None
+    assert [item["version"] for item in broker.replay(7, 2)] == [3]
+
+
+def test_replay_is_bounded():
+    broker = Broker(replay_size=3)
+    for version in (5, 1, 2, 3, 4):
+        broker.deliver(7, change(version))
+
+    assert broker.replay(7, 1) is None
+    assert [item["version"] for item in broker.replay(7, 2)] == [3, 4, 5]